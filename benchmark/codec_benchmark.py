@@ -0,0 +1,70 @@
+# This microbenchmark compares the JSON codecs available to the service
+# (see dxldomaintoolsservice.codec) when decoding and encoding the example
+# response payloads from the service schema.
+#
+# A large synthetic Iris payload (the example result repeated many times) is
+# also included, as large Iris responses dominate the cost of JSON handling.
+#
+# Usage: python benchmark/codec_benchmark.py [iterations]
+
+from __future__ import absolute_import
+from __future__ import print_function
+import copy
+import os
+import sys
+import timeit
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/..")
+from dxldomaintoolsservice.app import DomainToolsService
+from dxldomaintoolsservice.codec import CODECS
+from dxldomaintoolsservice.validation import SCHEMA_FILE
+
+# The number of times the example Iris result is repeated in the large payload
+LARGE_IRIS_RESULTS = 1000
+
+
+def load_payloads():
+    """
+    Returns the example response payloads from the service schema
+    """
+    with open(SCHEMA_FILE) as schema_stream:
+        schema = yaml.safe_load(schema_stream)
+    prefix = DomainToolsService.SERVICE_TYPE + "/"
+    payloads = []
+    for topic, request in sorted(schema["requests"].items()):
+        example = request.get("response", {}).get("payload", {}).get("example")
+        if example is not None:
+            payloads.append((topic[len(prefix):], example))
+
+    iris = copy.deepcopy(dict(payloads)["iris"])
+    results = iris["response"].get("results") or [{}]
+    iris["response"]["results"] = results * LARGE_IRIS_RESULTS
+    iris["response"]["results_count"] = len(iris["response"]["results"])
+    payloads.append(("iris (x{})".format(LARGE_IRIS_RESULTS), iris))
+    return payloads
+
+
+def run(iterations):
+    """
+    Runs the benchmark, printing the time per operation for each codec
+    """
+    codecs = [codec() for codec in CODECS.values() if codec.is_available()]
+    print("{:<28}{:>10}".format("payload", "bytes") +
+          "".join("{:>14}{:>14}".format(codec.NAME + " dec", codec.NAME + " enc")
+                  for codec in codecs))
+    for name, payload in load_payloads():
+        encoded = CODECS["json"]().dumps(payload)
+        number = max(1, iterations * 1000 // max(1000, len(encoded)))
+        row = "{:<28}{:>10}".format(name, len(encoded))
+        for codec in codecs:
+            decode = timeit.timeit(lambda: codec.loads(encoded), number=number)
+            encode = timeit.timeit(lambda: codec.dumps(payload), number=number)
+            row += "{:>12.1f}us{:>12.1f}us".format(decode / number * 1e6,
+                                                   encode / number * 1e6)
+        print(row)
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,264 @@
+# This benchmark measures the service end-to-end (request parsing,
+# validation, caching, retries, the DomainTools API client and response
+# encoding) without network access or DomainTools credentials.
+#
+# The service is loaded from an application configuration file, so that
+# changes to settings (for example, caching) can be measured, and runs
+# against:
+#
+# * a local stand-in for the DomainTools API (see stub_server.py), running in
+#   a separate process so that it does not count towards the CPU time of the
+#   service, and
+# * an in-process fake DXL client, with requests delivered directly to the
+#   request callbacks from a pool of threads (as the DXL client's incoming
+#   message thread pool does).
+#
+# The throughput, p50/p99 latency and CPU time per request are reported for
+# each service.
+#
+# Usage: python benchmark/service_benchmark.py [options] (see --help)
+
+from __future__ import absolute_import
+from __future__ import print_function
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from dxlbootstrap._compat import ConfigParser
+from dxlclient.message import ErrorResponse, Request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/..")
+from stub_server import create_api, load_examples, serve
+from dxldomaintoolsservice.app import DomainToolsService
+from dxldomaintoolsservice.metrics import LatencyWindow
+from dxldomaintoolsservice.replay import MODE_REPLAY
+
+# The application configuration file used if none is specified
+DEFAULT_CONFIG_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "config",
+    "dxldomaintoolsservice.config")
+
+# The format of the results table
+HEADER_FORMAT = "{:<24} {:>6} {:>6} {:>10} {:>9} {:>9} {:>9}"
+ROW_FORMAT = "{service:<24} {requests:>6} {errors:>6} {throughput:>10.1f} " \
+             "{p50_ms:>9.2f} {p99_ms:>9.2f} {cpu_ms_per_request:>9.3f}"
+
+
+class FakeDxlClient(object):
+    """
+    In-process stand-in for the DXL client, which counts the responses sent
+    by the service
+    """
+
+    def __init__(self):
+        self.responses = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def send_response(self, response):
+        with self._lock:
+            self.responses += 1
+            if isinstance(response, ErrorResponse):
+                self.errors += 1
+
+    def send_event(self, event):
+        pass
+
+    def reset(self):
+        with self._lock:
+            self.responses = 0
+            self.errors = 0
+
+
+class BenchmarkService(DomainToolsService):
+    """
+    The service, connected to the fake DXL client and the stub DomainTools
+    API server
+    """
+
+    def __init__(self, config_dir, stub_url):
+        super(BenchmarkService, self).__init__(config_dir)
+        self._stub_url = stub_url
+        self.request_callbacks = {}
+
+    def on_load_configuration(self, config):
+        super(BenchmarkService, self).on_load_configuration(config)
+        # Send DomainTools API requests to the stub server, unless responses
+        # are replayed from a recording
+        if self.record_replay_mode != MODE_REPLAY:
+            self._api = create_api(self._stub_url)
+
+    def add_request_callback(self, service, topic, callback,
+                             separate_thread):
+        self.request_callbacks[topic] = callback
+
+    def register_service(self, service):
+        pass
+
+    def start(self):
+        """
+        Loads the configuration and registers the request callbacks, as when
+        the service connects to the DXL fabric
+        """
+        self._load_configuration()
+        self._dxl_client = FakeDxlClient()
+        self.on_register_services()
+        self.on_dxl_connect()
+
+
+def write_config(config_file, config_dir):
+    """
+    Writes the application configuration to the configuration directory,
+    setting placeholder DomainTools API credentials if none are set
+    """
+    config = ConfigParser()
+    if not config.read(config_file):
+        raise Exception("Unable to read configuration file: {}".format(
+            config_file))
+    for prop in (DomainToolsService.GENERAL_API_USER_CONFIG_PROP,
+                 DomainToolsService.GENERAL_API_KEY_CONFIG_PROP):
+        if not config.get(DomainToolsService.GENERAL_CONFIG_SECTION, prop):
+            config.set(DomainToolsService.GENERAL_CONFIG_SECTION, prop,
+                       "benchmark")
+    with open(os.path.join(config_dir, "dxldomaintoolsservice.config"),
+              "w") as config_stream:
+        config.write(config_stream)
+
+
+def run_requests(app, topic, params, count, concurrency):
+    """
+    Delivers requests to the request callback for a topic from a pool of
+    threads
+
+    :return: The latency of each request (as a :class:`LatencyWindow`)
+    """
+    callback = app.request_callbacks[topic]
+    payload = json.dumps(params).encode("utf-8")
+    latencies = LatencyWindow(size=count)
+    remaining = [count]
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if not remaining[0]:
+                    return
+                remaining[0] -= 1
+            request = Request(topic)
+            request.payload = payload
+            start = time.time()
+            callback.on_request(request)
+            latencies.add(time.time() - start)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def benchmark_service(app, service, params, args):
+    """
+    Benchmarks a single service
+
+    :return: ``dict`` containing the results
+    """
+    topic = "{}/{}".format(DomainToolsService.SERVICE_TYPE, service)
+    run_requests(app, topic, params, args.warmup, args.concurrency)
+    app.client.reset()
+
+    cpu_start = sum(os.times()[:2])
+    start = time.time()
+    latencies = run_requests(app, topic, params, args.requests,
+                             args.concurrency)
+    elapsed = time.time() - start
+    cpu = sum(os.times()[:2]) - cpu_start
+
+    return {
+        "service": service,
+        "requests": args.requests,
+        "errors": app.client.errors,
+        "throughput": args.requests / elapsed,
+        "p50_ms": latencies.percentile(50) * 1000,
+        "p99_ms": latencies.percentile(99) * 1000,
+        "cpu_ms_per_request": cpu * 1000 / args.requests
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the DomainTools DXL service against a local "
+                    "stand-in for the DomainTools API")
+    parser.add_argument("--config", default=DEFAULT_CONFIG_FILE,
+                        help="the application configuration file "
+                             "(default: %(default)s)")
+    parser.add_argument("--services", default="",
+                        help="comma-separated services to benchmark "
+                             "(default: all)")
+    parser.add_argument("--requests", type=int, default=200,
+                        help="requests per service (default: %(default)s)")
+    parser.add_argument("--warmup", type=int, default=20,
+                        help="warm-up requests per service "
+                             "(default: %(default)s)")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="concurrent requests (default: %(default)s)")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="stub DomainTools API latency in milliseconds "
+                             "(default: %(default)s)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of stub DomainTools API requests "
+                             "which fail (default: %(default)s)")
+    parser.add_argument("--log-level", default="critical",
+                        help="the level of service log messages written "
+                             "(default: %(default)s)")
+    parser.add_argument("--json", action="store_true",
+                        help="write the results as JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=getattr(logging, args.log_level.upper()))
+    examples = load_examples()
+    services = [name.strip() for name in args.services.split(",")
+                if name.strip()] or sorted(examples)
+
+    ready = multiprocessing.Queue()
+    stub = multiprocessing.Process(
+        target=serve, args=(0, args.latency / 1000, args.error_rate, ready))
+    stub.daemon = True
+    stub.start()
+    config_dir = tempfile.mkdtemp()
+    try:
+        stub_url = ready.get(timeout=30)
+        write_config(args.config, config_dir)
+        app = BenchmarkService(config_dir, stub_url)
+        app.start()
+
+        results = []
+        if not args.json:
+            print(HEADER_FORMAT.format("service", "reqs", "errors", "req/s",
+                                       "p50 ms", "p99 ms", "cpu ms"))
+        for service in services:
+            results.append(benchmark_service(
+                app, service, examples[service][0], args))
+            if not args.json:
+                print(ROW_FORMAT.format(**results[-1]))
+        if args.json:
+            print(json.dumps(results, indent=2))
+    finally:
+        stub.terminate()
+        shutil.rmtree(config_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+# A local stand-in for the DomainTools API, used by the service benchmark
+# (see service_benchmark.py) so that the service can be measured without
+# network access or DomainTools credentials.
+#
+# The server responds to each DomainTools API path with the example response
+# payload for the corresponding service from the service schema, after a
+# configurable latency, and fails a configurable fraction of requests with
+# "503 Service Unavailable".
+#
+# The DomainTools API client is pointed at the server by using it as an HTTP
+# proxy, with HTTPS disabled (see create_api).
+#
+# Usage: python benchmark/stub_server.py [port] [latency_ms] [error_rate]
+
+from __future__ import absolute_import
+from __future__ import print_function
+import json
+import os
+import random
+import sys
+import time
+
+import yaml
+from domaintools import API
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/..")
+from dxldomaintoolsservice.app import DomainToolsService
+from dxldomaintoolsservice.codec import to_xml
+from dxldomaintoolsservice.validation import SCHEMA_FILE
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse
+
+
+def load_examples():
+    """
+    Returns the example request parameters and response payload of each
+    service in the service schema
+
+    :return: ``dict`` mapping service names to a tuple containing the example
+        request parameters and response payload
+    """
+    with open(SCHEMA_FILE) as schema_stream:
+        schema = yaml.safe_load(schema_stream)
+    prefix = DomainToolsService.SERVICE_TYPE + "/"
+    examples = {}
+    for topic, request in schema["requests"].items():
+        payload = request.get("payload", {})
+        params = payload.get("example")
+        for part in payload.get("allOf", []):
+            if "example" in part:
+                params = part["example"]
+        response = request.get("response", {}).get("payload", {}).get(
+            "example")
+        if response is not None:
+            examples[topic[len(prefix):]] = (dict(params or {}), response)
+    return examples
+
+
+def create_api(proxy_url):
+    """
+    Returns a DomainTools API client which sends its requests to the stub
+    server
+
+    :param proxy_url: The URL of the stub server
+    :return: The DomainTools API client
+    """
+    return API("benchmark", "benchmark", https=False, rate_limit=False,
+               proxy_url=proxy_url)
+
+
+def build_routes(examples):
+    """
+    Returns the example response for each DomainTools API path. The path of
+    each service is determined by the DomainTools API client itself (the
+    client does not make a request until its results are read).
+
+    :param examples: The examples (see :func:`load_examples`)
+    :return: ``dict`` mapping paths to example responses
+    """
+    api = create_api("http://localhost")
+    routes = {}
+    for service, (params, response) in examples.items():
+        params = dict((name, value) for name, value in params.items()
+                      if name != "format")
+        url = getattr(api, service)(**params).url
+        routes[urlparse(url).path] = response
+    return routes
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    """
+    HTTP server which responds with the example DomainTools API responses
+    """
+    daemon_threads = True
+    # The DomainTools API client opens a connection per request
+    request_queue_size = 128
+
+    def __init__(self, port=0, latency=0.0, error_rate=0.0):
+        """
+        Constructor parameters:
+
+        :param port: The port to listen on (``0`` for any free port)
+        :param latency: The time (in seconds) before each response is sent
+        :param error_rate: The fraction of requests which fail
+        """
+        HTTPServer.__init__(self, ("127.0.0.1", port), _StubRequestHandler)
+        self.routes = build_routes(load_examples())
+        self.latency = latency
+        self.error_rate = error_rate
+
+    @property
+    def url(self):
+        """
+        The URL of the server
+        """
+        return "http://127.0.0.1:{}".format(self.server_address[1])
+
+
+class _StubRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self): # pylint: disable=invalid-name
+        url = urlparse(self.path)
+        response = self.server.routes.get(url.path)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if response is None:
+            self._send(404, {"error": {"code": 404,
+                                       "message": "Not found"}})
+        elif random.random() < self.server.error_rate:
+            self._send(503, {"error": {"code": 503,
+                                       "message": "Service unavailable"}})
+        elif "format=xml" in url.query:
+            self._send(200, response, xml=True)
+        else:
+            self._send(200, response)
+
+    def _send(self, status, payload, xml=False):
+        body = (to_xml(payload) if xml else json.dumps(payload)).encode(
+            "utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type",
+                         "text/xml" if xml else "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        pass
+
+
+def serve(port=0, latency=0.0, error_rate=0.0, ready=None):
+    """
+    Runs the stub server until the process is terminated
+
+    :param port: The port to listen on (``0`` for any free port)
+    :param latency: The time (in seconds) before each response is sent
+    :param error_rate: The fraction of requests which fail
+    :param ready: Queue on which the URL of the server is put once it is
+        listening (optional)
+    """
+    server = StubServer(port, latency, error_rate)
+    if ready is not None:
+        ready.put(server.url)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    PORT = int(sys.argv[1]) if len(sys.argv) > 1 else 8080
+    LATENCY = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.0
+    ERROR_RATE = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+    print("Serving DomainTools API examples on port {}".format(PORT))
+    try:
+        serve(PORT, LATENCY, ERROR_RATE)
+    except KeyboardInterrupt:
+        pass
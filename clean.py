@@ -27,10 +27,13 @@ DIST_PY_FILE_LOCATION = os.path.dirname(os.path.realpath(__file__))
 DIST_DIRECTORY = os.path.join(DIST_PY_FILE_LOCATION, "dist")
 CONFIG_DIRECTORY = os.path.join(DIST_PY_FILE_LOCATION, "config")
 SAMPLE_DIRECTORY = os.path.join(DIST_PY_FILE_LOCATION, "sample")
+SCHEMA_DIRECTORY = os.path.join(DIST_PY_FILE_LOCATION, "schema", "v0.1")
 CONFIG_SRC_DIRECTORY = os.path.join(DIST_PY_FILE_LOCATION, "dxldomaintoolsservice",
                                     "_config", "app")
 SAMPLE_SRC_DIRECTORY = os.path.join(DIST_PY_FILE_LOCATION, "dxldomaintoolsservice",
                                     "_config", "sample")
+SCHEMA_SRC_DIRECTORY = os.path.join(DIST_PY_FILE_LOCATION, "dxldomaintoolsservice",
+                                    "_schema")
 
 # Remove the dist directory if it exists
 if os.path.exists(DIST_DIRECTORY):
@@ -43,6 +46,9 @@ clean_dir(CONFIG_SRC_DIRECTORY, CONFIG_DIRECTORY)
 # Clean the samples directory
 clean_dir(SAMPLE_SRC_DIRECTORY, SAMPLE_DIRECTORY)
 
+# Clean the schema directory
+clean_dir(SCHEMA_SRC_DIRECTORY, SCHEMA_DIRECTORY)
+
 # Clean .pyc files
 print("Cleaning .pyc files")
 for root, dirs, files in os.walk(DIST_PY_FILE_LOCATION):
@@ -9,11 +9,16 @@ import signal
 import threading
 
 from .app import DomainToolsService
+from .asynclog import start_async_logging
 
 # Whether the application is running
 running = False
 
-# Condition used to notify that the application should exit
+# Whether the application configuration should be reloaded
+reload_requested = False
+
+# Condition used to notify that the application should exit (or reload its
+# configuration)
 run_condition = threading.Condition()
 
 
@@ -35,9 +40,27 @@ def signal_handler(signum, frame):
             exit(1)
 
 
+def reload_signal_handler(signum, frame):
+    """
+    Signal handler invoked when the application configuration should be
+    reloaded
+
+    :param signum: The signal number
+    :param frame: The frame
+    """
+    del signum, frame
+    global reload_requested, run_condition # pylint: disable=global-statement
+    with run_condition:
+        reload_requested = True
+        run_condition.notify()
+
+
 # Signals to register for
 signal.signal(signal.SIGTERM, signal_handler)
 signal.signal(signal.SIGINT, signal_handler)
+# SIGHUP is not available on Windows
+if hasattr(signal, "SIGHUP"):
+    signal.signal(signal.SIGHUP, reload_signal_handler)
 
 # Validate command line
 if len(sys.argv) != 2:
@@ -49,7 +72,8 @@ if len(sys.argv) != 2:
 #
 
 config_dir = sys.argv[1]
-logging_config_path = os.path.join(config_dir, DomainToolsService.LOGGING_CONFIG_FILE)
+logging_config_path = os.path.join(config_dir,
+                                   DomainToolsService.LOGGING_CONFIG_FILE)
 if os.access(logging_config_path, os.R_OK):
     # Log configuration via configuration file
     fileConfig(logging_config_path, disable_existing_loggers=False)
@@ -66,20 +90,35 @@ else:
     logger.addHandler(console_handler)
     logger.setLevel(logging.INFO)
 
+# Write log records from a background thread, so that threads handling
+# requests do not block on writing log messages
+log_writer = start_async_logging()
+
 # Create the application
-with DomainToolsService(sys.argv[1]) as app:
-    try:
-        # Run the application
-        app.run()
-        running = True
-
-        with run_condition:
-            # Wait until notified to exit
-            while running:
-                run_condition.wait(60)
-
-    except KeyboardInterrupt:
-        pass
-    except: # pylint: disable=bare-except
-        logger.exception("Error occurred, exiting")
-        sys.exit(1)
+try:
+    with DomainToolsService(sys.argv[1]) as app:
+        try:
+            # Run the application
+            app.run()
+            running = True
+
+            with run_condition:
+                # Wait until notified to exit
+                while running:
+                    run_condition.wait(60)
+                    if reload_requested and running:
+                        reload_requested = False
+                        try:
+                            app.reload_configuration()
+                        except Exception: # pylint: disable=broad-except
+                            logger.exception(
+                                "Error reloading configuration")
+
+        except KeyboardInterrupt:
+            pass
+        except: # pylint: disable=bare-except
+            logger.exception("Error occurred, exiting")
+            sys.exit(1)
+finally:
+    # Write any queued log records before exiting
+    log_writer.stop()
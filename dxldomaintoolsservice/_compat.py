@@ -0,0 +1,26 @@
+""" Abstraction layer for Python 2 / 3 compatibility. """
+
+from __future__ import absolute_import
+
+# pylint: disable=unused-import
+try:
+    from queue import Queue, Empty, Full
+except ImportError:
+    from Queue import Queue, Empty, Full
+
+try:
+    string_types = (basestring,) # pylint: disable=invalid-name, undefined-variable
+except NameError:
+    string_types = (str,) # pylint: disable=invalid-name
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+try:
+    from configparser import ConfigParser
+except ImportError:
+    from ConfigParser import ConfigParser
@@ -0,0 +1,4 @@
+from __future__ import absolute_import
+
+#: The DXL service type for the DomainTools API
+SERVICE_TYPE = "/opendxl-domaintools/service/domaintools"
@@ -1,24 +1,91 @@
 from __future__ import absolute_import
-from collections import OrderedDict
 import logging
+import os
+import threading
+import time
 
 from domaintools import API
 from dxlbootstrap.app import Application
+from dxlclient.message import Event
 from dxlclient.service import ServiceRegistrationInfo
-from dxldomaintoolsservice.requesthandlers import DomainToolsRequestCallback
+from dxldomaintoolsservice._compat import ConfigParser
+from dxldomaintoolsservice._constants import SERVICE_TYPE
+from dxldomaintoolsservice.asynclog import RequestLogSampler, \
+    dropped_records
+from dxldomaintoolsservice.budget import BudgetTracker, PRIORITIES, \
+    PRIORITY_NORMAL
+from dxldomaintoolsservice.cache import ResponseCache
+from dxldomaintoolsservice.chunking import CHUNK_TOPIC, ChunkStore
+from dxldomaintoolsservice.codec import AUTO_CODEC, get_codec
+from dxldomaintoolsservice.exporter import MetricsExporter
+from dxldomaintoolsservice.fairness import CLIENT_KEY_CLIENT, \
+    CLIENT_KEY_TENANT, FairScheduler
+from dxldomaintoolsservice._version import __version__
+from dxldomaintoolsservice.health import STATUS_DRAINING, STATUS_READY, \
+    STATUS_STOPPED, HealthMonitor, StartupTimer, prime_api_rate_limits
+from dxldomaintoolsservice.hedging import HedgingPolicy
+from dxldomaintoolsservice.memory import MemoryTracker
+from dxldomaintoolsservice.metrics import Metrics
+from dxldomaintoolsservice.monitors import MonitorQuery, MonitorScheduler
+from dxldomaintoolsservice.peercache import PeerCache
+from dxldomaintoolsservice.pivot import PivotExpander
+from dxldomaintoolsservice.profiling import Profiler
+from dxldomaintoolsservice.ratelimiter import RateLimiter
+from dxldomaintoolsservice.replay import MODE_OFF, MODE_RECORD, MODE_REPLAY, \
+    MODES, ReplayAPI, ResponseRecorder
+from dxldomaintoolsservice.requesthandlers import \
+    ChunkRequestCallback, DomainToolsRequestCallback, \
+    HealthRequestCallback, MetricsRequestCallback, PeerCacheEventCallback, \
+    PeerCacheRequestCallback, PivotRequestCallback, ProfileRequestCallback, \
+    ReloadRequestCallback, SlowRequestsRequestCallback
+from dxldomaintoolsservice.retry import RetryBudget, RetryPolicy
+from dxldomaintoolsservice.shutdown import InFlightTracker, \
+    QueuedRequestCallback, load_warm_state, save_warm_state
+from dxldomaintoolsservice.slowlog import SlowRequestLog
+from dxldomaintoolsservice.snapshots import SnapshotRefresher
+from dxldomaintoolsservice.validation import load_validators
 
 
 # Configure local logger
 logger = logging.getLogger(__name__)
 
 
+# The application owns every component of the service (and their settings),
+# and exposes them to the request handlers
+# pylint: disable=too-many-lines, too-many-public-methods
 class DomainToolsService(Application):
     """
     The "DomainTools DXL Python Service" application class.
     """
 
     #: The DXL service type for the DomainTools API
-    SERVICE_TYPE = "/opendxl-domaintools/service/domaintools"
+    SERVICE_TYPE = SERVICE_TYPE
+
+    #: The names of the DomainTools API methods exposed as services. The
+    #: request topic for each is "<SERVICE_TYPE>/<name>".
+    DOMAINTOOLS_SERVICES = (
+        "account_information",
+        "brand_monitor",
+        "domain_profile",
+        "domain_search",
+        "domain_suggestions",
+        "host_domains",
+        "hosting_history",
+        "ip_monitor",
+        "ip_registrant_monitor",
+        "iris",
+        "name_server_monitor",
+        "parsed_whois",
+        "phisheye",
+        "phisheye_term_list",
+        "registrant_monitor",
+        "reputation",
+        "reverse_ip",
+        "reverse_ip_whois",
+        "reverse_name_server",
+        "reverse_whois",
+        "whois",
+        "whois_history")
 
     #: The name of the "General" section within the application configuration
     #: file
@@ -29,6 +96,322 @@ class DomainToolsService(Application):
     #: The property used to specify the DomainTools API User in the application
     #: configuration file
     GENERAL_API_USER_CONFIG_PROP = "apiUser"
+    #: The property used to specify the JSON codec used for request and
+    #: response payloads in the application configuration file
+    GENERAL_JSON_CODEC_CONFIG_PROP = "jsonCodec"
+
+    #: The name of the "Retry" section within the application configuration
+    #: file
+    RETRY_CONFIG_SECTION = "Retry"
+    #: The property used to specify the maximum number of attempts per request
+    RETRY_MAX_ATTEMPTS_CONFIG_PROP = "maxAttempts"
+    #: The property used to specify the bound of the first backoff delay
+    RETRY_BASE_DELAY_CONFIG_PROP = "baseDelay"
+    #: The property used to specify the maximum bound of a backoff delay
+    RETRY_MAX_DELAY_CONFIG_PROP = "maxDelay"
+    #: The property used to specify the maximum time spent on a request
+    RETRY_MAX_TIME_CONFIG_PROP = "maxTime"
+    #: The property used to specify the number of retries permitted per request
+    RETRY_BUDGET_RATIO_CONFIG_PROP = "budgetRatio"
+    #: The property used to specify the number of retries permitted per second
+    RETRY_BUDGET_MIN_PER_SECOND_CONFIG_PROP = "budgetMinPerSecond"
+
+    #: The name of the "RateLimit" section within the application
+    #: configuration file
+    RATE_LIMIT_CONFIG_SECTION = "RateLimit"
+    #: The property used to specify the DomainTools API calls permitted per
+    #: minute
+    RATE_LIMIT_PER_MINUTE_CONFIG_PROP = "requestsPerMinute"
+    #: The property used to specify the DomainTools API calls which can be
+    #: made back-to-back
+    RATE_LIMIT_BURST_CONFIG_PROP = "burst"
+
+    #: The name of the "Hedging" section within the application configuration
+    #: file
+    HEDGING_CONFIG_SECTION = "Hedging"
+    #: The property used to specify the services to hedge
+    HEDGING_SERVICES_CONFIG_PROP = "services"
+    #: The property used to specify the latency percentile to hedge after
+    HEDGING_PERCENTILE_CONFIG_PROP = "percentile"
+    #: The property used to specify the latency samples required to hedge
+    HEDGING_MIN_SAMPLES_CONFIG_PROP = "minSamples"
+    #: The property used to specify the maximum ratio of hedges to requests
+    HEDGING_MAX_RATIO_CONFIG_PROP = "maxRatio"
+
+    #: The name of the "Chunking" section within the application
+    #: configuration file
+    CHUNKING_CONFIG_SECTION = "Chunking"
+    #: The property used to specify the maximum size of a response chunk
+    CHUNKING_MAX_CHUNK_SIZE_CONFIG_PROP = "maxChunkSize"
+    #: The property used to specify how long chunks are held for callers
+    CHUNKING_TTL_CONFIG_PROP = "ttl"
+    #: The property used to specify the maximum size of the chunks held for
+    #: callers
+    CHUNKING_MAX_PENDING_BYTES_CONFIG_PROP = "maxPendingBytes"
+
+    #: The name of the "Cache" section within the application configuration
+    #: file
+    CACHE_CONFIG_SECTION = "Cache"
+    #: The property used to specify the maximum size of the cached responses
+    CACHE_MAX_BYTES_CONFIG_PROP = "maxBytes"
+    #: The property used to specify the compression level of cached responses
+    CACHE_COMPRESSION_LEVEL_CONFIG_PROP = "compressionLevel"
+    #: The property used to specify how long responses are cached for
+    CACHE_TTL_CONFIG_PROP = "ttl"
+    #: The name of the "CacheTtl" section within the application configuration
+    #: file. Each property is the name of a service, and its value is how long
+    #: responses for that service are cached for.
+    CACHE_TTL_CONFIG_SECTION = "CacheTtl"
+
+    #: The name of the "Snapshots" section within the application
+    #: configuration file
+    SNAPSHOTS_CONFIG_SECTION = "Snapshots"
+    #: The property used to specify the services answered from in-memory
+    #: snapshots
+    SNAPSHOTS_SERVICES_CONFIG_PROP = "services"
+    #: The property used to specify the time between snapshot refreshes
+    SNAPSHOTS_REFRESH_INTERVAL_CONFIG_PROP = "refreshInterval"
+
+    #: The name of the "Monitors" section within the application configuration
+    #: file
+    MONITORS_CONFIG_SECTION = "Monitors"
+    #: The property used to specify the time between polls of each monitor
+    #: query
+    MONITORS_INTERVAL_CONFIG_PROP = "interval"
+    #: The name of the "MonitorQueries" section within the application
+    #: configuration file. Each property is the name of a monitor query, and
+    #: its value is a JSON object containing the monitor service and the
+    #: request parameters.
+    MONITOR_QUERIES_CONFIG_SECTION = "MonitorQueries"
+
+    #: The name of the "Fairness" section within the application
+    #: configuration file
+    FAIRNESS_CONFIG_SECTION = "Fairness"
+    #: The property used to specify how clients are identified
+    FAIRNESS_CLIENT_KEY_CONFIG_PROP = "clientKey"
+    #: The property used to specify the maximum number of requests handled
+    #: concurrently
+    FAIRNESS_MAX_CONCURRENT_CONFIG_PROP = "maxConcurrent"
+    #: The property used to specify the maximum number of requests from a
+    #: single client handled concurrently
+    FAIRNESS_CLIENT_CONCURRENCY_CONFIG_PROP = "clientConcurrency"
+    #: The property used to specify the maximum number of requests from a
+    #: single client waiting to be handled
+    FAIRNESS_CLIENT_QUEUE_SIZE_CONFIG_PROP = "clientQueueSize"
+    #: The property used to specify the requests permitted per minute from a
+    #: single client
+    FAIRNESS_CLIENT_PER_MINUTE_CONFIG_PROP = "clientRequestsPerMinute"
+    #: The property used to specify the requests a single client can make
+    #: back-to-back
+    FAIRNESS_CLIENT_BURST_CONFIG_PROP = "clientBurst"
+    #: The property used to specify the maximum time a request waits to be
+    #: handled
+    FAIRNESS_MAX_WAIT_CONFIG_PROP = "maxWait"
+    #: The name of the "ClientWeights" section within the application
+    #: configuration file. Each property is a client key, and its value is the
+    #: client's share of the capacity relative to other clients.
+    CLIENT_WEIGHTS_CONFIG_SECTION = "ClientWeights"
+
+    #: The name of the "Budget" section within the application configuration
+    #: file
+    BUDGET_CONFIG_SECTION = "Budget"
+    #: The property used to specify the file that usage is persisted to
+    BUDGET_STATE_FILE_CONFIG_PROP = "stateFile"
+    #: The property used to specify the minimum time between writes of the
+    #: state file
+    BUDGET_SAVE_INTERVAL_CONFIG_PROP = "saveInterval"
+    #: The property used to specify the fraction of each limit reserved for
+    #: normal priority requests
+    BUDGET_RESERVE_RATIO_CONFIG_PROP = "reserveRatio"
+    #: The property used to specify the priority of requests which do not
+    #: specify one
+    BUDGET_DEFAULT_PRIORITY_CONFIG_PROP = "defaultPriority"
+    #: The name of the "ServiceCosts" section within the application
+    #: configuration file. Each property is the name of a service, and its
+    #: value is the cost of a DomainTools API call for that service.
+    SERVICE_COSTS_CONFIG_SECTION = "ServiceCosts"
+    #: The name of the "MonthlyLimits" section within the application
+    #: configuration file. Each property is the name of a service, and its
+    #: value is the monthly limit for that service.
+    MONTHLY_LIMITS_CONFIG_SECTION = "MonthlyLimits"
+
+    #: The name of the "RecordReplay" section within the application
+    #: configuration file
+    RECORD_REPLAY_CONFIG_SECTION = "RecordReplay"
+    #: The property used to specify whether DomainTools API responses are
+    #: recorded or replayed
+    RECORD_REPLAY_MODE_CONFIG_PROP = "mode"
+    #: The property used to specify the recording file
+    RECORD_REPLAY_FILE_CONFIG_PROP = "file"
+    #: The property used to specify the factor applied to recorded latencies
+    RECORD_REPLAY_LATENCY_SCALE_CONFIG_PROP = "latencyScale"
+
+    #: The name of the "RequestLogging" section within the application
+    #: configuration file
+    REQUEST_LOGGING_CONFIG_SECTION = "RequestLogging"
+    #: The property used to specify the fraction of requests logged
+    REQUEST_LOGGING_SAMPLE_RATE_CONFIG_PROP = "sampleRate"
+    #: The property used to specify the maximum number of bytes of each
+    #: request payload logged
+    REQUEST_LOGGING_MAX_PAYLOAD_SIZE_CONFIG_PROP = "maxPayloadSize"
+    #: The name of the "RequestLoggingSampleRates" section within the
+    #: application configuration file. Each property is the name of a
+    #: service, and its value is the fraction of requests for that service
+    #: which are logged.
+    REQUEST_LOGGING_SAMPLE_RATES_CONFIG_SECTION = "RequestLoggingSampleRates"
+
+    #: The name of the "Profiling" section within the application
+    #: configuration file
+    PROFILING_CONFIG_SECTION = "Profiling"
+    #: The property used to specify the token required to request profiles
+    PROFILING_TOKEN_CONFIG_PROP = "token"
+    #: The property used to specify the DXL clients allowed to request
+    #: profiles
+    PROFILING_ALLOWED_CLIENTS_CONFIG_PROP = "allowedClients"
+    #: The property used to specify the maximum duration of a profile
+    PROFILING_MAX_DURATION_CONFIG_PROP = "maxDuration"
+    #: The property used to specify the time between samples of a sampling
+    #: profile
+    PROFILING_SAMPLE_INTERVAL_CONFIG_PROP = "sampleInterval"
+    #: The property used to specify the directory profiles are written to
+    PROFILING_OUTPUT_DIR_CONFIG_PROP = "outputDir"
+
+    #: The name of the "MemoryTracking" section within the application
+    #: configuration file
+    MEMORY_TRACKING_CONFIG_SECTION = "MemoryTracking"
+    #: The property used to specify whether memory allocations are tracked
+    MEMORY_TRACKING_ENABLED_CONFIG_PROP = "enabled"
+    #: The property used to specify the number of stack frames recorded for
+    #: each allocation
+    MEMORY_TRACKING_FRAMES_CONFIG_PROP = "frames"
+    #: The property used to specify the time between snapshots of the top
+    #: allocation sites
+    MEMORY_TRACKING_INTERVAL_CONFIG_PROP = "interval"
+    #: The property used to specify the number of allocation sites reported
+    MEMORY_TRACKING_TOP_SITES_CONFIG_PROP = "topSites"
+
+    #: The name of the "SlowRequests" section within the application
+    #: configuration file
+    SLOW_REQUESTS_CONFIG_SECTION = "SlowRequests"
+    #: The property used to specify the time after which requests are logged
+    #: as slow
+    SLOW_REQUESTS_THRESHOLD_CONFIG_PROP = "threshold"
+    #: The property used to specify the number of slow requests kept
+    SLOW_REQUESTS_SIZE_CONFIG_PROP = "size"
+    #: The name of the "SlowRequestThresholds" section within the application
+    #: configuration file. Each property is the name of a service, and its
+    #: value is the time after which requests for that service are logged as
+    #: slow.
+    SLOW_REQUEST_THRESHOLDS_CONFIG_SECTION = "SlowRequestThresholds"
+
+    #: The name of the "MetricsExporter" section within the application
+    #: configuration file
+    METRICS_EXPORTER_CONFIG_SECTION = "MetricsExporter"
+    #: The property used to specify the port metrics are exported on
+    METRICS_EXPORTER_PORT_CONFIG_PROP = "port"
+    #: The property used to specify the address metrics are exported on
+    METRICS_EXPORTER_ADDRESS_CONFIG_PROP = "address"
+
+    #: The name of the "Reload" section within the application configuration
+    #: file
+    RELOAD_CONFIG_SECTION = "Reload"
+    #: The property used to specify the token required to reload the
+    #: configuration
+    RELOAD_TOKEN_CONFIG_PROP = "token"
+    #: The property used to specify the DXL clients allowed to reload the
+    #: configuration
+    RELOAD_ALLOWED_CLIENTS_CONFIG_PROP = "allowedClients"
+
+    #: The name of the "Shutdown" section within the application
+    #: configuration file
+    SHUTDOWN_CONFIG_SECTION = "Shutdown"
+    #: The property used to specify the maximum time to wait for requests in
+    #: flight to complete when shutting down
+    SHUTDOWN_DRAIN_TIMEOUT_CONFIG_PROP = "drainTimeout"
+    #: The property used to specify the file the warm state of the service is
+    #: written to when shutting down
+    SHUTDOWN_STATE_FILE_CONFIG_PROP = "stateFile"
+
+    #: The name of the "Startup" section within the application
+    #: configuration file
+    STARTUP_CONFIG_SECTION = "Startup"
+    #: The property used to specify whether the DomainTools API client is
+    #: validated and warmed up before the service is registered
+    STARTUP_PREWARM_CONFIG_PROP = "prewarm"
+
+    #: The name of the "Health" section within the application configuration
+    #: file
+    HEALTH_CONFIG_SECTION = "Health"
+    #: The property used to specify the file written while the service is
+    #: ready
+    HEALTH_FILE_CONFIG_PROP = "file"
+    #: The property used to specify the port health is reported on
+    HEALTH_PORT_CONFIG_PROP = "port"
+    #: The property used to specify the address health is reported on
+    HEALTH_ADDRESS_CONFIG_PROP = "address"
+
+    #: The name of the "PeerCache" section within the application
+    #: configuration file
+    PEER_CACHE_CONFIG_SECTION = "PeerCache"
+    #: The property used to specify whether the response cache is shared
+    #: with the other instances of the service
+    PEER_CACHE_ENABLED_CONFIG_PROP = "enabled"
+    #: The property used to specify the maximum time to wait for a peer
+    PEER_CACHE_TIMEOUT_CONFIG_PROP = "timeout"
+    #: The property used to specify the time between announcements that the
+    #: instance is running
+    PEER_CACHE_HEARTBEAT_INTERVAL_CONFIG_PROP = "heartbeatInterval"
+    #: The property used to specify the time between announcements of the
+    #: responses added to the cache
+    PEER_CACHE_NOTIFY_INTERVAL_CONFIG_PROP = "notifyInterval"
+    #: The property used to specify the maximum number of responses cached
+    #: by peers which are tracked
+    PEER_CACHE_DIRECTORY_SIZE_CONFIG_PROP = "directorySize"
+    #: The property used to specify the number of points on the consistent
+    #: hash ring per instance
+    PEER_CACHE_VIRTUAL_NODES_CONFIG_PROP = "virtualNodes"
+    #: The property used to specify the maximum time to wait for the owner of
+    #: a key which has not announced the response
+    PEER_CACHE_OWNER_TIMEOUT_CONFIG_PROP = "ownerTimeout"
+
+    #: The name of the "Pivot" section within the application configuration
+    #: file
+    PIVOT_CONFIG_SECTION = "Pivot"
+    #: The property used to specify the maximum number of hops callers can
+    #: request
+    PIVOT_MAX_DEPTH_CONFIG_PROP = "maxDepth"
+    #: The property used to specify the maximum fan-out callers can request
+    PIVOT_MAX_FANOUT_CONFIG_PROP = "maxFanout"
+    #: The property used to specify the maximum number of entities in a graph
+    PIVOT_MAX_NODES_CONFIG_PROP = "maxNodes"
+    #: The property used to specify the maximum number of lookups made in
+    #: parallel for a graph
+    PIVOT_MAX_PARALLEL_CONFIG_PROP = "maxParallel"
+    #: The property used to specify whether callers can request that reverse
+    #: Whois reports are purchased
+    PIVOT_ALLOW_PURCHASE_CONFIG_PROP = "allowPurchase"
+
+    #: The settings of the application configuration file which are not
+    #: applied when the configuration is reloaded, as a list of tuples
+    #: containing the section and property (``None`` for every property in
+    #: the section). Changes to these settings require a restart.
+    RESTART_CONFIG_SETTINGS = (
+        (Application.INCOMING_MESSAGE_POOL_CONFIG_SECTION, None),
+        (Application.MESSAGE_CALLBACK_POOL_CONFIG_SECTION, None),
+        (RECORD_REPLAY_CONFIG_SECTION, None),
+        (SNAPSHOTS_CONFIG_SECTION, None),
+        (MONITORS_CONFIG_SECTION, None),
+        (MONITOR_QUERIES_CONFIG_SECTION, None),
+        (BUDGET_CONFIG_SECTION, BUDGET_STATE_FILE_CONFIG_PROP),
+        (BUDGET_CONFIG_SECTION, BUDGET_SAVE_INTERVAL_CONFIG_PROP),
+        (PROFILING_CONFIG_SECTION, None),
+        (MEMORY_TRACKING_CONFIG_SECTION, None),
+        (METRICS_EXPORTER_CONFIG_SECTION, None),
+        (RELOAD_CONFIG_SECTION, None),
+        (STARTUP_CONFIG_SECTION, None),
+        (HEALTH_CONFIG_SECTION, None),
+        (PEER_CACHE_CONFIG_SECTION, None),
+        (PIVOT_CONFIG_SECTION, None))
 
     def __init__(self, config_dir):
         """
@@ -43,6 +426,48 @@ class DomainToolsService(Application):
         self._api = None
         self._api_key = None
         self._api_user = None
+        self._json_codec = get_codec()
+        self._retry_policy = None
+        self._rate_limiter = None
+        self._hedging_policy = None
+        self._chunk_store = None
+        self._response_cache = None
+        self._peer_cache = None
+        self._pivot_expander = None
+        self._pivot_max_depth = 3
+        self._pivot_max_fanout = 25
+        self._pivot_allow_purchase = False
+        self._snapshots = None
+        self._monitor_scheduler = None
+        self._client_key = CLIENT_KEY_CLIENT
+        self._fair_scheduler = None
+        self._budget_tracker = None
+        self._default_priority = PRIORITY_NORMAL
+        self._record_replay_mode = MODE_OFF
+        self._response_recorder = None
+        self._request_log_sampler = RequestLogSampler()
+        self._profiler = Profiler()
+        self._memory_tracker = MemoryTracker()
+        self._slow_request_log = SlowRequestLog()
+        self._metrics_exporter = None
+        self._profiling_token = None
+        self._profiling_allowed_clients = []
+        self._profiling_output_dir = None
+        self._reload_token = None
+        self._reload_allowed_clients = []
+        self._reload_lock = threading.Lock()
+        self._in_flight = InFlightTracker()
+        self._drain_timeout = 10
+        self._warm_state_file = None
+        # Whether the services were registered (the warm state is only saved
+        # if the service started)
+        self._started = False
+        self._prewarm = True
+        self._startup_timer = StartupTimer()
+        self._health_monitor = HealthMonitor(self._startup_timer)
+        self._request_callbacks = {}
+        self._topic_callbacks = {}
+        self._metrics = Metrics()
 
     @property
     def domaintools_api(self):
@@ -53,6 +478,209 @@ class DomainToolsService(Application):
         """
         return self._api
 
+    @property
+    def json_codec(self):
+        """
+        Returns the codec used to convert JSON request and response payloads
+
+        :return: The :class:`dxldomaintoolsservice.codec.JsonCodec`
+        """
+        return self._json_codec
+
+    @property
+    def retry_policy(self):
+        """
+        Returns the policy used to retry transient DomainTools API failures
+
+        :return: The :class:`dxldomaintoolsservice.retry.RetryPolicy`
+        """
+        return self._retry_policy
+
+    @property
+    def rate_limiter(self):
+        """
+        Returns the limiter for the rate of DomainTools API calls
+
+        :return: The :class:`dxldomaintoolsservice.ratelimiter.RateLimiter`
+        """
+        return self._rate_limiter
+
+    @property
+    def hedging_policy(self):
+        """
+        Returns the policy used to hedge slow DomainTools API calls
+
+        :return: The :class:`dxldomaintoolsservice.hedging.HedgingPolicy`
+        """
+        return self._hedging_policy
+
+    @property
+    def chunk_store(self):
+        """
+        Returns the store used to split oversized responses into chunks
+
+        :return: The :class:`dxldomaintoolsservice.chunking.ChunkStore`
+        """
+        return self._chunk_store
+
+    @property
+    def response_cache(self):
+        """
+        Returns the cache of DomainTools API responses
+
+        :return: The :class:`dxldomaintoolsservice.cache.ResponseCache`
+        """
+        return self._response_cache
+
+    @property
+    def peer_cache(self):
+        """
+        Returns the sharing of the response cache with the other instances of
+        the service
+
+        :return: The :class:`dxldomaintoolsservice.peercache.PeerCache`
+        """
+        return self._peer_cache
+
+    @property
+    def snapshots(self):
+        """
+        Returns the in-memory snapshots of parameterless services
+
+        :return: The
+            :class:`dxldomaintoolsservice.snapshots.SnapshotRefresher`
+        """
+        return self._snapshots
+
+    @property
+    def monitor_scheduler(self):
+        """
+        Returns the scheduler which polls monitor queries and publishes their
+        changes
+
+        :return: The
+            :class:`dxldomaintoolsservice.monitors.MonitorScheduler`
+        """
+        return self._monitor_scheduler
+
+    @property
+    def client_key(self):
+        """
+        Returns how clients are identified for fair queuing and quotas
+
+        :return: ``client`` or ``tenant``
+        """
+        return self._client_key
+
+    @property
+    def fair_scheduler(self):
+        """
+        Returns the scheduler used to divide capacity between clients
+
+        :return: The :class:`dxldomaintoolsservice.fairness.FairScheduler`
+        """
+        return self._fair_scheduler
+
+    @property
+    def budget_tracker(self):
+        """
+        Returns the tracker of DomainTools API usage against its limits
+
+        :return: The :class:`dxldomaintoolsservice.budget.BudgetTracker`
+        """
+        return self._budget_tracker
+
+    @property
+    def default_priority(self):
+        """
+        Returns the priority of requests which do not specify one
+
+        :return: ``low`` or ``normal``
+        """
+        return self._default_priority
+
+    @property
+    def record_replay_mode(self):
+        """
+        Returns whether DomainTools API responses are recorded or replayed
+
+        :return: ``off``, ``record`` or ``replay``
+        """
+        return self._record_replay_mode
+
+    @property
+    def response_recorder(self):
+        """
+        Returns the recorder of DomainTools API responses (``None`` unless
+        responses are being recorded)
+
+        :return: The :class:`dxldomaintoolsservice.replay.ResponseRecorder`
+        """
+        return self._response_recorder
+
+    @property
+    def request_log_sampler(self):
+        """
+        Returns the sampler which determines the requests that are logged
+
+        :return: The :class:`dxldomaintoolsservice.asynclog.RequestLogSampler`
+        """
+        return self._request_log_sampler
+
+    @property
+    def profiler(self):
+        """
+        Returns the profiler used to capture profiles of the service
+
+        :return: The :class:`dxldomaintoolsservice.profiling.Profiler`
+        """
+        return self._profiler
+
+    @property
+    def memory_tracker(self):
+        """
+        Returns the tracker of the memory allocated by the service
+
+        :return: The :class:`dxldomaintoolsservice.memory.MemoryTracker`
+        """
+        return self._memory_tracker
+
+    @property
+    def slow_request_log(self):
+        """
+        Returns the log of slow requests
+
+        :return: The :class:`dxldomaintoolsservice.slowlog.SlowRequestLog`
+        """
+        return self._slow_request_log
+
+    @property
+    def in_flight(self):
+        """
+        Returns the tracker of the requests being handled
+
+        :return: The :class:`dxldomaintoolsservice.shutdown.InFlightTracker`
+        """
+        return self._in_flight
+
+    @property
+    def health_monitor(self):
+        """
+        Returns the monitor which reports whether the service is ready
+
+        :return: The :class:`dxldomaintoolsservice.health.HealthMonitor`
+        """
+        return self._health_monitor
+
+    @property
+    def metrics(self):
+        """
+        Returns the metrics collected by the service
+
+        :return: The :class:`dxldomaintoolsservice.metrics.Metrics`
+        """
+        return self._metrics
+
     @property
     def client(self):
         """
@@ -86,29 +714,859 @@ class DomainToolsService(Application):
         """
         logger.info("On 'load configuration' callback.")
 
+        self._load_api_settings(config)
+
+        # JSON codec
+        self._json_codec = self._create_json_codec(config)
+        logger.info("Using JSON codec: %s", self._json_codec.NAME)
+
+        # Request logging settings
+        self._request_log_sampler = self._create_request_log_sampler(config)
+        self._metrics.set_gauge("log_records_dropped", dropped_records)
+
+        # Components are created in order, as later components use earlier
+        # ones (for example, the memory tracker reports the size of the
+        # response cache)
+        self._load_profiling_settings(config)
+        self._load_upstream_settings(config)
+        self._load_cache_settings(config)
+        self._load_pivot_settings(config)
+        self._load_background_settings(config)
+        self._load_client_settings(config)
+        self._load_diagnostics_settings(config)
+
+        # Reload settings
+        self._reload_token = self._get_config_value(
+            config, self.RELOAD_CONFIG_SECTION,
+            self.RELOAD_TOKEN_CONFIG_PROP, None)
+        self._reload_allowed_clients = self._get_config_list(
+            config, self.RELOAD_CONFIG_SECTION,
+            self.RELOAD_ALLOWED_CLIENTS_CONFIG_PROP)
+
+        # Shutdown settings
+        self._drain_timeout, self._warm_state_file = \
+            self._get_shutdown_settings(config)
+        self._metrics.set_gauge("in_flight",
+                                lambda: self._in_flight.in_flight)
+
+        # The state saved when the service was last shut down is restored
+        # before the service is registered
+        self._restore_warm_state()
+
+        self._load_health_settings(config)
+
+        self._startup_timer.mark("load_configuration")
+
+    def _load_api_settings(self, config):
+        """
+        Creates the DomainTools API client (or, in replay mode, the client
+        which serves responses from a recording) and the response recorder
+        from the application configuration
+
+        :param config: The application configuration
+        """
+        # Record/replay settings
+        self._record_replay_mode = self._get_config_value(
+            config, self.RECORD_REPLAY_CONFIG_SECTION,
+            self.RECORD_REPLAY_MODE_CONFIG_PROP, MODE_OFF)
+        if self._record_replay_mode not in MODES:
+            raise Exception(
+                "Invalid value for '{0}' in section '{1}' of configuration "
+                "file: {2}".format(self.RECORD_REPLAY_MODE_CONFIG_PROP,
+                                   self.RECORD_REPLAY_CONFIG_SECTION,
+                                   self._app_config_path))
+        record_replay_file = None
+        if self._record_replay_mode != MODE_OFF:
+            record_replay_file = self._get_config_value(
+                config, self.RECORD_REPLAY_CONFIG_SECTION,
+                self.RECORD_REPLAY_FILE_CONFIG_PROP, None)
+            if not record_replay_file:
+                raise Exception(
+                    "Recording file not found in configuration file: {0}"
+                    .format(self._app_config_path))
+            record_replay_file = os.path.join(self._config_dir,
+                                              record_replay_file)
+
+        # Responses are served from the recording in replay mode, so
+        # DomainTools API credentials are not required
+        replaying = self._record_replay_mode == MODE_REPLAY
+
+        # API User and Key
+        self._api_user, self._api_key = self._get_api_credentials(
+            config, replaying)
+
+        if replaying:
+            self._api = ReplayAPI(
+                record_replay_file,
+                latency_scale=self._get_config_value(
+                    config, self.RECORD_REPLAY_CONFIG_SECTION,
+                    self.RECORD_REPLAY_LATENCY_SCALE_CONFIG_PROP, 1.0,
+                    config.getfloat))
+            logger.info("Replaying %d DomainTools API responses from: %s",
+                        len(self._api), record_replay_file)
+        else:
+            self._api = API(self._api_user, self._api_key)
+
+        if self._record_replay_mode == MODE_RECORD:
+            self._response_recorder = ResponseRecorder(record_replay_file)
+            logger.info("Recording DomainTools API responses to: %s",
+                        record_replay_file)
+
+    def _load_profiling_settings(self, config):
+        """
+        Creates the profiler from the application configuration
+
+        :param config: The application configuration
+        """
+        # Profiling settings
+        self._profiler = Profiler(
+            max_duration=self._get_config_value(
+                config, self.PROFILING_CONFIG_SECTION,
+                self.PROFILING_MAX_DURATION_CONFIG_PROP, 60,
+                config.getfloat),
+            sample_interval=self._get_config_value(
+                config, self.PROFILING_CONFIG_SECTION,
+                self.PROFILING_SAMPLE_INTERVAL_CONFIG_PROP, 0.005,
+                config.getfloat))
+        self._profiling_token = self._get_config_value(
+            config, self.PROFILING_CONFIG_SECTION,
+            self.PROFILING_TOKEN_CONFIG_PROP, None)
+        self._profiling_allowed_clients = self._get_config_list(
+            config, self.PROFILING_CONFIG_SECTION,
+            self.PROFILING_ALLOWED_CLIENTS_CONFIG_PROP)
+        # Relative to the configuration directory (the config volume when
+        # running in a container)
+        self._profiling_output_dir = os.path.join(
+            self._config_dir, self._get_config_value(
+                config, self.PROFILING_CONFIG_SECTION,
+                self.PROFILING_OUTPUT_DIR_CONFIG_PROP, ""))
+
+    def _load_upstream_settings(self, config):
+        """
+        Creates the retry policy, rate limiter and hedging policy for
+        DomainTools API calls from the application configuration
+
+        :param config: The application configuration
+        """
+        # Retry settings
+        self._retry_policy = self._create_retry_policy(config)
+
+        # Rate limit settings
+        self._rate_limiter = RateLimiter(
+            **self._get_rate_limit_settings(config))
+        self._metrics.set_gauge("rate_limiter_tokens",
+                                lambda: self._rate_limiter.tokens)
+
+        # Hedging settings
+        self._hedging_policy = self._create_hedging_policy(config)
+
+    def _load_cache_settings(self, config):
+        """
+        Creates the chunk store, response cache and peer cache from the
+        application configuration
+
+        :param config: The application configuration
+        """
+        # Chunking settings
+        self._chunk_store = ChunkStore(**self._get_chunking_settings(config))
+        self._metrics.set_gauge("chunk_store_bytes",
+                                lambda: self._chunk_store.pending_bytes)
+
+        # Cache settings
+        self._response_cache = ResponseCache(
+            **self._get_cache_settings(config))
+        self._metrics.set_gauge("cache_entries",
+                                lambda: len(self._response_cache))
+        self._metrics.set_gauge("cache_bytes",
+                                lambda: self._response_cache.bytes_used)
+        self._metrics.set_gauge("cache_hit_ratio",
+                                lambda: self._response_cache.hit_ratio)
+        self._metrics.set_gauge("cache_rejections",
+                                lambda: self._response_cache.rejections)
+
+        # Peer cache settings
+        self._peer_cache = PeerCache(
+            self._response_cache,
+            "{}/peercache".format(self.SERVICE_TYPE),
+            enabled=self._get_config_value(
+                config, self.PEER_CACHE_CONFIG_SECTION,
+                self.PEER_CACHE_ENABLED_CONFIG_PROP, False,
+                config.getboolean),
+            timeout=self._get_config_value(
+                config, self.PEER_CACHE_CONFIG_SECTION,
+                self.PEER_CACHE_TIMEOUT_CONFIG_PROP, 0.5, config.getfloat),
+            heartbeat_interval=self._get_config_value(
+                config, self.PEER_CACHE_CONFIG_SECTION,
+                self.PEER_CACHE_HEARTBEAT_INTERVAL_CONFIG_PROP, 10,
+                config.getfloat),
+            notify_interval=self._get_config_value(
+                config, self.PEER_CACHE_CONFIG_SECTION,
+                self.PEER_CACHE_NOTIFY_INTERVAL_CONFIG_PROP, 1,
+                config.getfloat),
+            directory_size=self._get_config_value(
+                config, self.PEER_CACHE_CONFIG_SECTION,
+                self.PEER_CACHE_DIRECTORY_SIZE_CONFIG_PROP, 100000,
+                config.getint),
+            virtual_nodes=self._get_config_value(
+                config, self.PEER_CACHE_CONFIG_SECTION,
+                self.PEER_CACHE_VIRTUAL_NODES_CONFIG_PROP, 100,
+                config.getint),
+            owner_timeout=self._get_config_value(
+                config, self.PEER_CACHE_CONFIG_SECTION,
+                self.PEER_CACHE_OWNER_TIMEOUT_CONFIG_PROP, 0.1,
+                config.getfloat))
+        self._metrics.set_gauge("peer_cache", self._peer_cache.stats)
+
+    def _load_pivot_settings(self, config):
+        """
+        Creates the pivot expander from the application configuration
+
+        :param config: The application configuration
+        """
+        # Pivot settings
+        self._pivot_expander = PivotExpander(
+            self._lookup,
+            max_nodes=self._get_config_value(
+                config, self.PIVOT_CONFIG_SECTION,
+                self.PIVOT_MAX_NODES_CONFIG_PROP, 500, config.getint),
+            max_parallel=self._get_config_value(
+                config, self.PIVOT_CONFIG_SECTION,
+                self.PIVOT_MAX_PARALLEL_CONFIG_PROP, 4, config.getint))
+        self._pivot_max_depth = self._get_config_value(
+            config, self.PIVOT_CONFIG_SECTION,
+            self.PIVOT_MAX_DEPTH_CONFIG_PROP, 3, config.getint)
+        self._pivot_max_fanout = self._get_config_value(
+            config, self.PIVOT_CONFIG_SECTION,
+            self.PIVOT_MAX_FANOUT_CONFIG_PROP, 25, config.getint)
+        self._pivot_allow_purchase = self._get_config_value(
+            config, self.PIVOT_CONFIG_SECTION,
+            self.PIVOT_ALLOW_PURCHASE_CONFIG_PROP, False, config.getboolean)
+
+    def _load_background_settings(self, config):
+        """
+        Creates the snapshot refresher and monitor scheduler from the
+        application configuration
+
+        :param config: The application configuration
+        """
+        # Snapshot settings
+        self._snapshots = SnapshotRefresher(
+            services=self._get_config_list(
+                config, self.SNAPSHOTS_CONFIG_SECTION,
+                self.SNAPSHOTS_SERVICES_CONFIG_PROP),
+            interval=self._get_config_value(
+                config, self.SNAPSHOTS_CONFIG_SECTION,
+                self.SNAPSHOTS_REFRESH_INTERVAL_CONFIG_PROP, 60,
+                config.getfloat))
+        self._metrics.set_gauge("snapshot_max_age",
+                                lambda: self._snapshots.max_age)
+
+        # Monitor settings
+        queries = []
+        if config.has_section(self.MONITOR_QUERIES_CONFIG_SECTION):
+            for query_name in config.options(
+                    self.MONITOR_QUERIES_CONFIG_SECTION):
+                queries.append(MonitorQuery.parse(query_name, config.get(
+                    self.MONITOR_QUERIES_CONFIG_SECTION, query_name)))
+        self._monitor_scheduler = MonitorScheduler(
+            queries=queries,
+            interval=self._get_config_value(
+                config, self.MONITORS_CONFIG_SECTION,
+                self.MONITORS_INTERVAL_CONFIG_PROP, 3600, config.getfloat))
+
+    def _load_client_settings(self, config):
+        """
+        Creates the fair scheduler and budget tracker from the application
+        configuration
+
+        :param config: The application configuration
+        """
+        # Fairness settings
+        self._client_key = self._get_client_key(config)
+        self._fair_scheduler = FairScheduler(
+            **self._get_fairness_settings(config))
+        self._metrics.set_gauge("fair_queue_waiting",
+                                lambda: self._fair_scheduler.waiting)
+        self._metrics.set_gauge("clients", self._fair_scheduler.stats)
+
+        # Budget settings
+        self._default_priority = self._get_default_priority(config)
+        state_file = self._get_config_value(
+            config, self.BUDGET_CONFIG_SECTION,
+            self.BUDGET_STATE_FILE_CONFIG_PROP, None)
+        self._budget_tracker = BudgetTracker(
+            state_file=os.path.join(self._config_dir, state_file)
+            if state_file else None,
+            save_interval=self._get_config_value(
+                config, self.BUDGET_CONFIG_SECTION,
+                self.BUDGET_SAVE_INTERVAL_CONFIG_PROP, 60, config.getfloat),
+            **self._get_budget_settings(config))
+        self._metrics.set_gauge("budget", self._budget_tracker.stats)
+        self._metrics.set_gauge("budget_rejections",
+                                lambda: self._budget_tracker.rejections)
+
+    def _load_diagnostics_settings(self, config):
+        """
+        Creates the memory tracker, slow request log and metrics exporter from
+        the application configuration
+
+        :param config: The application configuration
+        """
+        # Memory tracking settings
+        self._memory_tracker = MemoryTracker(
+            enabled=self._get_config_value(
+                config, self.MEMORY_TRACKING_CONFIG_SECTION,
+                self.MEMORY_TRACKING_ENABLED_CONFIG_PROP, False,
+                config.getboolean),
+            frames=self._get_config_value(
+                config, self.MEMORY_TRACKING_CONFIG_SECTION,
+                self.MEMORY_TRACKING_FRAMES_CONFIG_PROP, 1, config.getint),
+            interval=self._get_config_value(
+                config, self.MEMORY_TRACKING_CONFIG_SECTION,
+                self.MEMORY_TRACKING_INTERVAL_CONFIG_PROP, 60,
+                config.getfloat),
+            top_sites=self._get_config_value(
+                config, self.MEMORY_TRACKING_CONFIG_SECTION,
+                self.MEMORY_TRACKING_TOP_SITES_CONFIG_PROP, 10,
+                config.getint),
+            components={
+                "response_cache": lambda: self._response_cache.bytes_used,
+                "chunk_store": lambda: self._chunk_store.pending_bytes
+            })
+        self._metrics.set_gauge("memory", self._memory_tracker.stats)
+
+        # Slow request log settings
+        self._slow_request_log = SlowRequestLog(
+            **self._get_slow_request_settings(config))
+        self._metrics.set_gauge("slow_requests",
+                                lambda: self._slow_request_log.logged)
+
+        # Metrics exporter settings
+        self._metrics_exporter = MetricsExporter(
+            self._metrics,
+            port=self._get_config_value(
+                config, self.METRICS_EXPORTER_CONFIG_SECTION,
+                self.METRICS_EXPORTER_PORT_CONFIG_PROP, 0, config.getint),
+            address=self._get_config_value(
+                config, self.METRICS_EXPORTER_CONFIG_SECTION,
+                self.METRICS_EXPORTER_ADDRESS_CONFIG_PROP, "127.0.0.1"))
+
+    def _load_health_settings(self, config):
+        """
+        Reads the startup settings and starts the health monitor from the
+        application configuration
+
+        :param config: The application configuration
+        """
+        # Startup settings
+        self._prewarm = self._get_config_value(
+            config, self.STARTUP_CONFIG_SECTION,
+            self.STARTUP_PREWARM_CONFIG_PROP, True, config.getboolean)
+
+        # Health settings. Health is reported while the service starts, so
+        # that orchestrators can tell it is alive but not yet ready.
+        health_file = self._get_config_value(
+            config, self.HEALTH_CONFIG_SECTION,
+            self.HEALTH_FILE_CONFIG_PROP, None)
+        self._health_monitor = HealthMonitor(
+            self._startup_timer,
+            health_file=os.path.join(self._config_dir, health_file)
+            if health_file else None,
+            port=self._get_config_value(
+                config, self.HEALTH_CONFIG_SECTION,
+                self.HEALTH_PORT_CONFIG_PROP, 0, config.getint),
+            address=self._get_config_value(
+                config, self.HEALTH_CONFIG_SECTION,
+                self.HEALTH_ADDRESS_CONFIG_PROP, "127.0.0.1"))
+        self._health_monitor.add_detail("version", lambda: __version__)
+        self._health_monitor.add_detail("in_flight",
+                                        lambda: self._in_flight.in_flight)
+        self._health_monitor.start()
+        self._metrics.set_gauge("ready", lambda: self._health_monitor.ready)
+        self._metrics.set_gauge("startup", self._startup_timer.phases)
+
+    # Every setting is read before any is applied, so that an invalid
+    # configuration leaves the running service unchanged
+    def reload_configuration(self): # pylint: disable=too-many-locals
+        """
+        Re-reads the application configuration file and applies its settings
+        to the running service, without re-registering the service or
+        discarding its state (cached responses, rate limiter tokens, waiting
+        requests, and recorded usage are kept).
+
+        Every setting is read before any is applied, so an invalid
+        configuration leaves the current settings in place. Changes to the
+        settings in :data:`RESTART_CONFIG_SETTINGS` are not applied until the
+        service is restarted.
+
+        :return: ``dict`` containing the time of the reload and the settings
+            (``section`` or ``section/property``) which changed but require
+            a restart
+        """
+        with self._reload_lock:
+            logger.info("Reloading configuration file: %s",
+                        self._app_config_path)
+            config = ConfigParser()
+            if len(config.read(self._app_config_path)) != 1:
+                raise Exception(
+                    "Error attempting to read application configuration "
+                    "file: {0}".format(self._app_config_path))
+
+            replaying = self._record_replay_mode == MODE_REPLAY
+            api_user, api_key = self._get_api_credentials(config, replaying)
+            json_codec = self._create_json_codec(config)
+            request_log_sampler = self._create_request_log_sampler(config)
+            retry_policy = self._create_retry_policy(config)
+            rate_limit_settings = self._get_rate_limit_settings(config)
+            hedging_policy = self._create_hedging_policy(config)
+            chunking_settings = self._get_chunking_settings(config)
+            cache_settings = self._get_cache_settings(config)
+            client_key = self._get_client_key(config)
+            fairness_settings = self._get_fairness_settings(config)
+            default_priority = self._get_default_priority(config)
+            budget_settings = self._get_budget_settings(config)
+            slow_request_settings = self._get_slow_request_settings(config)
+            drain_timeout, warm_state_file = \
+                self._get_shutdown_settings(config)
+
+            if not replaying and \
+                    (api_user, api_key) != (self._api_user, self._api_key):
+                logger.info("Using new DomainTools API credentials")
+                self._api = API(api_user, api_key)
+            self._api_user, self._api_key = api_user, api_key
+            self._json_codec = json_codec
+            self._request_log_sampler = request_log_sampler
+            self._retry_policy = retry_policy
+            self._rate_limiter.reconfigure(**rate_limit_settings)
+            self._hedging_policy = hedging_policy
+            self._chunk_store.reconfigure(**chunking_settings)
+            self._response_cache.reconfigure(**cache_settings)
+            self._client_key = client_key
+            self._fair_scheduler.reconfigure(**fairness_settings)
+            self._default_priority = default_priority
+            self._budget_tracker.reconfigure(**budget_settings)
+            self._slow_request_log.reconfigure(**slow_request_settings)
+            self._drain_timeout = drain_timeout
+            self._warm_state_file = warm_state_file
+
+            restart_required = self._get_changed_settings(
+                self._config, config, self.RESTART_CONFIG_SETTINGS)
+            for setting in restart_required:
+                logger.warning("Change to '%s' requires a restart", setting)
+            self._config = config
+            self._metrics.increment("config_reloads")
+            logger.info("Configuration reloaded")
+            return {"time": time.time(), "restart_required": restart_required}
+
+    @staticmethod
+    def _get_changed_settings(old_config, new_config, settings):
+        """
+        Returns the settings which differ between two configurations
+
+        :param old_config: The previous configuration
+        :param new_config: The new configuration
+        :param settings: List of tuples containing the section and property
+            (``None`` for every property in the section) of the settings
+        :return: The list of changed settings (``section`` or
+            ``section/property``)
+        """
+        def get_values(config, section, prop):
+            if not config.has_section(section):
+                return {}
+            values = dict(config.items(section))
+            return values.get(prop.lower()) if prop else values
+
+        return [section + "/" + prop if prop else section
+                for section, prop in settings
+                if get_values(old_config, section, prop) !=
+                get_values(new_config, section, prop)]
+
+    def _get_api_credentials(self, config, replaying):
+        """
+        Returns the DomainTools API credentials from the application
+        configuration
+
+        :param config: The application configuration
+        :param replaying: Whether responses are replayed (in which case the
+            credentials are not required)
+        :return: A tuple containing the API User and API Key
+        """
+        api_user = None
+        api_key = None
+
         # API Key
         try:
-            self._api_key = config.get(self.GENERAL_CONFIG_SECTION,
-                                       self.GENERAL_API_KEY_CONFIG_PROP)
+            api_key = config.get(self.GENERAL_CONFIG_SECTION,
+                                 self.GENERAL_API_KEY_CONFIG_PROP)
         except Exception:
             pass
-        if not self._api_key:
+        if not api_key and not replaying:
             raise Exception(
                 "DomainTools API Key not found in configuration file: {0}"
                 .format(self._app_config_path))
 
         # API User
         try:
-            self._api_user = config.get(self.GENERAL_CONFIG_SECTION,
-                                        self.GENERAL_API_USER_CONFIG_PROP)
+            api_user = config.get(self.GENERAL_CONFIG_SECTION,
+                                  self.GENERAL_API_USER_CONFIG_PROP)
         except Exception:
             pass
-        if not self._api_user:
+        if not api_user and not replaying:
             raise Exception(
                 "DomainTools API User not found in configuration file: {0}"
                 .format(self._app_config_path))
 
-        self._api = API(self._api_user, self._api_key)
+        return api_user, api_key
+
+    def _create_json_codec(self, config):
+        """
+        Returns the JSON codec configured in the application configuration
+
+        :param config: The application configuration
+        :return: The :class:`dxldomaintoolsservice.codec.JsonCodec`
+        """
+        return get_codec(self._get_config_value(
+            config, self.GENERAL_CONFIG_SECTION,
+            self.GENERAL_JSON_CODEC_CONFIG_PROP, AUTO_CODEC))
+
+    def _create_request_log_sampler(self, config):
+        """
+        Returns the request log sampler configured in the application
+        configuration
+
+        :param config: The application configuration
+        :return: The :class:`dxldomaintoolsservice.asynclog.RequestLogSampler`
+        """
+        return RequestLogSampler(
+            sample_rate=self._get_config_value(
+                config, self.REQUEST_LOGGING_CONFIG_SECTION,
+                self.REQUEST_LOGGING_SAMPLE_RATE_CONFIG_PROP, 1.0,
+                config.getfloat),
+            service_sample_rates=self._get_config_section_values(
+                config, self.REQUEST_LOGGING_SAMPLE_RATES_CONFIG_SECTION,
+                1.0, config.getfloat),
+            max_payload_size=self._get_config_value(
+                config, self.REQUEST_LOGGING_CONFIG_SECTION,
+                self.REQUEST_LOGGING_MAX_PAYLOAD_SIZE_CONFIG_PROP, 1024,
+                config.getint))
+
+    def _create_retry_policy(self, config):
+        """
+        Returns the retry policy configured in the application configuration
+
+        :param config: The application configuration
+        :return: The :class:`dxldomaintoolsservice.retry.RetryPolicy`
+        """
+        return RetryPolicy(
+            max_attempts=self._get_config_value(
+                config, self.RETRY_CONFIG_SECTION,
+                self.RETRY_MAX_ATTEMPTS_CONFIG_PROP, 3, config.getint),
+            base_delay=self._get_config_value(
+                config, self.RETRY_CONFIG_SECTION,
+                self.RETRY_BASE_DELAY_CONFIG_PROP, 0.1, config.getfloat),
+            max_delay=self._get_config_value(
+                config, self.RETRY_CONFIG_SECTION,
+                self.RETRY_MAX_DELAY_CONFIG_PROP, 2.0, config.getfloat),
+            max_time=self._get_config_value(
+                config, self.RETRY_CONFIG_SECTION,
+                self.RETRY_MAX_TIME_CONFIG_PROP, 10.0, config.getfloat),
+            budget=RetryBudget(
+                ratio=self._get_config_value(
+                    config, self.RETRY_CONFIG_SECTION,
+                    self.RETRY_BUDGET_RATIO_CONFIG_PROP, 0.1,
+                    config.getfloat),
+                min_per_second=self._get_config_value(
+                    config, self.RETRY_CONFIG_SECTION,
+                    self.RETRY_BUDGET_MIN_PER_SECOND_CONFIG_PROP, 1.0,
+                    config.getfloat)))
+
+    def _get_rate_limit_settings(self, config):
+        """
+        Returns the settings of the rate limiter from the application
+        configuration
+
+        :param config: The application configuration
+        :return: ``dict`` of
+            :class:`dxldomaintoolsservice.ratelimiter.RateLimiter` parameters
+        """
+        return {
+            "per_minute": self._get_config_value(
+                config, self.RATE_LIMIT_CONFIG_SECTION,
+                self.RATE_LIMIT_PER_MINUTE_CONFIG_PROP, 0, config.getint),
+            "burst": self._get_config_value(
+                config, self.RATE_LIMIT_CONFIG_SECTION,
+                self.RATE_LIMIT_BURST_CONFIG_PROP, 1, config.getint)
+        }
+
+    def _create_hedging_policy(self, config):
+        """
+        Returns the hedging policy configured in the application
+        configuration (using the current rate limiter)
+
+        :param config: The application configuration
+        :return: The :class:`dxldomaintoolsservice.hedging.HedgingPolicy`
+        """
+        return HedgingPolicy(
+            self._metrics,
+            self._rate_limiter,
+            RetryBudget(
+                ratio=self._get_config_value(
+                    config, self.HEDGING_CONFIG_SECTION,
+                    self.HEDGING_MAX_RATIO_CONFIG_PROP, 0.05,
+                    config.getfloat),
+                min_per_second=0),
+            services=self._get_config_list(
+                config, self.HEDGING_CONFIG_SECTION,
+                self.HEDGING_SERVICES_CONFIG_PROP),
+            percentile=self._get_config_value(
+                config, self.HEDGING_CONFIG_SECTION,
+                self.HEDGING_PERCENTILE_CONFIG_PROP, 95, config.getfloat),
+            min_samples=self._get_config_value(
+                config, self.HEDGING_CONFIG_SECTION,
+                self.HEDGING_MIN_SAMPLES_CONFIG_PROP, 20, config.getint),
+            # A call and its hedge for each callback thread
+            max_threads=2 * self._callbacks_thread_count)
+
+    def _get_chunking_settings(self, config):
+        """
+        Returns the settings of the chunk store from the application
+        configuration
+
+        :param config: The application configuration
+        :return: ``dict`` of
+            :class:`dxldomaintoolsservice.chunking.ChunkStore` parameters
+        """
+        return {
+            "max_chunk_size": self._get_config_value(
+                config, self.CHUNKING_CONFIG_SECTION,
+                self.CHUNKING_MAX_CHUNK_SIZE_CONFIG_PROP, 524288,
+                config.getint),
+            "ttl": self._get_config_value(
+                config, self.CHUNKING_CONFIG_SECTION,
+                self.CHUNKING_TTL_CONFIG_PROP, 300, config.getfloat),
+            "max_pending_bytes": self._get_config_value(
+                config, self.CHUNKING_CONFIG_SECTION,
+                self.CHUNKING_MAX_PENDING_BYTES_CONFIG_PROP, 67108864,
+                config.getint)
+        }
+
+    def _get_cache_settings(self, config):
+        """
+        Returns the settings of the response cache from the application
+        configuration
+
+        :param config: The application configuration
+        :return: ``dict`` of
+            :class:`dxldomaintoolsservice.cache.ResponseCache` parameters
+        """
+        return {
+            "max_bytes": self._get_config_value(
+                config, self.CACHE_CONFIG_SECTION,
+                self.CACHE_MAX_BYTES_CONFIG_PROP, 0, config.getint),
+            "ttl": self._get_config_value(
+                config, self.CACHE_CONFIG_SECTION,
+                self.CACHE_TTL_CONFIG_PROP, 3600, config.getfloat),
+            "service_ttls": self._get_config_section_values(
+                config, self.CACHE_TTL_CONFIG_SECTION, 0, config.getfloat),
+            "compression_level": self._get_config_value(
+                config, self.CACHE_CONFIG_SECTION,
+                self.CACHE_COMPRESSION_LEVEL_CONFIG_PROP, 1, config.getint)
+        }
+
+    def _get_client_key(self, config):
+        """
+        Returns how clients are identified, from the application
+        configuration
+
+        :param config: The application configuration
+        :return: ``client`` or ``tenant``
+        """
+        client_key = self._get_config_value(
+            config, self.FAIRNESS_CONFIG_SECTION,
+            self.FAIRNESS_CLIENT_KEY_CONFIG_PROP, CLIENT_KEY_CLIENT)
+        if client_key not in (CLIENT_KEY_CLIENT, CLIENT_KEY_TENANT):
+            raise Exception(
+                "Invalid value for '{0}' in section '{1}' of configuration "
+                "file: {2}".format(self.FAIRNESS_CLIENT_KEY_CONFIG_PROP,
+                                   self.FAIRNESS_CONFIG_SECTION,
+                                   self._app_config_path))
+        return client_key
+
+    def _get_fairness_settings(self, config):
+        """
+        Returns the settings of the fair scheduler from the application
+        configuration
+
+        :param config: The application configuration
+        :return: ``dict`` of
+            :class:`dxldomaintoolsservice.fairness.FairScheduler` parameters
+        """
+        return {
+            "max_concurrent": self._get_config_value(
+                config, self.FAIRNESS_CONFIG_SECTION,
+                self.FAIRNESS_MAX_CONCURRENT_CONFIG_PROP, 0, config.getint),
+            "client_concurrency": self._get_config_value(
+                config, self.FAIRNESS_CONFIG_SECTION,
+                self.FAIRNESS_CLIENT_CONCURRENCY_CONFIG_PROP, 0,
+                config.getint),
+            "client_queue_size": self._get_config_value(
+                config, self.FAIRNESS_CONFIG_SECTION,
+                self.FAIRNESS_CLIENT_QUEUE_SIZE_CONFIG_PROP, 100,
+                config.getint),
+            "client_per_minute": self._get_config_value(
+                config, self.FAIRNESS_CONFIG_SECTION,
+                self.FAIRNESS_CLIENT_PER_MINUTE_CONFIG_PROP, 0, config.getint),
+            "client_burst": self._get_config_value(
+                config, self.FAIRNESS_CONFIG_SECTION,
+                self.FAIRNESS_CLIENT_BURST_CONFIG_PROP, 1, config.getint),
+            "weights": self._get_config_section_values(
+                config, self.CLIENT_WEIGHTS_CONFIG_SECTION, 1,
+                config.getfloat),
+            "max_wait": self._get_config_value(
+                config, self.FAIRNESS_CONFIG_SECTION,
+                self.FAIRNESS_MAX_WAIT_CONFIG_PROP, 30, config.getfloat),
+            # Requests wait for capacity on the callback pool threads
+            "thread_count": self._callbacks_thread_count
+        }
+
+    def _get_default_priority(self, config):
+        """
+        Returns the priority of requests which do not specify one, from the
+        application configuration
+
+        :param config: The application configuration
+        :return: ``low`` or ``normal``
+        """
+        default_priority = self._get_config_value(
+            config, self.BUDGET_CONFIG_SECTION,
+            self.BUDGET_DEFAULT_PRIORITY_CONFIG_PROP, PRIORITY_NORMAL)
+        if default_priority not in PRIORITIES:
+            raise Exception(
+                "Invalid value for '{0}' in section '{1}' of configuration "
+                "file: {2}".format(self.BUDGET_DEFAULT_PRIORITY_CONFIG_PROP,
+                                   self.BUDGET_CONFIG_SECTION,
+                                   self._app_config_path))
+        return default_priority
+
+    def _get_budget_settings(self, config):
+        """
+        Returns the costs and limits of services from the application
+        configuration
+
+        :param config: The application configuration
+        :return: ``dict`` of
+            :class:`dxldomaintoolsservice.budget.BudgetTracker` parameters
+        """
+        return {
+            "costs": self._get_config_section_values(
+                config, self.SERVICE_COSTS_CONFIG_SECTION, 1,
+                config.getfloat),
+            "monthly_limits": self._get_config_section_values(
+                config, self.MONTHLY_LIMITS_CONFIG_SECTION, None,
+                config.getint),
+            "reserve_ratio": self._get_config_value(
+                config, self.BUDGET_CONFIG_SECTION,
+                self.BUDGET_RESERVE_RATIO_CONFIG_PROP, 0.1, config.getfloat)
+        }
+
+    def _get_slow_request_settings(self, config):
+        """
+        Returns the settings of the slow request log from the application
+        configuration
+
+        :param config: The application configuration
+        :return: ``dict`` of
+            :class:`dxldomaintoolsservice.slowlog.SlowRequestLog` parameters
+        """
+        return {
+            "threshold": self._get_config_value(
+                config, self.SLOW_REQUESTS_CONFIG_SECTION,
+                self.SLOW_REQUESTS_THRESHOLD_CONFIG_PROP, 0, config.getfloat),
+            "service_thresholds": self._get_config_section_values(
+                config, self.SLOW_REQUEST_THRESHOLDS_CONFIG_SECTION, 0,
+                config.getfloat),
+            "size": self._get_config_value(
+                config, self.SLOW_REQUESTS_CONFIG_SECTION,
+                self.SLOW_REQUESTS_SIZE_CONFIG_PROP, 100, config.getint)
+        }
+
+    def _get_shutdown_settings(self, config):
+        """
+        Returns the shutdown settings from the application configuration
+
+        :param config: The application configuration
+        :return: A tuple containing the drain timeout (in seconds) and the
+            warm state file (``None`` if not set)
+        """
+        warm_state_file = self._get_config_value(
+            config, self.SHUTDOWN_CONFIG_SECTION,
+            self.SHUTDOWN_STATE_FILE_CONFIG_PROP, None)
+        return (
+            self._get_config_value(
+                config, self.SHUTDOWN_CONFIG_SECTION,
+                self.SHUTDOWN_DRAIN_TIMEOUT_CONFIG_PROP, 10, config.getfloat),
+            # Relative to the configuration directory (the config volume when
+            # running in a container)
+            os.path.join(self._config_dir, warm_state_file)
+            if warm_state_file else None)
+
+    def _get_config_value(self, config, section, prop, default, getter=None):
+        """
+        Returns the value of an optional property from the application
+        configuration
+
+        :param config: The application configuration
+        :param section: The configuration section
+        :param prop: The configuration property
+        :param default: The value to return if the property is not set
+        :param getter: The configuration method used to read (and convert)
+            the value (defaults to ``config.get``)
+        :return: The value of the property
+        """
+        if getter is None:
+            getter = config.get
+        try:
+            if config.has_option(section, prop) and \
+                    config.get(section, prop).strip():
+                return getter(section, prop)
+        except ValueError:
+            raise Exception(
+                "Invalid value for '{0}' in section '{1}' of configuration "
+                "file: {2}".format(prop, section, self._app_config_path))
+        return default
+
+    def _get_config_section_values(self, config, section, default, getter):
+        """
+        Returns the values of every property in an optional section of the
+        application configuration
+
+        :param config: The application configuration
+        :param section: The configuration section
+        :param default: The value of properties which are not set
+        :param getter: The configuration method used to read (and convert)
+            the values
+        :return: ``dict`` mapping property names to values (empty if the
+            section is not present)
+        """
+        values = {}
+        if config.has_section(section):
+            for prop in config.options(section):
+                values[prop] = self._get_config_value(config, section, prop,
+                                                      default, getter)
+        return values
+
+    def _get_config_list(self, config, section, prop):
+        """
+        Returns the comma-separated values of an optional property from the
+        application configuration
+
+        :param config: The application configuration
+        :param section: The configuration section
+        :param prop: The configuration property
+        :return: The list of values (empty if the property is not set)
+        """
+        value = self._get_config_value(config, section, prop, "")
+        return [item.strip() for item in value.split(",") if item.strip()]
 
     def on_dxl_connect(self):
         """
@@ -117,58 +1575,349 @@ class DomainToolsService(Application):
         """
         logger.info("On 'DXL connect' callback.")
 
+        # Snapshots are refreshed using the request callbacks so that the
+        # refreshes are subject to the retry policy and rate limit
+        self._snapshots.start(dict(
+            (service_name,
+             lambda callback=callback: callback.fetch_payload({}))
+            for service_name, callback in self._request_callbacks.items()))
+
+        # Monitor queries are polled using the request callbacks for the same
+        # reason
+        self._monitor_scheduler.start(self._fetch_monitor,
+                                      self._publish_monitor_event)
+
+        self._memory_tracker.start()
+        self._metrics_exporter.start()
+        self._peer_cache.start(self._dxl_client)
+
+        self._startup_timer.mark("start")
+        self._health_monitor.set_status(STATUS_READY)
+        logger.info("Service ready in %.3fs (%s)",
+                    self._startup_timer.finish(),
+                    self._startup_timer.format())
+
+    def _fetch_monitor(self, service_name, params):
+        """
+        Returns the response of a monitor service
+
+        :param service_name: The name of the monitor service
+        :param params: The request parameters
+        :return: The response (as a Python object)
+        """
+        return self._json_codec.loads(
+            self._request_callbacks[service_name].fetch_payload(params))
+
+    def _lookup(self, service_name, params, timeout, priority,
+                client_key=None):
+        """
+        Invokes a DomainTools API method on behalf of a pivot request
+
+        :param service_name: The name of the DomainTools API method
+        :param params: The request parameters
+        :param timeout: The time (in seconds) the caller is willing to wait
+        :param priority: The priority of the request
+        :param client_key: The key of the client the pivot is expanded for
+        :return: The DomainTools API response data
+        """
+        return self._request_callbacks[service_name].lookup(
+            params, timeout, priority or self._default_priority, client_key)
+
+    def _publish_monitor_event(self, query, payload):
+        """
+        Publishes the changes to the results of a monitor query
+
+        :param query: The :class:`dxldomaintoolsservice.monitors.MonitorQuery`
+        :param payload: The event payload (``dict``)
+        """
+        logger.info("Publishing monitor event on topic: '%s' (%d added, "
+                    "%d removed)", query.topic, len(payload["added"]),
+                    len(payload["removed"]))
+        event = Event(query.topic)
+        event.payload = self._json_codec.dumps(payload)
+        self._dxl_client.send_event(event)
+        self._metrics.increment("monitor_events", query.service)
+
+    def _restore_warm_state(self):
+        """
+        Restores the cached responses, rate limiter tokens, usage and monitor
+        results saved to the warm state file when the service was last shut
+        down
+        """
+        if not self._warm_state_file:
+            return
+        state = load_warm_state(self._warm_state_file)
+        if state is None:
+            return
+        restored = self._response_cache.restore_entries(state["cache"])
+        if state.get("rate_limiter"):
+            self._rate_limiter.restore_state(state["rate_limiter"])
+        self._fair_scheduler.restore_limiter_states(
+            state.get("client_limiters", {}))
+        if state.get("budget") and not self._budget_tracker.has_state_file:
+            self._budget_tracker.restore_state(state["budget"])
+        self._monitor_scheduler.restore_state(state.get("monitors", {}))
+        logger.info("Restored warm state from: %s (saved %.0fs ago, %d "
+                    "cached responses)", self._warm_state_file,
+                    time.time() - state["time"], restored)
+
+    def _save_warm_state(self):
+        """
+        Writes the cached responses, rate limiter tokens, usage and monitor
+        results to the warm state file, to be restored when the service is
+        next started
+        """
+        # Only saved if the service started, so that a failed start (the DXL
+        # client is created before it connects) does not replace the state
+        # saved by the previous run
+        if not self._warm_state_file or not self._started:
+            return
+        try:
+            cache_entries = self._response_cache.get_entries()
+            save_warm_state(
+                self._warm_state_file, cache_entries,
+                self._rate_limiter.get_state(),
+                self._fair_scheduler.get_limiter_states(),
+                # Usage is already persisted if the budget has a state file
+                None if self._budget_tracker.has_state_file
+                else self._budget_tracker.get_state(),
+                self._monitor_scheduler.get_state())
+            logger.info("Saved warm state to: %s (%d cached responses)",
+                        self._warm_state_file, len(cache_entries))
+        except (IOError, OSError):
+            logger.exception("Error writing warm state file: %s",
+                             self._warm_state_file)
+
+    def drain(self):
+        """
+        Stops the service from receiving new requests, and waits (up to the
+        drain timeout) for the requests in flight (including those queued for
+        a callback thread) to complete. Requests which are still queued when
+        the timeout elapses are dropped.
+
+        The service is unregistered so that the broker routes new requests
+        to other instances, but its request callbacks remain in place so
+        that requests which were already delivered are still answered.
+        """
+        if self._dxl_client is None or not self._services:
+            return
+        self._health_monitor.set_status(STATUS_DRAINING)
+        logger.info("Draining requests (%d in flight)",
+                    self._in_flight.in_flight)
+        services, self._services = self._services, []
+        for service in services:
+            try:
+                self._dxl_client.unregister_service_sync(
+                    service, self.DXL_SERVICE_REGISTRATION_TIMEOUT)
+            except Exception: # pylint: disable=broad-except
+                logger.exception("Error unregistering service")
+        for topic, (callback, separate_thread) in \
+                self._topic_callbacks.items():
+            self._dxl_client.add_request_callback(
+                topic, self._wrap_request_callback(callback, separate_thread))
+        if self._in_flight.wait_idle(self._drain_timeout):
+            logger.info("Drained requests")
+        else:
+            logger.warning("Timed out draining requests (%d in flight)",
+                           self._in_flight.in_flight)
+        # Requests still queued are dropped, as shutting down the callback
+        # pool would otherwise wait for them
+        self._in_flight.close()
+
+    def destroy(self):
+        """
+        Destroys the application (drains requests, stops background threads,
+        disconnects from fabric, frees resources, and then saves the warm
+        state, once no requests can change it)
+        """
+        if not self._running or self._destroyed:
+            return
+        # Peers stop requesting cached responses before the service drains
+        self._peer_cache.stop()
+        self.drain()
+        if self._snapshots is not None:
+            self._snapshots.stop()
+        if self._monitor_scheduler is not None:
+            self._monitor_scheduler.stop()
+        self._memory_tracker.stop()
+        if self._metrics_exporter is not None:
+            self._metrics_exporter.stop()
+        super(DomainToolsService, self).destroy()
+        self._save_warm_state()
+        if self._budget_tracker is not None:
+            self._budget_tracker.save()
+        if self._response_recorder is not None:
+            self._response_recorder.close()
+            self._response_recorder = None
+        self._health_monitor.set_status(STATUS_STOPPED)
+        self._health_monitor.stop()
+
+    def add_request_callback(self, service, topic, callback, separate_thread):
+        """
+        Adds a DXL request message callback to the application (recording it
+        so that it can keep answering requests while the service drains).
+
+        :param service: The service to associate the request callback with
+        :param topic: The topic to associate with the callback
+        :param callback: The request callback
+        :param separate_thread: Whether to invoke the callback on a thread
+            other than the incoming message thread
+        """
+        self._topic_callbacks[topic] = (callback, separate_thread)
+        super(DomainToolsService, self).add_request_callback(
+            service, topic,
+            self._wrap_request_callback(callback, separate_thread), False)
+
+    def _wrap_request_callback(self, callback, separate_thread):
+        """
+        Returns the callback registered for a request callback
+
+        :param callback: The request callback
+        :param separate_thread: Whether to invoke the callback on a thread
+            other than the incoming message thread
+        :return: The callback to register
+        """
+        if not separate_thread:
+            return callback
+        # Requests are counted as in flight while queued, so that draining
+        # also waits for them
+        return QueuedRequestCallback(self._in_flight,
+                                     self._get_callbacks_pool(), callback)
+
+    def prewarm(self):
+        """
+        Validates the DomainTools API credentials and connection by fetching
+        the account information (which also primes the usage limits of the
+        budget and the rate limits of the DomainTools API client), so that
+        the service is only registered once it can answer requests.
+        """
+        if not self._prewarm or self._record_replay_mode == MODE_REPLAY:
+            return
+        logger.info("Pre-warming DomainTools API client")
+        try:
+            account_info = self._json_codec.loads(
+                self._request_callbacks["account_information"].fetch_payload(
+                    {}))
+        except Exception as ex:
+            raise Exception(
+                "Unable to use the DomainTools API: {0}".format(
+                    getattr(ex, "reason", None) or str(ex) or
+                    ex.__class__.__name__))
+        if isinstance(account_info, dict):
+            prime_api_rate_limits(self._api, account_info)
+
+    def on_register_event_handlers(self):
+        """
+        Invoked when event handlers should be registered with the application
+        """
+        if self._peer_cache.enabled:
+            logger.info("Registering event callback: "
+                        "domaintools_peercache_eventhandler")
+            self.add_event_callback(self._peer_cache.event_topic,
+                                    PeerCacheEventCallback(self), False)
+
     def on_register_services(self):
         """
         Invoked when services should be registered with the application
         """
-        # For methods where "query" is the only required parameter (the
-        # majority)
-        query_param = ["query"]
-
-        # List of callbacks to register. Each item's key is the name of the
-        # service to register. The associated value for each item is a list
-        # of parameters which are required when invoking the service.
-        callbacks = OrderedDict((
-            ("account_information", None),
-            ("brand_monitor", query_param),
-            ("domain_profile", query_param),
-            ("domain_search", query_param),
-            ("domain_suggestions", query_param),
-            ("host_domains", ["ip"]),
-            ("hosting_history", query_param),
-            ("ip_monitor", query_param),
-            ("ip_registrant_monitor", query_param),
-            ("iris", None),
-            ("name_server_monitor", query_param),
-            ("parsed_whois", query_param),
-            ("phisheye", query_param),
-            ("phisheye_term_list", None),
-            ("registrant_monitor", query_param),
-            ("reputation", query_param),
-            ("reverse_ip", ["domain"]),
-            ("reverse_ip_whois", None),
-            ("reverse_name_server", query_param),
-            ("reverse_whois", query_param),
-            ("whois", query_param),
-            ("whois_history", query_param)))
+        self._startup_timer.mark("connect")
+
+        # The parameters accepted by each service are validated using
+        # validators compiled from the service schema
+        validators = load_validators(self.SERVICE_TYPE)
 
         # Register service 'domaintools_service'
         logger.info("Registering service: domaintools_service")
         service = ServiceRegistrationInfo(
             self._dxl_client,
-            "/opendxl-domaintools/service/domaintools")
+            self.SERVICE_TYPE)
 
-        for service_name, required_params in callbacks.items():
+        # Requests are handled on the callback thread pool, as they can wait
+        # for capacity (see the "Fairness" section), and peers are queried
+        # with synchronous DXL requests. Blocking the DXL client's incoming
+        # message threads would stall every other callback.
+        for service_name in self.DOMAINTOOLS_SERVICES:
             logger.info(
                 "Registering request callback: domaintools_%s_requesthandler",
                 service_name)
+            callback = DomainToolsRequestCallback(
+                self, service_name, validator=validators.get(service_name))
+            self._request_callbacks[service_name] = callback
             self.add_request_callback(service,
                                       "{}/{}".format(self.SERVICE_TYPE,
                                                      service_name),
-                                      DomainToolsRequestCallback(
-                                          self,
-                                          service_name,
-                                          required_params),
+                                      callback, True)
+
+        if self._peer_cache.enabled:
+            logger.info("Registering request callback: "
+                        "domaintools_peercache_requesthandler")
+            self.add_request_callback(service,
+                                      self._peer_cache.request_topic,
+                                      PeerCacheRequestCallback(self),
                                       False)
 
+        # Pivots are expanded on the callback thread pool, as expanding a
+        # graph can take a number of DomainTools API calls
+        logger.info("Registering request callback: "
+                    "domaintools_pivot_requesthandler")
+        self.add_request_callback(
+            service, "{}/pivot".format(self.SERVICE_TYPE),
+            PivotRequestCallback(self, self._pivot_expander,
+                                 self._pivot_max_depth,
+                                 self._pivot_max_fanout,
+                                 self._pivot_allow_purchase),
+            True)
+
+        logger.info("Registering request callback: "
+                    "domaintools_metrics_requesthandler")
+        self.add_request_callback(service,
+                                  "{}/metrics".format(self.SERVICE_TYPE),
+                                  MetricsRequestCallback(self),
+                                  False)
+
+        logger.info("Registering request callback: "
+                    "domaintools_slowrequests_requesthandler")
+        self.add_request_callback(service,
+                                  "{}/slowrequests".format(self.SERVICE_TYPE),
+                                  SlowRequestsRequestCallback(self),
+                                  False)
+
+        logger.info("Registering request callback: "
+                    "domaintools_profile_requesthandler")
+        self.add_request_callback(
+            service, "{}/profile".format(self.SERVICE_TYPE),
+            ProfileRequestCallback(self, self._profiling_token,
+                                   self._profiling_allowed_clients,
+                                   self._profiling_output_dir),
+            True)
+
+        logger.info("Registering request callback: "
+                    "domaintools_reload_requesthandler")
+        self.add_request_callback(
+            service, "{}/reload".format(self.SERVICE_TYPE),
+            ReloadRequestCallback(self, self._reload_token,
+                                  self._reload_allowed_clients),
+            False)
+
+        logger.info("Registering request callback: "
+                    "domaintools_health_requesthandler")
+        self.add_request_callback(service,
+                                  "{}/health".format(self.SERVICE_TYPE),
+                                  HealthRequestCallback(self),
+                                  False)
+
+        logger.info("Registering request callback: "
+                    "domaintools_chunk_requesthandler")
+        self.add_request_callback(service, CHUNK_TOPIC,
+                                  ChunkRequestCallback(self),
+                                  False)
+
+        # The DomainTools API client is validated before the service is
+        # registered, so that requests are only routed to the service once
+        # it can answer them
+        self.prewarm()
+        self._startup_timer.mark("prewarm")
+
         self.register_service(service)
+        self._started = True
+        self._startup_timer.mark("register")
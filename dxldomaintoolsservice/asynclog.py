@@ -0,0 +1,196 @@
+from __future__ import absolute_import
+import logging
+import random
+import threading
+
+from dxldomaintoolsservice._compat import Queue, Full
+
+#: The maximum number of log records waiting to be written
+DEFAULT_QUEUE_SIZE = 10000
+
+# The writer started by start_async_logging
+_writer = None
+
+
+class AsyncLogWriter(object):
+    """
+    Writes log records to their handlers from a background thread, so that
+    threads handling requests do not block on (or spend time) formatting and
+    writing log messages. When the queue of records is full, records are
+    dropped rather than blocking the logging thread.
+    """
+
+    def __init__(self, queue_size=DEFAULT_QUEUE_SIZE):
+        """
+        Constructor parameters:
+
+        :param queue_size: The maximum number of records waiting to be
+            written
+        """
+        self._queue = Queue(queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._dropped = 0
+
+    @property
+    def dropped(self):
+        """
+        The number of log records dropped because the queue was full
+        """
+        return self._dropped
+
+    def start(self):
+        """
+        Starts the background thread
+        """
+        self._thread = threading.Thread(target=self._run,
+                                        name="AsyncLogWriter")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Writes the records in the queue and stops the background thread
+        """
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def put(self, record, handlers):
+        """
+        Queues a log record to be written to the specified handlers
+
+        :param record: The log record
+        :param handlers: The handlers to write the record to
+        """
+        try:
+            self._queue.put_nowait((record, handlers))
+        except Full:
+            # Records are put by every thread which logs
+            with self._lock:
+                self._dropped += 1
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            record, handlers = item
+            for handler in handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+
+class _QueuingHandler(logging.Handler):
+    """
+    Handler which passes records to an :class:`AsyncLogWriter`, to be written
+    to the handlers it replaced
+    """
+
+    def __init__(self, writer, handlers):
+        super(_QueuingHandler, self).__init__()
+        self._writer = writer
+        self._handlers = handlers
+
+    def emit(self, record):
+        try:
+            # The message arguments and exception are rendered now, as they
+            # may change (or be released) before the record is written
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                if not record.exc_text:
+                    record.exc_text = logging.Formatter().formatException(
+                        record.exc_info)
+                record.exc_info = None
+            self._writer.put(record, self._handlers)
+        except Exception: # pylint: disable=broad-except
+            self.handleError(record)
+
+    def close(self):
+        for handler in self._handlers:
+            handler.close()
+        super(_QueuingHandler, self).close()
+
+
+def start_async_logging(queue_size=DEFAULT_QUEUE_SIZE):
+    """
+    Replaces the handlers of the configured loggers (the root logger and any
+    logger with its own handlers) with handlers which write records from a
+    background thread
+
+    :param queue_size: The maximum number of records waiting to be written
+    :return: The :class:`AsyncLogWriter`
+    """
+    global _writer # pylint: disable=global-statement
+    writer = AsyncLogWriter(queue_size)
+    loggers = [logging.getLogger()] + [
+        logger for logger in logging.Logger.manager.loggerDict.values()
+        if isinstance(logger, logging.Logger)]
+    for logger in loggers:
+        handlers = list(logger.handlers)
+        if handlers:
+            for handler in handlers:
+                logger.removeHandler(handler)
+            logger.addHandler(_QueuingHandler(writer, handlers))
+    writer.start()
+    _writer = writer
+    return writer
+
+
+def dropped_records():
+    """
+    Returns the number of log records dropped by the writer started by
+    :func:`start_async_logging`
+
+    :return: The number of dropped records (``0`` if asynchronous logging is
+        not enabled)
+    """
+    return _writer.dropped if _writer else 0
+
+
+class RequestLogSampler(object):
+    """
+    Determines which requests are logged, and how much of their payloads
+    """
+
+    def __init__(self, sample_rate=1.0, service_sample_rates=None,
+                 max_payload_size=1024):
+        """
+        Constructor parameters:
+
+        :param sample_rate: The fraction of requests logged
+        :param service_sample_rates: ``dict`` mapping service names to the
+            fraction of requests for that service which are logged,
+            overriding ``sample_rate``
+        :param max_payload_size: The maximum number of bytes of each request
+            payload logged (``0`` for no limit)
+        """
+        self._sample_rate = sample_rate
+        self._service_sample_rates = dict(service_sample_rates or {})
+        self._max_payload_size = max_payload_size
+
+    def should_log(self, service):
+        """
+        Returns whether a request for the specified service should be logged
+
+        :param service: The name of the service
+        :return: Whether the request should be logged
+        """
+        rate = self._service_sample_rates.get(service, self._sample_rate)
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    def format_payload(self, payload):
+        """
+        Returns the (possibly truncated) payload of a request for logging
+
+        :param payload: The request payload (``bytes``)
+        :return: The payload (``str``)
+        """
+        payload = payload or b""
+        if self._max_payload_size and len(payload) > self._max_payload_size:
+            return u"{}... ({} bytes)".format(
+                payload[:self._max_payload_size].decode("utf-8", "replace"),
+                len(payload))
+        return payload.decode("utf-8", "replace")
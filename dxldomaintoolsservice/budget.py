@@ -0,0 +1,391 @@
+from __future__ import absolute_import
+import json
+import logging
+import os
+import threading
+import time
+
+from dxldomaintoolsservice.shutdown import replace_file
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+#: The request "other field" used by callers to indicate the priority of the
+#: request (``low`` or ``normal``)
+PRIORITY_OTHER_FIELD = "priority"
+#: Low priority requests are rejected when a service nears its limit
+PRIORITY_LOW = "low"
+#: Normal priority requests are rejected only when a service reaches its limit
+PRIORITY_NORMAL = "normal"
+#: The supported priorities
+PRIORITIES = (PRIORITY_LOW, PRIORITY_NORMAL)
+
+#: The DomainTools API products (as identified in ``account_information``
+#: responses) and the services which draw on the quota of each product
+PRODUCT_SERVICES = {
+    "account-information": ("account_information",),
+    "domain-profile": ("domain_profile",),
+    "domain-search": ("domain_search",),
+    "domain-suggestions": ("domain_suggestions",),
+    "hosting-history": ("hosting_history",),
+    "ip-monitor": ("ip_monitor",),
+    "ip-registrant-monitor": ("ip_registrant_monitor",),
+    "iris": ("iris",),
+    "mark-alert": ("brand_monitor",),
+    "name-server-monitor": ("name_server_monitor",),
+    "parsed-whois": ("parsed_whois",),
+    "phisheye": ("phisheye", "phisheye_term_list"),
+    "registrant-alert": ("registrant_monitor",),
+    "reputation": ("reputation",),
+    "reverse-ip": ("reverse_ip", "host_domains"),
+    "reverse-ip-whois": ("reverse_ip_whois",),
+    "reverse-name-server": ("reverse_name_server",),
+    "reverse-whois": ("reverse_whois",),
+    "whois": ("whois",),
+    "whois-history": ("whois_history",)
+}
+
+_SERVICE_PRODUCTS = dict((service, product)
+                         for product, services in PRODUCT_SERVICES.items()
+                         for service in services)
+
+
+def _current_month():
+    return time.strftime("%Y-%m", time.gmtime())
+
+
+def get_product(name):
+    """
+    Returns the DomainTools API product whose quota a service draws on
+
+    :param name: The name of the service (or of the product)
+    :return: The product identifier
+    """
+    return _SERVICE_PRODUCTS.get(name, name.replace("_", "-"))
+
+
+def _to_int(value):
+    """
+    Converts a limit or usage value from an ``account_information`` response
+    (which are strings, or ``null`` if not applicable)
+    """
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def get_account_products(account_info):
+    """
+    Returns the products listed in an ``account_information`` response
+
+    :param account_info: The ``account_information`` response
+    :return: The list of products (``dict``), or ``None`` if the response does
+        not list any
+    """
+    response = account_info.get("response", account_info)
+    products = response.get("products") if isinstance(response, dict) \
+        else None
+    return products if isinstance(products, list) else None
+
+
+class BudgetTracker(object):
+    """
+    Tracks the DomainTools API usage of each service against its monthly and
+    absolute limits, so that low priority requests can be throttled before a
+    limit is reached rather than all requests failing once it is.
+
+    Usage and limits are tracked per DomainTools API product, so that the
+    services which draw on the same quota (see :data:`PRODUCT_SERVICES`)
+    share it. Each call to the DomainTools API is charged the cost of its
+    service (see ``costs``). Limits are learned from ``account_information``
+    responses (see :meth:`update_from_account`) and can be overridden by
+    configuration. Usage is persisted to a state file so that it survives
+    restarts.
+    """
+
+    def __init__(self, state_file=None, costs=None, monthly_limits=None,
+                 reserve_ratio=0.1, save_interval=60):
+        """
+        Constructor parameters:
+
+        :param state_file: The file that usage is persisted to (optional)
+        :param costs: ``dict`` mapping service names to the cost of a call
+            (defaults to ``1``)
+        :param monthly_limits: ``dict`` mapping service (or product) names to
+            their monthly limit, overriding the limits learned from
+            ``account_information``
+        :param reserve_ratio: The fraction of each limit reserved for normal
+            priority requests
+        :param save_interval: The minimum time (in seconds) between writes of
+            the state file
+        """
+        self._state_file = state_file
+        self._costs = dict(costs or {})
+        self._configured_limits = self._get_product_limits(monthly_limits)
+        self._reserve_ratio = reserve_ratio
+        self._save_interval = save_interval
+        self._month = _current_month()
+        self._month_used = {}
+        self._absolute_used = {}
+        self._monthly_limits = {}
+        self._absolute_limits = {}
+        self._rejections = 0
+        self._last_save = 0
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._load()
+
+    @property
+    def rejections(self):
+        """
+        The number of requests rejected because of a limit
+        """
+        return self._rejections
+
+    def reconfigure(self, costs=None, monthly_limits=None, reserve_ratio=0.1):
+        """
+        Changes the costs and limits of services, keeping the recorded usage
+
+        :param costs: ``dict`` mapping service names to the cost of a call
+        :param monthly_limits: ``dict`` mapping service (or product) names to
+            their monthly limit, overriding the limits learned from
+            ``account_information``
+        :param reserve_ratio: The fraction of each limit reserved for normal
+            priority requests
+        """
+        with self._lock:
+            self._costs = dict(costs or {})
+            self._configured_limits = self._get_product_limits(
+                monthly_limits)
+            self._reserve_ratio = reserve_ratio
+
+    @staticmethod
+    def _get_product_limits(monthly_limits):
+        # The services which share a product share its (lowest) limit
+        limits = {}
+        for name, limit in (monthly_limits or {}).items():
+            if limit is not None:
+                product = get_product(name)
+                limits[product] = min(limit, limits.get(product, limit))
+        return limits
+
+    def cost(self, service):
+        """
+        Returns the cost of a DomainTools API call for the specified service
+
+        :param service: The name of the service
+        :return: The cost
+        """
+        return self._costs.get(service, 1)
+
+    def stats(self):
+        """
+        Returns the usage and limits of each DomainTools API product
+
+        :return: ``dict`` mapping product identifiers to their usage, limits
+            and the services which draw on them
+        """
+        with self._lock:
+            self._roll_month()
+            products = set(self._month_used) | set(self._absolute_used) | \
+                set(self._monthly_limits) | set(self._absolute_limits) | \
+                set(self._configured_limits)
+            return dict((product, {
+                "services": list(PRODUCT_SERVICES.get(product, ())),
+                "month_used": self._month_used.get(product, 0),
+                "per_month_limit": self._monthly_limit(product),
+                "absolute_used": self._absolute_used.get(product, 0),
+                "absolute_limit": self._absolute_limits.get(product)
+            }) for product in products)
+
+    def admit(self, service, priority=PRIORITY_NORMAL):
+        """
+        Charges a DomainTools API call to the specified service if it is
+        within the budget of its product, otherwise raises an exception.
+        Normal priority calls are rejected when they would exceed a limit;
+        low priority calls are rejected when they would use the reserved
+        fraction of a limit. The check and the charge are made atomically, so
+        that concurrent calls can not overshoot a limit. If the call is not
+        made after all, the charge is returned with :meth:`refund`.
+
+        :param service: The name of the service
+        :param priority: The priority of the request
+        """
+        cost = self.cost(service)
+        product = get_product(service)
+        reserve = self._reserve_ratio if priority == PRIORITY_LOW else 0
+        with self._lock:
+            self._roll_month()
+            for kind, used, limit in (
+                    ("monthly", self._month_used.get(product, 0),
+                     self._monthly_limit(product)),
+                    ("absolute", self._absolute_used.get(product, 0),
+                     self._absolute_limits.get(product))):
+                if limit is not None and \
+                        used + cost > limit * (1 - reserve):
+                    self._rejections += 1
+                    raise Exception(
+                        "The {} budget for '{}' is {}".format(
+                            kind, product,
+                            "reserved for normal priority requests"
+                            if reserve and used + cost <= limit
+                            else "exhausted"))
+            self._charge(product, cost)
+        self._save_if_due()
+
+    def record(self, service):
+        """
+        Charges an additional DomainTools API call to the specified service
+        (for example, a hedged call), without checking its budget
+
+        :param service: The name of the service
+        """
+        with self._lock:
+            self._roll_month()
+            self._charge(get_product(service), self.cost(service))
+        self._save_if_due()
+
+    def refund(self, service):
+        """
+        Returns the charge of a call admitted by :meth:`admit` which did not
+        reach the DomainTools API
+
+        :param service: The name of the service
+        """
+        with self._lock:
+            self._roll_month()
+            self._charge(get_product(service), -self.cost(service))
+        self._save_if_due()
+
+    def _charge(self, product, cost):
+        self._month_used[product] = max(
+            0, self._month_used.get(product, 0) + cost)
+        self._absolute_used[product] = max(
+            0, self._absolute_used.get(product, 0) + cost)
+        self._dirty = True
+
+    def update_from_account(self, account_info):
+        """
+        Updates the limits (and usage) of each DomainTools API product from
+        an ``account_information`` response (see :data:`PRODUCT_SERVICES`
+        for the services which draw on each product).
+
+        :param account_info: The ``account_information`` response
+        """
+        products = get_account_products(account_info)
+        if products is None:
+            return
+        with self._lock:
+            self._roll_month()
+            for product in products:
+                if not isinstance(product, dict) or "id" not in product:
+                    continue
+                product_id = str(product["id"])
+                self._monthly_limits[product_id] = _to_int(
+                    product.get("per_month_limit"))
+                self._absolute_limits[product_id] = _to_int(
+                    product.get("absolute_limit"))
+                # Usage reported by DomainTools includes other users of the
+                # same API key, but lags behind the usage recorded locally
+                usage = product.get("usage") or {}
+                month = _to_int(usage.get("month"))
+                if month is not None and \
+                        month > self._month_used.get(product_id, 0):
+                    self._month_used[product_id] = month
+            self._dirty = True
+        self._save_if_due()
+
+    def save(self):
+        """
+        Writes the usage to the state file (if one is configured)
+        """
+        if not self._state_file:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            state = self._get_state()
+            self._dirty = False
+            self._last_save = time.time()
+        temp_file = self._state_file + ".tmp"
+        try:
+            with open(temp_file, "w") as state_stream:
+                json.dump(state, state_stream)
+            replace_file(temp_file, self._state_file)
+        except (IOError, OSError):
+            logger.exception("Error writing budget state file: %s",
+                             self._state_file)
+
+    @property
+    def has_state_file(self):
+        """
+        Whether usage is persisted to a state file
+        """
+        return bool(self._state_file)
+
+    def get_state(self):
+        """
+        Returns the usage and limits learned from the DomainTools API, to be
+        restored after a restart (see :meth:`restore_state`)
+
+        :return: ``dict`` containing the usage and limits
+        """
+        with self._lock:
+            return self._get_state()
+
+    def restore_state(self, state):
+        """
+        Restores the usage and limits
+
+        :param state: The usage and limits (see :meth:`get_state`)
+        """
+        with self._lock:
+            self._restore_state(state)
+            self._dirty = True
+
+    def _get_state(self):
+        return {
+            "month": self._month,
+            "month_used": dict(self._month_used),
+            "absolute_used": dict(self._absolute_used),
+            "monthly_limits": dict(self._monthly_limits),
+            "absolute_limits": dict(self._absolute_limits)
+        }
+
+    def _restore_state(self, state):
+        if state.get("month") == self._month:
+            self._month_used = state.get("month_used", {})
+        self._absolute_used = state.get("absolute_used", {})
+        self._monthly_limits = state.get("monthly_limits", {})
+        self._absolute_limits = state.get("absolute_limits", {})
+
+    def _save_if_due(self):
+        if self._state_file and \
+                time.time() - self._last_save >= self._save_interval:
+            self.save()
+
+    def _load(self):
+        if not self._state_file or not os.path.exists(self._state_file):
+            return
+        try:
+            with open(self._state_file) as state_stream:
+                state = json.load(state_stream)
+        except (IOError, OSError, ValueError):
+            logger.exception("Error reading budget state file: %s",
+                             self._state_file)
+            return
+        self._restore_state(state)
+        self._last_save = time.time()
+
+    def _monthly_limit(self, product):
+        if product in self._configured_limits:
+            return self._configured_limits[product]
+        return self._monthly_limits.get(product)
+
+    def _roll_month(self):
+        month = _current_month()
+        if month != self._month:
+            self._month = month
+            self._month_used = {}
+            self._dirty = True
@@ -0,0 +1,338 @@
+from __future__ import absolute_import
+from collections import OrderedDict
+import json
+import threading
+import time
+import zlib
+
+
+class FrequencySketch(object):
+    """
+    Count-Min sketch of approximate access frequencies, used by the
+    :class:`ResponseCache` for TinyLFU-style admission.
+
+    Each counter saturates at 15, and all counters are halved after a fixed
+    number of accesses so that the sketch reflects recent popularity.
+    """
+
+    #: The number of rows (hash functions) in the sketch
+    DEPTH = 4
+    #: The maximum value of a counter
+    MAX_COUNT = 15
+
+    def __init__(self, width=4096):
+        """
+        Constructor parameters:
+
+        :param width: The number of counters per row
+        """
+        self._width = max(1024, width)
+        self._counters = bytearray(self._width * self.DEPTH)
+        self._sample_size = 10 * self._width
+        self._additions = 0
+
+    def _indexes(self, key):
+        hash1 = hash(key)
+        hash2 = (hash1 >> 16) | 1
+        return [row * self._width + (hash1 + row * hash2) % self._width
+                for row in range(self.DEPTH)]
+
+    def increment(self, key):
+        """
+        Records an access of the specified key
+
+        :param key: The key
+        """
+        for index in self._indexes(key):
+            if self._counters[index] < self.MAX_COUNT:
+                self._counters[index] += 1
+        self._additions += 1
+        if self._additions >= self._sample_size:
+            self._reset()
+
+    def frequency(self, key):
+        """
+        Returns the approximate access frequency of the specified key
+
+        :param key: The key
+        :return: The approximate frequency
+        """
+        return min(self._counters[index] for index in self._indexes(key))
+
+    def _reset(self):
+        self._counters = bytearray(count >> 1 for count in self._counters)
+        self._additions //= 2
+
+
+class ResponseCache(object):
+    """
+    Cache of DomainTools API responses.
+
+    Responses are stored in a single canonical form (the JSON payload) per
+    lookup. The cache key does not include the requested ``format``, so JSON
+    and XML requests for the same lookup share one cache entry (and one
+    DomainTools API call).
+
+    The cache is bounded by the size (in bytes) of the stored payloads, which
+    are compressed. When a new response does not fit, the least recently used
+    entries are evicted only if the new response has been requested more
+    often than each of them (TinyLFU admission), so that one-off lookups (for
+    example, a bulk scan) do not displace frequently requested responses.
+    """
+
+    #: The assumed average size (in bytes) of a compressed response, used to
+    #: size the frequency sketch
+    AVERAGE_ENTRY_SIZE = 4096
+
+    def __init__(self, max_bytes=0, ttl=3600, service_ttls=None,
+                 compression_level=1):
+        """
+        Constructor parameters:
+
+        :param max_bytes: The maximum size (in bytes) of the compressed
+            payloads in the cache (``0`` disables the cache)
+        :param ttl: The time (in seconds) responses are cached for
+        :param service_ttls: ``dict`` mapping service names to the time (in
+            seconds) responses for that service are cached for, overriding
+            ``ttl``. A time of ``0`` disables caching for the service.
+        :param compression_level: The ``zlib`` compression level (0-9) used
+            for stored payloads
+        """
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._service_ttls = dict(service_ttls or {})
+        self._compression_level = compression_level
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._rejections = 0
+        self._sketch = FrequencySketch(
+            max(1, max_bytes // self.AVERAGE_ENTRY_SIZE))
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def bytes_used(self):
+        """
+        The size (in bytes) of the compressed payloads in the cache
+        """
+        return self._bytes
+
+    @property
+    def hit_ratio(self):
+        """
+        The ratio of cache lookups which found a cached response
+        """
+        lookups = self._hits + self._misses
+        return float(self._hits) / lookups if lookups else 0.0
+
+    @property
+    def rejections(self):
+        """
+        The number of responses which were not admitted to the cache
+        """
+        return self._rejections
+
+    def reconfigure(self, max_bytes=0, ttl=3600, service_ttls=None,
+                    compression_level=1):
+        """
+        Changes the settings of the cache, keeping the cached responses. The
+        least recently used responses are evicted if the cache no longer
+        fits, and new times apply to responses cached from now on.
+
+        :param max_bytes: The maximum size (in bytes) of the compressed
+            payloads in the cache (``0`` disables the cache)
+        :param ttl: The time (in seconds) responses are cached for
+        :param service_ttls: ``dict`` mapping service names to the time (in
+            seconds) responses for that service are cached for
+        :param compression_level: The ``zlib`` compression level (0-9) used
+            for stored payloads
+        """
+        with self._lock:
+            self._max_bytes = max_bytes
+            self._ttl = ttl
+            self._service_ttls = dict(service_ttls or {})
+            self._compression_level = compression_level
+            while self._bytes > self._max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def get_entries(self):
+        """
+        Returns the cached responses which have not expired, least recently
+        used first, to be restored after a restart (see
+        :meth:`restore_entries`)
+
+        :return: List of tuples containing the cache key, the time the
+            response expires, and the compressed payload
+        """
+        now = time.time()
+        with self._lock:
+            return [(key, expires, compressed) for key, (expires, compressed)
+                    in self._entries.items() if expires > now]
+
+    def restore_entries(self, entries):
+        """
+        Adds previously cached responses to the cache (in order, so the last
+        is the most recently used). Expired responses, and responses which
+        do not fit, are skipped.
+
+        :param entries: List of tuples containing the cache key, the time the
+            response expires, and the compressed payload (see
+            :meth:`get_entries`)
+        :return: The number of responses added
+        """
+        now = time.time()
+        added = 0
+        with self._lock:
+            for key, expires, compressed in entries:
+                if expires <= now or key in self._entries or \
+                        self._bytes + len(compressed) > self._max_bytes:
+                    continue
+                self._entries[key] = (expires, compressed)
+                self._bytes += len(compressed)
+                self._sketch.increment(key)
+                added += 1
+        return added
+
+    def ttl(self, service):
+        """
+        Returns the time (in seconds) responses for the specified service are
+        cached for
+
+        :param service: The name of the service
+        :return: The time (in seconds)
+        """
+        return self._service_ttls.get(service, self._ttl)
+
+    def is_cacheable(self, service):
+        """
+        Returns whether responses for the specified service are cached
+
+        :param service: The name of the service
+        :return: Whether responses for the service are cached
+        """
+        return self._max_bytes > 0 and self.ttl(service) > 0
+
+    @staticmethod
+    def make_key(service, params):
+        """
+        Returns the cache key for a lookup. The ``format`` parameter is not
+        part of the key.
+
+        :param service: The name of the service
+        :param params: The request parameters
+        :return: The cache key
+        """
+        return json.dumps(
+            [service, dict((name, value) for name, value in params.items()
+                           if name != "format")],
+            sort_keys=True)
+
+    def get(self, key):
+        """
+        Returns the cached payload for the specified key
+
+        :param key: The cache key
+        :return: The canonical payload (``bytes``) or ``None`` if the key is
+            not cached (or has expired)
+        """
+        with self._lock:
+            self._sketch.increment(key)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.time():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            # Move to the most recently used position
+            del self._entries[key]
+            self._entries[key] = entry
+            compressed = entry[1]
+        return zlib.decompress(compressed)
+
+    def get_entry(self, key):
+        """
+        Returns the cached entry for the specified key, without counting the
+        lookup in the hit ratio (for example, when shared with a peer)
+
+        :param key: The cache key
+        :return: Tuple containing the time the response expires and the
+            compressed payload, or ``None`` if the key is not cached (or has
+            expired)
+        """
+        with self._lock:
+            self._sketch.increment(key)
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.time():
+                return None
+            # Move to the most recently used position
+            del self._entries[key]
+            self._entries[key] = entry
+            return entry
+
+    def put(self, key, service, payload):
+        """
+        Caches the canonical payload for the specified key, if it is admitted
+
+        :param key: The cache key
+        :param service: The name of the service
+        :param payload: The canonical payload (``bytes``)
+        :return: Whether the payload was admitted to the cache
+        """
+        return self.put_entry(
+            key, time.time() + self.ttl(service),
+            zlib.compress(payload, self._compression_level))
+
+    def put_entry(self, key, expires, compressed):
+        """
+        Caches a compressed payload (for example, shared by a peer) for the
+        specified key, if it is admitted
+
+        :param key: The cache key
+        :param expires: The time the response expires
+        :param compressed: The compressed canonical payload (``bytes``)
+        :return: Whether the payload was admitted to the cache
+        """
+        size = len(compressed)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if expires <= time.time() or size > self._max_bytes or \
+                    not self._admit(key, size):
+                self._rejections += 1
+                return False
+            self._entries[key] = (expires, compressed)
+            self._bytes += size
+            return True
+
+    def _admit(self, key, size):
+        """
+        Evicts the entries needed to make room for a new entry, if the new
+        entry is more frequently requested than each of them
+
+        :return: Whether the new entry can be added
+        """
+        victims = []
+        freed = 0
+        now = time.time()
+        for victim_key, (expires, compressed) in self._entries.items():
+            if self._bytes - freed + size <= self._max_bytes:
+                break
+            # Expired entries are always evicted
+            if expires > now and self._sketch.frequency(victim_key) >= \
+                    self._sketch.frequency(key):
+                return False
+            victims.append(victim_key)
+            freed += len(compressed)
+        for victim_key in victims:
+            self._remove(victim_key)
+        return True
+
+    def _remove(self, key):
+        _, compressed = self._entries.pop(key)
+        self._bytes -= len(compressed)
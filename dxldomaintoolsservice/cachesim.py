@@ -0,0 +1,499 @@
+"""
+Cache policy simulator, which replays a trace of requests against simulated
+response caches to estimate the hit ratio, DomainTools API calls and quota
+consumption of different cache sizes and eviction policies.
+
+Usage: python -m dxldomaintoolsservice.cachesim <dxldomaintoolsservice.config>
+<trace> [options] (see ``--help``)
+
+Each line of the trace is a JSON object containing the request ``time``
+(seconds since the epoch), the ``topic`` (or service name) and ``payload`` of
+the request, and optionally the ``size`` (in bytes) of the compressed
+response. Recordings written by the service in ``record`` mode (see
+:mod:`dxldomaintoolsservice.replay`) can also be used as traces (with the
+response cache disabled while recording, so that every request is recorded),
+in which case the size of each response is calculated from the recorded
+response.
+
+The TTLs and service costs are read from the application configuration file
+(the ``Cache``, ``CacheTtl`` and ``ServiceCosts`` sections), and the results
+are reported as the corresponding settings.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+import argparse
+from collections import OrderedDict
+import heapq
+import json
+import zlib
+
+from dxlbootstrap._compat import ConfigParser
+
+from dxldomaintoolsservice.app import DomainToolsService
+from dxldomaintoolsservice.cache import FrequencySketch, ResponseCache
+from dxldomaintoolsservice.loadgen import iter_trace
+
+#: Least recently used entries are evicted
+POLICY_LRU = "lru"
+#: Least frequently used entries are evicted
+POLICY_LFU = "lfu"
+#: Least recently used entries are evicted only for more frequently requested
+#: responses (the policy of :class:`dxldomaintoolsservice.cache.ResponseCache`)
+POLICY_TINYLFU = "tinylfu"
+#: The supported policies
+POLICIES = (POLICY_LRU, POLICY_LFU, POLICY_TINYLFU)
+
+#: The size (in bytes) assumed for responses of unknown size
+DEFAULT_ENTRY_SIZE = ResponseCache.AVERAGE_ENTRY_SIZE
+#: The fractions of the working set simulated if no sizes are specified
+DEFAULT_SIZE_FRACTIONS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0)
+#: A size is suggested if its hit ratio is within this margin of the best
+SUGGESTION_MARGIN = 0.01
+
+
+class TraceEntry(object):
+    """
+    A request in a trace
+    """
+
+    __slots__ = ("time", "service", "key", "size", "failed")
+
+    def __init__(self, time, service, key, size, failed=False):
+        self.time = time
+        self.service = service
+        self.key = key
+        self.size = size
+        self.failed = failed
+
+
+def load_trace(path, entry_size=DEFAULT_ENTRY_SIZE, interval=1.0,
+               compression_level=1):
+    """
+    Reads a trace of requests
+
+    :param path: The trace file
+    :param entry_size: The size (in bytes) assumed for responses of unknown
+        size
+    :param interval: The time (in seconds) between requests without a time
+    :param compression_level: The ``zlib`` compression level used to
+        calculate the size of recorded responses
+    :return: The list of :class:`TraceEntry` objects, in time order
+    """
+    trace = []
+    prefix = DomainToolsService.SERVICE_TYPE + "/"
+    last_time = 0.0
+    for entry in iter_trace(path):
+        if "topic" in entry:
+            service = entry["topic"]
+            if service.startswith(prefix):
+                service = service[len(prefix):]
+            params = entry.get("payload", {})
+            if not isinstance(params, dict):
+                params = json.loads(params)
+        else:
+            service = entry["service"]
+            params = entry.get("params", {})
+        size = entry.get("size")
+        if size is None and "data" in entry:
+            size = len(zlib.compress(
+                json.dumps(entry["data"]).encode("utf-8"),
+                compression_level))
+        last_time = float(entry.get("time", last_time + interval))
+        trace.append(TraceEntry(
+            last_time, service, ResponseCache.make_key(service, params),
+            size or entry_size, "error" in entry))
+    if not trace:
+        raise Exception("Trace is empty: {}".format(path))
+    trace.sort(key=lambda trace_entry: trace_entry.time)
+    return trace
+
+
+class SimulatedCache(object):
+    """
+    Simulated response cache, bounded by the size of the stored responses,
+    which evicts the least recently used entries
+    """
+
+    def __init__(self, max_bytes, ttls):
+        """
+        Constructor parameters:
+
+        :param max_bytes: The maximum size (in bytes) of the cached responses
+        :param ttls: Function returning the TTL (in seconds) of a service
+        """
+        self.max_bytes = max_bytes
+        self._ttls = ttls
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.expirations = 0
+
+    def access(self, entry):
+        """
+        Looks up a request in the cache, caching its response on a miss
+
+        :param entry: The :class:`TraceEntry`
+        :return: Whether the response was cached
+        """
+        self._record_access(entry)
+        cached = self._entries.get(entry.key)
+        if cached is not None:
+            if cached[0] > entry.time:
+                self._touch(entry.key)
+                return True
+            self.expirations += 1
+            self._remove(entry.key)
+        ttl = self._ttls(entry.service)
+        if not entry.failed and ttl > 0 and entry.size <= self.max_bytes and \
+                self._admit(entry):
+            self._add(entry.key, entry.time + ttl, entry.size)
+        return False
+
+    def _record_access(self, entry):
+        pass
+
+    def _touch(self, key):
+        self._entries[key] = self._entries.pop(key)
+
+    def _add(self, key, expires, size):
+        self._entries[key] = (expires, size)
+        self._bytes += size
+
+    def _remove(self, key):
+        self._bytes -= self._entries.pop(key)[1]
+
+    def _admit(self, entry):
+        while self._bytes + entry.size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+        return True
+
+
+class SimulatedLfuCache(SimulatedCache):
+    """
+    Simulated response cache which evicts the least frequently requested
+    entries (counting the requests made while the entry was cached)
+    """
+
+    def __init__(self, max_bytes, ttls):
+        super(SimulatedLfuCache, self).__init__(max_bytes, ttls)
+        self._counts = {}
+        self._heap = []
+
+    def _touch(self, key):
+        self._counts[key] += 1
+        heapq.heappush(self._heap, (self._counts[key], key))
+
+    def _add(self, key, expires, size):
+        super(SimulatedLfuCache, self)._add(key, expires, size)
+        self._counts[key] = 1
+        heapq.heappush(self._heap, (1, key))
+
+    def _remove(self, key):
+        super(SimulatedLfuCache, self)._remove(key)
+        del self._counts[key]
+
+    def _admit(self, entry):
+        while self._bytes + entry.size > self.max_bytes:
+            count, key = heapq.heappop(self._heap)
+            # Skip heap entries for keys since evicted or requested again
+            if self._counts.get(key) == count:
+                self._remove(key)
+        return True
+
+
+class SimulatedTinyLfuCache(SimulatedCache):
+    """
+    Simulated response cache with the eviction and admission policy of
+    :class:`dxldomaintoolsservice.cache.ResponseCache`
+    """
+
+    def __init__(self, max_bytes, ttls):
+        super(SimulatedTinyLfuCache, self).__init__(max_bytes, ttls)
+        self._sketch = FrequencySketch(
+            max(1, max_bytes // ResponseCache.AVERAGE_ENTRY_SIZE))
+        self._now = 0
+
+    def _record_access(self, entry):
+        self._sketch.increment(entry.key)
+        self._now = entry.time
+
+    def _admit(self, entry):
+        victims = []
+        freed = 0
+        frequency = self._sketch.frequency(entry.key)
+        for victim_key, (expires, size) in self._entries.items():
+            if self._bytes - freed + entry.size <= self.max_bytes:
+                break
+            # Expired entries are always evicted
+            if expires > self._now and \
+                    self._sketch.frequency(victim_key) >= frequency:
+                return False
+            victims.append(victim_key)
+            freed += size
+        for victim_key in victims:
+            self._remove(victim_key)
+        return True
+
+
+_CACHE_CLASSES = {
+    POLICY_LRU: SimulatedCache,
+    POLICY_LFU: SimulatedLfuCache,
+    POLICY_TINYLFU: SimulatedTinyLfuCache
+}
+
+
+def simulate(trace, policy, max_bytes, ttls, costs):
+    """
+    Replays a trace against a simulated response cache
+
+    :param trace: The trace (see :func:`load_trace`)
+    :param policy: The eviction policy (see :data:`POLICIES`)
+    :param max_bytes: The maximum size (in bytes) of the cached responses
+    :param ttls: Function returning the TTL (in seconds) of a service
+    :param costs: Function returning the cost of a DomainTools API call for a
+        service
+    :return: ``dict`` containing the overall and per-service results
+    """
+    cache = _CACHE_CLASSES[policy](max_bytes, ttls)
+    services = OrderedDict()
+    for entry in trace:
+        stats = services.get(entry.service)
+        if stats is None:
+            stats = services[entry.service] = {
+                "requests": 0, "hits": 0, "upstream_calls": 0, "cost": 0}
+        stats["requests"] += 1
+        if cache.access(entry):
+            stats["hits"] += 1
+        else:
+            stats["upstream_calls"] += 1
+            if not entry.failed:
+                stats["cost"] += costs(entry.service)
+    for stats in services.values():
+        stats["hit_ratio"] = round(
+            float(stats["hits"]) / stats["requests"], 4)
+    requests = len(trace)
+    hits = sum(stats["hits"] for stats in services.values())
+    return {
+        "policy": policy,
+        "max_bytes": max_bytes,
+        "requests": requests,
+        "hits": hits,
+        "hit_ratio": round(float(hits) / requests, 4),
+        "upstream_calls": requests - hits,
+        "cost": sum(stats["cost"] for stats in services.values()),
+        "expirations": cache.expirations,
+        "services": services
+    }
+
+
+def working_set_bytes(trace):
+    """
+    Returns the total size (in bytes) of the distinct responses in a trace
+    """
+    sizes = {}
+    for entry in trace:
+        sizes[entry.key] = entry.size
+    return sum(sizes.values())
+
+
+def _read_settings(config_file):
+    """
+    Reads the cache settings and service costs from the application
+    configuration file
+
+    :return: ``tuple`` containing the maximum cache size, the default TTL,
+        ``dict`` of service TTLs, the compression level and ``dict`` of
+        service costs
+    """
+    config = ConfigParser()
+    if not config.read(config_file):
+        raise Exception("Unable to read configuration file: {}".format(
+            config_file))
+
+    def get(section, prop, default, getter):
+        if config.has_option(section, prop) and \
+                config.get(section, prop).strip():
+            return getter(section, prop)
+        return default
+
+    def get_section(section, getter):
+        if not config.has_section(section):
+            return {}
+        return dict((prop, get(section, prop, None, getter))
+                    for prop in config.options(section))
+
+    app = DomainToolsService
+    return (get(app.CACHE_CONFIG_SECTION, app.CACHE_MAX_BYTES_CONFIG_PROP,
+                0, config.getint),
+            get(app.CACHE_CONFIG_SECTION, app.CACHE_TTL_CONFIG_PROP, 3600,
+                config.getfloat),
+            get_section(app.CACHE_TTL_CONFIG_SECTION, config.getfloat),
+            get(app.CACHE_CONFIG_SECTION,
+                app.CACHE_COMPRESSION_LEVEL_CONFIG_PROP, 1, config.getint),
+            get_section(app.SERVICE_COSTS_CONFIG_SECTION, config.getint))
+
+
+def _parse_sizes(value):
+    sizes = []
+    multipliers = {"k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+    for size in value.split(","):
+        size = size.strip().lower().rstrip("b")
+        if size:
+            multiplier = multipliers.get(size[-1], 1)
+            sizes.append(int(float(size.rstrip("kmg")) * multiplier))
+    return sizes
+
+
+def _parse_ttls(values):
+    ttls = {}
+    for value in values or []:
+        service, _, ttl = value.partition("=")
+        ttls[service.strip().lower()] = float(ttl)
+    return ttls
+
+
+def _suggest(results, policy):
+    """
+    Returns the smallest simulated size whose hit ratio (with the specified
+    policy) is within :data:`SUGGESTION_MARGIN` of the best
+    """
+    candidates = [result for result in results if result["policy"] == policy]
+    if not candidates:
+        return None
+    best = max(result["hit_ratio"] for result in candidates)
+    return min((result for result in candidates
+                if result["hit_ratio"] >= best - SUGGESTION_MARGIN),
+               key=lambda result: result["max_bytes"])
+
+
+def _print_report(trace, results, suggestion, ttl, service_ttls):
+    print("Requests: {}, services: {}, distinct responses: {}, working set: "
+          "{} bytes".format(len(trace),
+                            len(set(entry.service for entry in trace)),
+                            len(set(entry.key for entry in trace)),
+                            working_set_bytes(trace)))
+    print()
+    row = "{:<8} {:>12} {:>9} {:>10} {:>10} {:>11}"
+    print(row.format("policy", "maxBytes", "hit ratio", "upstream", "cost",
+                     "expirations"))
+    for result in results:
+        print(row.format(result["policy"], result["max_bytes"],
+                         "{:.2%}".format(result["hit_ratio"]),
+                         result["upstream_calls"], result["cost"],
+                         result["expirations"]))
+    if suggestion is None:
+        return
+
+    print()
+    print("Per-service results ({} policy, maxBytes = {}):".format(
+        suggestion["policy"], suggestion["max_bytes"]))
+    row = "{:<28} {:>8} {:>9} {:>10} {:>8} {:>8}"
+    print(row.format("service", "requests", "hit ratio", "upstream", "cost",
+                     "ttl"))
+    for service, stats in suggestion["services"].items():
+        print(row.format(service, stats["requests"],
+                         "{:.2%}".format(stats["hit_ratio"]),
+                         stats["upstream_calls"], stats["cost"],
+                         "{:g}".format(service_ttls.get(service, ttl))))
+
+    print()
+    print("Suggested settings (the smallest size within {:.0%} of the best "
+          "{} hit ratio):".format(SUGGESTION_MARGIN, suggestion["policy"]))
+    print()
+    print("[{}]".format(DomainToolsService.CACHE_CONFIG_SECTION))
+    print("{} = {}".format(DomainToolsService.CACHE_MAX_BYTES_CONFIG_PROP,
+                           suggestion["max_bytes"]))
+    print("{} = {:g}".format(DomainToolsService.CACHE_TTL_CONFIG_PROP, ttl))
+    if service_ttls:
+        print()
+        print("[{}]".format(DomainToolsService.CACHE_TTL_CONFIG_SECTION))
+        for service in sorted(service_ttls):
+            print("{} = {:g}".format(service, service_ttls[service]))
+
+
+def main(argv=None):
+    """
+    Runs the cache policy simulator
+
+    :param argv: The command line arguments (defaults to ``sys.argv``)
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m dxldomaintoolsservice.cachesim",
+        description="Simulates the DomainTools DXL service response cache "
+                    "for a trace of requests")
+    parser.add_argument("config",
+                        help="the application configuration file "
+                             "(dxldomaintoolsservice.config)")
+    parser.add_argument("trace", help="the trace of requests (JSON lines)")
+    parser.add_argument("--policies", default=",".join(POLICIES),
+                        help="comma-separated eviction policies to simulate "
+                             "(default: %(default)s)")
+    parser.add_argument("--sizes",
+                        help="comma-separated cache sizes to simulate, for "
+                             "example 16M,64M (default: the configured "
+                             "maxBytes and fractions of the working set)")
+    parser.add_argument("--ttl",
+                        help="the default TTL in seconds (default: the "
+                             "configured ttl)", type=float)
+    parser.add_argument("--service-ttl", action="append",
+                        metavar="SERVICE=SECONDS",
+                        help="the TTL of a service, overriding the "
+                             "CacheTtl section (may be repeated)")
+    parser.add_argument("--entry-size", type=int, default=DEFAULT_ENTRY_SIZE,
+                        help="the size in bytes assumed for responses of "
+                             "unknown size (default: %(default)s)")
+    parser.add_argument("--interval", type=float, default=1.0,
+                        help="the time in seconds between requests without a "
+                             "time (default: %(default)s)")
+    parser.add_argument("--json", action="store_true",
+                        help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    max_bytes, ttl, service_ttls, compression_level, costs = \
+        _read_settings(args.config)
+    if args.ttl is not None:
+        ttl = args.ttl
+    service_ttls.update(_parse_ttls(args.service_ttl))
+    service_ttls = dict((service, value) for service, value
+                        in service_ttls.items() if value is not None)
+    policies = [policy.strip() for policy in args.policies.split(",")
+                if policy.strip()]
+    for policy in policies:
+        if policy not in POLICIES:
+            raise Exception("Unknown policy: {}".format(policy))
+
+    trace = load_trace(args.trace, args.entry_size, args.interval,
+                       compression_level)
+    if args.sizes:
+        sizes = _parse_sizes(args.sizes)
+    else:
+        working_set = working_set_bytes(trace)
+        sizes = set(max(1, int(working_set * fraction))
+                    for fraction in DEFAULT_SIZE_FRACTIONS)
+        if max_bytes:
+            sizes.add(max_bytes)
+        sizes = sorted(sizes)
+
+    results = [simulate(trace, policy, size,
+                        lambda service: service_ttls.get(service, ttl),
+                        lambda service: costs.get(service) or 1)
+               for policy in policies for size in sizes]
+    suggestion = _suggest(results, POLICY_TINYLFU) or \
+        _suggest(results, policies[0])
+    if args.json:
+        print(json.dumps({
+            "results": results,
+            "suggested_settings": {
+                DomainToolsService.CACHE_CONFIG_SECTION: {
+                    DomainToolsService.CACHE_MAX_BYTES_CONFIG_PROP:
+                        suggestion["max_bytes"],
+                    DomainToolsService.CACHE_TTL_CONFIG_PROP: ttl},
+                DomainToolsService.CACHE_TTL_CONFIG_SECTION: service_ttls
+            }
+        }, indent=2))
+    else:
+        _print_report(trace, results, suggestion, ttl, service_ttls)
+
+
+if __name__ == "__main__":
+    main()
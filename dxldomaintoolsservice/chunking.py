@@ -0,0 +1,223 @@
+from __future__ import absolute_import
+from collections import OrderedDict
+import threading
+import time
+import uuid
+
+from dxlbootstrap.util import MessageUtils
+from dxlclient.message import Message, Request
+from dxldomaintoolsservice._constants import SERVICE_TYPE
+
+#: The request "other field" used by callers to indicate that they can
+#: reassemble chunked responses
+CHUNKED_OTHER_FIELD = "chunked"
+#: The response "other field" containing the identifier of a chunked response
+CHUNK_ID_OTHER_FIELD = "chunkId"
+#: The response "other field" containing the sequence number of a chunk
+CHUNK_INDEX_OTHER_FIELD = "chunkIndex"
+#: The response "other field" containing the total number of chunks
+CHUNK_COUNT_OTHER_FIELD = "chunkCount"
+
+#: The topic used to fetch the remaining chunks of a chunked response
+CHUNK_TOPIC = SERVICE_TYPE + "/chunk"
+
+
+def set_chunk_fields(message, chunk_id, index, count):
+    """
+    Sets the chunk "other fields" of the specified message
+
+    :param message: The message
+    :param chunk_id: The identifier of the chunked response
+    :param index: The sequence number of the chunk
+    :param count: The total number of chunks
+    """
+    other_fields = dict(message.other_fields)
+    other_fields[CHUNK_ID_OTHER_FIELD] = chunk_id
+    other_fields[CHUNK_INDEX_OTHER_FIELD] = str(index)
+    other_fields[CHUNK_COUNT_OTHER_FIELD] = str(count)
+    message.other_fields = other_fields
+
+
+class ChunkStore(object):
+    """
+    Splits oversized response payloads into sequence-numbered chunks, and
+    holds the chunks which have not yet been fetched by the caller.
+
+    The first chunk is sent in the response to the original request. The
+    remaining chunks are held (until they expire) and fetched by the caller,
+    one per request, via the :data:`CHUNK_TOPIC` topic (see
+    :class:`ChunkReader`).
+    """
+
+    def __init__(self, max_chunk_size=524288, ttl=300,
+                 max_pending_bytes=67108864):
+        """
+        Constructor parameters:
+
+        :param max_chunk_size: The maximum size (in bytes) of a chunk
+        :param ttl: The time (in seconds) chunks are held for the caller
+        :param max_pending_bytes: The maximum size (in bytes) of the chunks
+            held for callers. The oldest responses are discarded first.
+        """
+        self._max_chunk_size = max(1, max_chunk_size)
+        self._ttl = ttl
+        self._max_pending_bytes = max_pending_bytes
+        self._pending = OrderedDict()
+        self._pending_bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending_bytes(self):
+        """
+        The size (in bytes) of the chunks held for callers
+        """
+        return self._pending_bytes
+
+    def reconfigure(self, max_chunk_size=524288, ttl=300,
+                    max_pending_bytes=67108864):
+        """
+        Changes the settings of the store, keeping the chunks held for
+        callers
+
+        :param max_chunk_size: The maximum size (in bytes) of a chunk
+        :param ttl: The time (in seconds) chunks are held for the caller
+        :param max_pending_bytes: The maximum size (in bytes) of the chunks
+            held for callers
+        """
+        with self._lock:
+            self._max_chunk_size = max(1, max_chunk_size)
+            self._ttl = ttl
+            self._max_pending_bytes = max_pending_bytes
+
+    def chunk_response(self, response):
+        """
+        Splits the payload of the specified response if it exceeds the maximum
+        chunk size. The response payload is replaced with the first chunk.
+
+        :param response: The response message
+        :return: Whether the response was chunked
+        """
+        payload = response.payload
+        if len(payload) <= self._max_chunk_size:
+            return False
+
+        size = self._max_chunk_size
+        chunks = [payload[i:i + size] for i in range(0, len(payload), size)]
+        chunk_id = str(uuid.uuid4())
+        # The first chunk is sent inline, so only the others are held
+        remaining = chunks[1:]
+        with self._lock:
+            self._purge(time.time())
+            self._pending[chunk_id] = (time.time() + self._ttl, remaining)
+            self._pending_bytes += len(payload) - len(chunks[0])
+            while self._pending_bytes > self._max_pending_bytes and \
+                    len(self._pending) > 1:
+                self._discard(next(iter(self._pending)))
+
+        response.payload = chunks[0]
+        set_chunk_fields(response, chunk_id, 0, len(chunks))
+        return True
+
+    def get_chunk(self, chunk_id, index):
+        """
+        Returns the specified chunk. The chunks of a response are held until
+        they expire (rather than discarded once the last chunk is fetched), so
+        that callers can retry fetches.
+
+        :param chunk_id: The identifier of the chunked response
+        :param index: The sequence number of the chunk
+        :return: A tuple containing the chunk and the total number of chunks
+        """
+        with self._lock:
+            self._purge(time.time())
+            entry = self._pending.get(chunk_id)
+            if entry is None:
+                raise Exception(
+                    "Chunked response not found (or expired): '{}'".format(
+                        chunk_id))
+            remaining = entry[1]
+            if index < 1 or index > len(remaining):
+                raise Exception("Invalid chunk index: {}".format(index))
+            return remaining[index - 1], len(remaining) + 1
+
+    def _purge(self, now):
+        for chunk_id in [key for key, (expires, _) in self._pending.items()
+                         if expires <= now]:
+            self._discard(chunk_id)
+
+    def _discard(self, chunk_id):
+        _, chunks = self._pending.pop(chunk_id)
+        self._pending_bytes -= sum(len(chunk) for chunk in chunks)
+
+
+class ChunkReader(object):
+    """
+    Client-side helper used to reassemble chunked responses from the
+    DomainTools DXL service.
+
+    Callers opt in to chunked responses by setting the ``chunked`` other field
+    of the request (see :meth:`enable`):
+
+    .. code-block:: python
+
+        req = Request("/opendxl-domaintools/service/domaintools/reverse_ip")
+        ChunkReader.enable(req)
+        MessageUtils.dict_to_json_payload(req, {"domain": "domaintools.com"})
+        res = client.sync_request(req, timeout=30)
+        payload = ChunkReader(client).read(res)
+    """
+
+    def __init__(self, client, timeout=30):
+        """
+        Constructor parameters:
+
+        :param client: The DXL client used to fetch the remaining chunks
+        :param timeout: The timeout (in seconds) for fetching each chunk
+        """
+        self._client = client
+        self._timeout = timeout
+
+    @staticmethod
+    def enable(request):
+        """
+        Indicates that the caller can reassemble chunked responses
+
+        :param request: The request message
+        """
+        other_fields = dict(request.other_fields)
+        other_fields[CHUNKED_OTHER_FIELD] = "true"
+        request.other_fields = other_fields
+
+    def iter_chunks(self, response):
+        """
+        Returns an iterator over the payload chunks of the specified response,
+        fetching each remaining chunk as it is needed
+
+        :param response: The response to the original request
+        :return: An iterator of payload chunks (``bytes``)
+        """
+        yield response.payload
+        chunk_id = response.other_fields.get(CHUNK_ID_OTHER_FIELD)
+        if chunk_id is None:
+            return
+        count = int(response.other_fields[CHUNK_COUNT_OTHER_FIELD])
+        for index in range(1, count):
+            req = Request(CHUNK_TOPIC)
+            # The chunks are only held by the service which responded
+            req.service_id = response.service_id
+            MessageUtils.dict_to_json_payload(
+                req, {"id": chunk_id, "index": index})
+            res = self._client.sync_request(req, timeout=self._timeout)
+            if res.message_type == Message.MESSAGE_TYPE_ERROR:
+                raise Exception("Error fetching chunk {} of '{}': {}".format(
+                    index, chunk_id, res.error_message))
+            yield res.payload
+
+    def read(self, response):
+        """
+        Returns the complete (reassembled) payload of the specified response
+
+        :param response: The response to the original request
+        :return: The complete payload (``bytes``)
+        """
+        return b"".join(self.iter_chunks(response))
@@ -0,0 +1,177 @@
+from __future__ import absolute_import
+from collections import OrderedDict
+import json
+import re
+from xml.sax.saxutils import escape
+
+from dxldomaintoolsservice._compat import string_types
+
+# Optional, faster JSON libraries
+try:
+    import orjson
+except ImportError:
+    orjson = None # pylint: disable=invalid-name
+try:
+    import ujson
+except ImportError:
+    ujson = None # pylint: disable=invalid-name
+
+
+class JsonCodec(object):
+    """
+    Converts DXL message payloads to and from Python objects using the
+    standard library ``json`` module. Subclasses use faster JSON libraries
+    when they are installed (see :func:`get_codec`).
+    """
+
+    #: The name of the codec
+    NAME = "json"
+
+    @classmethod
+    def is_available(cls):
+        """
+        Returns whether the library used by the codec is installed
+
+        :return: Whether the codec is available
+        """
+        return True
+
+    @staticmethod
+    def loads(payload):
+        """
+        Converts the specified JSON payload to a Python object
+
+        :param payload: The payload (``bytes``)
+        :return: The Python object
+        """
+        return json.loads(payload.decode("utf-8").rstrip("\0"))
+
+    @staticmethod
+    def dumps(obj):
+        """
+        Converts the specified Python object to a JSON payload
+
+        :param obj: The Python object
+        :return: The payload (``bytes``)
+        """
+        return json.dumps(obj).encode("utf-8")
+
+
+class OrjsonCodec(JsonCodec):
+    """
+    JSON codec using the ``orjson`` library
+    """
+
+    NAME = "orjson"
+
+    @classmethod
+    def is_available(cls):
+        return orjson is not None
+
+    # orjson is a C extension, so pylint can not find its members
+    @staticmethod
+    def loads(payload):
+        return orjson.loads(payload.rstrip(b"\0")) # pylint: disable=no-member
+
+    @staticmethod
+    def dumps(obj):
+        return orjson.dumps(obj) # pylint: disable=no-member
+
+
+class UjsonCodec(JsonCodec):
+    """
+    JSON codec using the ``ujson`` library
+    """
+
+    NAME = "ujson"
+
+    @classmethod
+    def is_available(cls):
+        return ujson is not None
+
+    @staticmethod
+    def loads(payload):
+        return ujson.loads(payload.rstrip(b"\0"))
+
+    @staticmethod
+    def dumps(obj):
+        return ujson.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+#: The codecs in order of preference
+CODECS = OrderedDict((codec.NAME, codec) for codec in
+                     (OrjsonCodec, UjsonCodec, JsonCodec))
+
+#: The codec name used to select the fastest available codec
+AUTO_CODEC = "auto"
+
+
+def get_codec(name=AUTO_CODEC):
+    """
+    Returns the specified JSON codec
+
+    :param name: The name of the codec (``auto`` selects the fastest codec
+        which is installed)
+    :return: The :class:`JsonCodec`
+    """
+    if name == AUTO_CODEC:
+        for codec in CODECS.values():
+            if codec.is_available():
+                return codec()
+    codec = CODECS.get(name)
+    if codec is None:
+        raise Exception(
+            "Unknown JSON codec: '{}'. Supported codecs: {}".format(
+                name, ", ".join([AUTO_CODEC] + list(CODECS))))
+    if not codec.is_available():
+        raise Exception("JSON codec '{}' is not installed".format(name))
+    return codec()
+
+
+#: The root element of the XML responses returned by the DomainTools API
+XML_ROOT_ELEMENT = "whoisapi"
+
+#: Characters which are not permitted in XML element names
+_INVALID_XML_NAME_CHARS = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def to_xml(obj, root=XML_ROOT_ELEMENT):
+    """
+    Renders a JSON response (as a Python object) as XML. The layout follows
+    the XML returned by the DomainTools API: the JSON document is wrapped in a
+    ``whoisapi`` root element, objects become elements named after their keys,
+    and each item of a list becomes a repeated element named after the list's
+    key.
+
+    :param obj: The Python object
+    :param root: The name of the root element
+    :return: The XML document (``str``)
+    """
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>']
+    _append_xml(parts, root, obj)
+    return "".join(parts)
+
+
+def _append_xml(parts, name, value):
+    if isinstance(value, list):
+        for item in value:
+            _append_xml(parts, name, item)
+        return
+
+    tag = _INVALID_XML_NAME_CHARS.sub("_", name)
+    if not tag or not (tag[0].isalpha() or tag[0] == "_"):
+        tag = "_" + tag
+    if value is None:
+        parts.append("<{}/>".format(tag))
+        return
+
+    parts.append("<{}>".format(tag))
+    if isinstance(value, dict):
+        for key, item in value.items():
+            _append_xml(parts, key, item)
+    elif isinstance(value, string_types):
+        parts.append(escape(value))
+    else:
+        # Numbers and booleans use their JSON representation
+        parts.append(json.dumps(value))
+    parts.append("</{}>".format(tag))
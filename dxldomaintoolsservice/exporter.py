@@ -0,0 +1,231 @@
+from __future__ import absolute_import
+import logging
+import numbers
+import re
+import threading
+
+from dxldomaintoolsservice._compat import BaseHTTPRequestHandler, \
+    HTTPServer, ThreadingMixIn
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+#: The prefix of the names of exported metrics
+METRIC_PREFIX = "dxldomaintools_"
+#: The content type of the exported metrics
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# The label used for the keys of gauges which are collections (for example,
+# the "clients" gauge is keyed by client)
+_GAUGE_KEY_LABELS = {
+    "clients": "client",
+    "budget": "product",
+    "memory_services": "service",
+    "memory_components": "component",
+    "startup": "phase"
+}
+
+_INVALID_NAME_CHARACTERS = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def _metric_name(name):
+    return METRIC_PREFIX + _INVALID_NAME_CHARACTERS.sub("_", name)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\")
+                         .replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _is_number(value):
+    return isinstance(value, numbers.Number)
+
+
+def _flatten_gauge(name, value, labels=()):
+    """
+    Returns the numeric samples of a gauge. Gauges which are collections (a
+    ``dict`` of numbers, or of ``dict`` objects) are labelled with their
+    keys, and other ``dict`` gauges are exported as one gauge per field.
+    Values which are not numeric (for example, lists) are not exported.
+
+    :return: List of tuples containing the metric name, labels and value
+    """
+    if isinstance(value, bool):
+        return [(name, labels, int(value))]
+    if _is_number(value):
+        return [(name, labels, value)]
+    if not isinstance(value, dict) or not value:
+        return []
+    samples = []
+    label = _GAUGE_KEY_LABELS.get(name, "key")
+    if all(isinstance(item, dict) for item in value.values()):
+        for key in sorted(value):
+            for field in sorted(value[key]):
+                samples.extend(_flatten_gauge(
+                    "{}_{}".format(name, field), value[key][field],
+                    labels + ((label, key),)))
+    elif all(item is None or _is_number(item) for item in value.values()):
+        for key in sorted(value):
+            samples.extend(_flatten_gauge(name, value[key],
+                                          labels + ((label, key),)))
+    else:
+        for field in sorted(value):
+            samples.extend(_flatten_gauge("{}_{}".format(name, field),
+                                          value[field], labels))
+    return samples
+
+
+def _render_counters(snapshot):
+    lines = []
+    for name in sorted(snapshot["counters"]):
+        value = snapshot["counters"][name]
+        metric = _metric_name(name)
+        lines.append("# TYPE {} counter".format(metric))
+        if isinstance(value, dict):
+            for service in sorted(value):
+                lines.append("{}_total{} {}".format(
+                    metric, _format_labels((("service", service),)),
+                    _format_value(value[service])))
+        else:
+            lines.append("{}_total {}".format(metric, _format_value(value)))
+    return lines
+
+
+def _render_histograms(metrics):
+    lines = []
+    histograms = {}
+    for (name, service), histogram in metrics.histograms().items():
+        histograms.setdefault(name, {})[service] = histogram
+    for name in sorted(histograms):
+        metric = _metric_name(name + "_latency_seconds")
+        lines.append("# TYPE {} histogram".format(metric))
+        lines.append("# UNIT {} seconds".format(metric))
+        for service in sorted(histograms[name]):
+            buckets, count, total = histograms[name][service]
+            labels = (("service", service),)
+            for bound, cumulative in buckets:
+                lines.append("{}_bucket{} {}".format(
+                    metric, _format_labels(labels + (("le", _format_value(
+                        bound)),)), cumulative))
+            lines.append("{}_count{} {}".format(
+                metric, _format_labels(labels), count))
+            lines.append("{}_sum{} {}".format(
+                metric, _format_labels(labels), _format_value(total)))
+    return lines
+
+
+def _render_gauges(snapshot):
+    lines = []
+    gauges = {}
+    for name, value in snapshot["gauges"].items():
+        for sample_name, labels, sample_value in _flatten_gauge(name, value):
+            if sample_value is not None:
+                gauges.setdefault(sample_name, []).append(
+                    (labels, sample_value))
+    for name in sorted(gauges):
+        metric = _metric_name(name)
+        lines.append("# TYPE {} gauge".format(metric))
+        for labels, value in gauges[name]:
+            lines.append("{}{} {}".format(metric, _format_labels(labels),
+                                          _format_value(value)))
+    return lines
+
+
+def render_openmetrics(metrics):
+    """
+    Renders metrics in the OpenMetrics text format. Counters and latency
+    histograms are labelled with the service they apply to.
+
+    :param metrics: The :class:`dxldomaintoolsservice.metrics.Metrics`
+    :return: The metrics (``str``)
+    """
+    snapshot = metrics.snapshot()
+    lines = _render_counters(snapshot) + _render_histograms(metrics) + \
+        _render_gauges(snapshot)
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+class _ExporterServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    metrics = None
+
+
+class _ExporterRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self): # pylint: disable=invalid-name
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        try:
+            body = render_openmetrics(self.server.metrics).encode("utf-8")
+        except Exception: # pylint: disable=broad-except
+            logger.exception("Error rendering metrics")
+            self.send_error(500)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        logger.debug("Metrics exporter request: " + format, *args)
+
+
+class MetricsExporter(object):
+    """
+    HTTP listener which exports the metrics of the service in the
+    OpenMetrics text format (for scraping by Prometheus, for example)
+    """
+
+    def __init__(self, metrics, port=0, address="127.0.0.1"):
+        """
+        Constructor parameters:
+
+        :param metrics: The :class:`dxldomaintoolsservice.metrics.Metrics`
+        :param port: The port to listen on (``0`` disables the exporter)
+        :param address: The address to listen on
+        """
+        self._metrics = metrics
+        self._port = port
+        self._address = address
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        """
+        Starts listening for requests in the background
+        """
+        if not self._port:
+            return
+        self._server = _ExporterServer((self._address, self._port),
+                                       _ExporterRequestHandler)
+        self._server.metrics = self._metrics
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="MetricsExporter")
+        self._thread.daemon = True
+        self._thread.start()
+        logger.info("Exporting metrics on: http://%s:%d/metrics",
+                    self._address, self._port)
+
+    def stop(self):
+        """
+        Stops listening for requests
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+            self._thread = None
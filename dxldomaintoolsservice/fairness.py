@@ -0,0 +1,329 @@
+from __future__ import absolute_import
+import itertools
+import threading
+import time
+
+from dxldomaintoolsservice.ratelimiter import RateLimiter
+
+#: Identifies clients by the DXL client that sent the request
+CLIENT_KEY_CLIENT = "client"
+#: Identifies clients by the tenant of the DXL client that sent the request
+CLIENT_KEY_TENANT = "tenant"
+
+
+def get_client_key(request, client_key=CLIENT_KEY_CLIENT):
+    """
+    Returns the key used to account for the requests of a client
+
+    :param request: The request message
+    :param client_key: How clients are identified (``client`` or ``tenant``)
+    :return: The client key (empty if the source of the request is unknown)
+    """
+    if client_key == CLIENT_KEY_TENANT:
+        return request.source_tenant_guid or ""
+    return request.source_client_id or ""
+
+
+class _ClientState(object):
+    """
+    The accounting state of a single client
+    """
+
+    def __init__(self, weight, limiter):
+        self.weight = weight
+        self.limiter = limiter
+        self.finish_tag = 0.0
+        self.in_flight = 0
+        self.queued = 0
+        self.requests = 0
+        self.rejected = 0
+        self.last_seen = time.time()
+
+
+class FairScheduler(object):
+    """
+    Divides the capacity of the service between clients.
+
+    Each client is subject to an optional rate limit and an optional limit on
+    the number of its requests handled concurrently. When the service is
+    handling its maximum number of concurrent requests, waiting requests are
+    dispatched using start-time weighted fair queuing: each client receives a
+    share of the capacity proportional to its weight, however many requests
+    it has waiting.
+
+    Waiting requests occupy the threads they are handled on. When the number
+    of those threads is known, the requests a single client can have waiting
+    are capped so that the client cannot block every thread which is not
+    handling a request: at most ``thread_count - max_concurrent - 1`` (or
+    ``thread_count - client_concurrency - 1`` if only the concurrency of each
+    client is limited). Further requests from the client are rejected.
+    """
+
+    #: The time (in seconds) after which the state of an idle client is
+    #: discarded
+    IDLE_TIMEOUT = 600
+
+    def __init__(self, max_concurrent=0, client_concurrency=0,
+                 client_queue_size=100, client_per_minute=0, client_burst=1,
+                 weights=None, max_wait=30, thread_count=0):
+        """
+        Constructor parameters:
+
+        :param max_concurrent: The maximum number of requests handled
+            concurrently (``0`` for no limit)
+        :param client_concurrency: The maximum number of requests from a
+            single client handled concurrently (``0`` for no limit)
+        :param client_queue_size: The maximum number of requests from a single
+            client waiting to be handled. Further requests are rejected.
+        :param client_per_minute: The number of requests permitted per minute
+            from a single client (``0`` for no limit). Further requests are
+            rejected.
+        :param client_burst: The number of requests a single client can make
+            back-to-back after it has been idle
+        :param weights: ``dict`` mapping client keys to their weight
+            (defaults to ``1``)
+        :param max_wait: The maximum time (in seconds) a request waits to be
+            handled
+        :param thread_count: The number of threads requests are handled (and
+            wait) on (``0`` if unknown)
+        """
+        self._max_concurrent = max_concurrent
+        self._client_concurrency = client_concurrency
+        self._client_queue_size = client_queue_size
+        self._client_per_minute = client_per_minute
+        self._client_burst = client_burst
+        self._max_wait = max_wait
+        self._thread_count = thread_count
+        self._weights = dict((key.lower(), float(weight))
+                             for key, weight in (weights or {}).items())
+        self._clients = {}
+        self._in_flight = 0
+        self._waiting = []
+        self._virtual_time = 0.0
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    @property
+    def enabled(self):
+        """
+        Whether any limits are applied to clients
+        """
+        return bool(self._max_concurrent or self._client_concurrency or
+                    self._client_per_minute)
+
+    @property
+    def waiting(self):
+        """
+        The number of requests waiting to be handled
+        """
+        return len(self._waiting)
+
+    def stats(self):
+        """
+        Returns the accounting state of each client
+
+        :return: ``dict`` mapping client keys to a ``dict`` containing the
+            number of requests which are in flight, queued, handled and
+            rejected
+        """
+        with self._condition:
+            return dict((key, {"in_flight": state.in_flight,
+                               "queued": state.queued,
+                               "requests": state.requests,
+                               "rejected": state.rejected})
+                        for key, state in self._clients.items())
+
+    def reconfigure(self, max_concurrent=0, client_concurrency=0,
+                    client_queue_size=100, client_per_minute=0,
+                    client_burst=1, weights=None, max_wait=30,
+                    thread_count=0):
+        """
+        Changes the limits applied to clients, keeping the requests which are
+        in flight or waiting (see the constructor for the parameters). Waiting
+        requests are dispatched if the new limits allow.
+        """
+        with self._condition:
+            self._max_concurrent = max_concurrent
+            self._client_concurrency = client_concurrency
+            self._client_queue_size = client_queue_size
+            self._client_per_minute = client_per_minute
+            self._client_burst = client_burst
+            self._max_wait = max_wait
+            self._thread_count = thread_count
+            self._weights = dict((key.lower(), float(weight))
+                                 for key, weight in (weights or {}).items())
+            for client, state in self._clients.items():
+                state.weight = self._weights.get(client.lower(), 1.0)
+                if not client_per_minute:
+                    state.limiter = None
+                elif state.limiter:
+                    state.limiter.reconfigure(client_per_minute, client_burst)
+                else:
+                    state.limiter = RateLimiter(client_per_minute,
+                                                client_burst)
+            self._condition.notify_all()
+
+    def get_limiter_states(self):
+        """
+        Returns the state of the rate limiter of each client, to be restored
+        after a restart (see :meth:`restore_limiter_states`)
+
+        :return: ``dict`` mapping client keys to the state of their limiter
+        """
+        with self._condition:
+            return dict((client, state.limiter.get_state())
+                        for client, state in self._clients.items()
+                        if state.limiter)
+
+    def restore_limiter_states(self, limiter_states):
+        """
+        Restores the state of the rate limiters of clients
+
+        :param limiter_states: ``dict`` mapping client keys to the state of
+            their limiter (see :meth:`get_limiter_states`)
+        """
+        if not self._client_per_minute:
+            return
+        with self._condition:
+            now = time.time()
+            for client, limiter_state in limiter_states.items():
+                self._get_state(client, now).limiter.restore_state(
+                    limiter_state)
+
+    def acquire(self, client, timeout=None):
+        """
+        Waits until a request from the specified client can be handled. Each
+        call which returns ``True`` must be followed by a call to
+        :meth:`release`.
+
+        :param client: The client key
+        :param timeout: The time (in seconds) the caller is willing to wait
+            (the maximum wait is used if not specified, or if it is shorter)
+        :return: Whether the request is accounted for (``False`` if no limits
+            are applied to clients)
+        """
+        if not self.enabled:
+            return False
+        if timeout is None or timeout > self._max_wait:
+            timeout = self._max_wait
+        with self._condition:
+            now = time.time()
+            state = self._get_state(client, now)
+            if state.limiter and not state.limiter.try_acquire():
+                state.rejected += 1
+                raise Exception(
+                    "Request rate limit exceeded for client '{}'".format(
+                        client))
+
+            cost = 1.0 / state.weight
+            previous_tag = state.finish_tag
+            state.finish_tag = max(self._virtual_time, state.finish_tag) + cost
+            # Waiters are lists, as their tags change if an earlier waiter of
+            # the same client leaves without being handled
+            waiter = [state.finish_tag, next(self._sequence), client]
+            self._waiting.append(waiter)
+            # Only requests which have to wait count towards the limit
+            if state.queued >= self._get_client_queue_size() and \
+                    self._next_waiter() != waiter:
+                self._waiting.remove(waiter)
+                state.finish_tag = previous_tag
+                state.rejected += 1
+                raise Exception(
+                    "Too many requests waiting for client '{}'".format(client))
+            state.queued += 1
+            deadline = now + timeout
+            served = False
+            try:
+                while self._next_waiter() != waiter:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        state.rejected += 1
+                        raise Exception(
+                            "Timed out waiting for capacity for client "
+                            "'{}'".format(client))
+                    self._condition.wait(remaining)
+                served = True
+            finally:
+                self._waiting.remove(waiter)
+                state.queued -= 1
+                if not served:
+                    self._roll_back(state, waiter, cost)
+                # Other waiters may now be eligible
+                self._condition.notify_all()
+
+            self._virtual_time = max(self._virtual_time, waiter[0] - cost)
+            state.in_flight += 1
+            state.requests += 1
+            self._in_flight += 1
+            return True
+
+    def release(self, client):
+        """
+        Indicates that a request from the specified client (for which
+        :meth:`acquire` returned ``True``) has been handled
+
+        :param client: The client key
+        """
+        with self._condition:
+            state = self._clients[client]
+            state.in_flight -= 1
+            state.last_seen = time.time()
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def _roll_back(self, state, waiter, cost):
+        """
+        Returns the share of capacity charged to a client for a waiter which
+        left without being handled, so that timed out requests do not push
+        back the client's later requests
+        """
+        for other in self._waiting:
+            if other[2] == waiter[2] and other[0] > waiter[0]:
+                other[0] -= cost
+        state.finish_tag -= cost
+
+    def _get_client_queue_size(self):
+        """
+        Returns the maximum number of requests from a single client which can
+        wait to be handled, leaving at least one of the threads which are not
+        handling requests to the other clients
+        """
+        queue_size = self._client_queue_size
+        handling = self._max_concurrent or self._client_concurrency
+        if self._thread_count and handling:
+            queue_size = min(queue_size,
+                             max(self._thread_count - handling - 1, 0))
+        return queue_size
+
+    def _get_state(self, client, now):
+        state = self._clients.get(client)
+        if state is None:
+            self._prune(now)
+            limiter = None
+            if self._client_per_minute:
+                limiter = RateLimiter(self._client_per_minute,
+                                      self._client_burst)
+            state = _ClientState(self._weights.get(client.lower(), 1.0),
+                                 limiter)
+            self._clients[client] = state
+        state.last_seen = now
+        return state
+
+    def _prune(self, now):
+        for key in [key for key, state in self._clients.items()
+                    if not state.in_flight and not state.queued and
+                    now - state.last_seen > self.IDLE_TIMEOUT]:
+            del self._clients[key]
+
+    def _next_waiter(self):
+        """
+        Returns the waiter to dispatch next (the eligible waiter with the
+        lowest tag), or ``None`` if no waiter can be dispatched
+        """
+        if self._max_concurrent and self._in_flight >= self._max_concurrent:
+            return None
+        eligible = [waiter for waiter in self._waiting
+                    if not self._client_concurrency or
+                    self._clients[waiter[2]].in_flight <
+                    self._client_concurrency]
+        return min(eligible) if eligible else None
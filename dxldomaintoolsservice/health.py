@@ -0,0 +1,272 @@
+from __future__ import absolute_import
+from collections import OrderedDict
+from datetime import timedelta
+import json
+import logging
+import os
+import threading
+import time
+
+from dxldomaintoolsservice._compat import BaseHTTPRequestHandler, \
+    HTTPServer, ThreadingMixIn
+from dxldomaintoolsservice.budget import get_account_products
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+#: The service is starting, and is not yet registered
+STATUS_STARTING = "starting"
+#: The service is registered and answering requests
+STATUS_READY = "ready"
+#: The service is unregistered, and completing the requests in flight
+STATUS_DRAINING = "draining"
+#: The service has stopped
+STATUS_STOPPED = "stopped"
+
+
+def prime_api_rate_limits(api, account_info):
+    """
+    Sets the per-product rate limits of a DomainTools API client from an
+    ``account_information`` response. Otherwise, the client fetches them
+    (with an additional DomainTools API call) before its first request.
+
+    :param api: The DomainTools API client
+    :param account_info: The ``account_information`` response
+    """
+    if not getattr(api, "rate_limit", False) or \
+            getattr(api, "limits_set", True):
+        return
+    products = get_account_products(account_info)
+    if products is None:
+        return
+    for product in products:
+        try:
+            per_minute = float(product["per_minute_limit"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if per_minute > 0:
+            api.limits[product["id"]] = {
+                "interval": timedelta(seconds=60 / per_minute)}
+    api.limits_set = True
+
+
+class StartupTimer(object):
+    """
+    Measures the time spent in each phase of starting the service
+    """
+
+    def __init__(self):
+        self._start = time.time()
+        self._last_mark = self._start
+        self._phases = OrderedDict()
+        self._total = None
+
+    @property
+    def start(self):
+        """
+        The time the service started
+        """
+        return self._start
+
+    @property
+    def total(self):
+        """
+        The time (in seconds) the service took to start (``None`` if it has
+        not finished starting)
+        """
+        return self._total
+
+    def phases(self):
+        """
+        Returns the time spent in each phase
+
+        :return: ``dict`` mapping phase names to times (in seconds)
+        """
+        return dict(self._phases)
+
+    def mark(self, phase):
+        """
+        Records the time since the previous mark (or the start) as the time
+        spent in a phase
+
+        :param phase: The name of the phase
+        """
+        now = time.time()
+        self._phases[phase] = round(now - self._last_mark, 6)
+        self._last_mark = now
+
+    def finish(self):
+        """
+        Records that the service has finished starting
+
+        :return: The time (in seconds) the service took to start
+        """
+        self._total = round(time.time() - self._start, 6)
+        return self._total
+
+    def format(self):
+        """
+        Returns a summary of the time spent in each phase (for logging)
+        """
+        return ", ".join("{}: {:.3f}s".format(phase, seconds)
+                         for phase, seconds in self._phases.items())
+
+
+class _HealthServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    monitor = None
+
+
+class _HealthRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self): # pylint: disable=invalid-name
+        path = self.path.split("?")[0]
+        if path not in ("/health", "/ready"):
+            self.send_error(404)
+            return
+        report = self.server.monitor.report()
+        # The service is alive whenever it answers, but only ready to take
+        # requests once it has registered (and until it starts draining)
+        status = 200 if path == "/health" or report["ready"] else 503
+        body = json.dumps(report).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        logger.debug("Health request: " + format, *args)
+
+
+class HealthMonitor(object):
+    """
+    Tracks whether the service is ready to take requests, and signals it to
+    orchestrators (for example, a Docker health check) via an optional
+    health file, which exists only while the service is ready, and an
+    optional HTTP listener (``/ready`` returns ``503`` until the service is
+    ready, and ``/health`` reports the status of the service).
+    """
+
+    def __init__(self, startup_timer=None, health_file=None, port=0,
+                 address="127.0.0.1"):
+        """
+        Constructor parameters:
+
+        :param startup_timer: The :class:`StartupTimer` of the service
+        :param health_file: The file written while the service is ready
+            (optional)
+        :param port: The port to listen on (``0`` disables the listener)
+        :param address: The address to listen on
+        """
+        self._startup_timer = startup_timer or StartupTimer()
+        self._health_file = health_file
+        self._port = port
+        self._address = address
+        self._status = None
+        self._details = {}
+        self._server = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self.set_status(STATUS_STARTING)
+
+    @property
+    def status(self):
+        """
+        The status of the service (``starting``, ``ready``, ``draining`` or
+        ``stopped``)
+        """
+        return self._status
+
+    @property
+    def ready(self):
+        """
+        Whether the service is ready to take requests
+        """
+        return self._status == STATUS_READY
+
+    def add_detail(self, name, func):
+        """
+        Adds a value to the health report
+
+        :param name: The name of the value
+        :param func: Function returning the value
+        """
+        self._details[name] = func
+
+    def set_status(self, status):
+        """
+        Sets the status of the service, writing the health file when the
+        service becomes ready and removing it otherwise
+
+        :param status: The status
+        """
+        with self._lock:
+            self._status = status
+            if not self._health_file:
+                return
+            try:
+                if status == STATUS_READY:
+                    temp_file = self._health_file + ".tmp"
+                    with open(temp_file, "w") as health_stream:
+                        json.dump(self._report(), health_stream)
+                    if os.path.exists(self._health_file):
+                        os.remove(self._health_file)
+                    os.rename(temp_file, self._health_file)
+                elif os.path.exists(self._health_file):
+                    os.remove(self._health_file)
+            except (IOError, OSError):
+                logger.exception("Error updating health file: %s",
+                                 self._health_file)
+
+    def report(self):
+        """
+        Returns the health report of the service
+
+        :return: ``dict`` containing the status, the time taken by each phase
+            of starting the service, and the values added with
+            :meth:`add_detail`
+        """
+        with self._lock:
+            return self._report()
+
+    def _report(self):
+        report = {
+            "status": self._status,
+            "ready": self._status == STATUS_READY,
+            "uptime": round(time.time() - self._startup_timer.start, 3),
+            "startup": {
+                "phases": self._startup_timer.phases(),
+                "total": self._startup_timer.total
+            }
+        }
+        for name, func in self._details.items():
+            report[name] = func()
+        return report
+
+    def start(self):
+        """
+        Starts listening for health requests in the background
+        """
+        if not self._port:
+            return
+        self._server = _HealthServer((self._address, self._port),
+                                     _HealthRequestHandler)
+        self._server.monitor = self
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="HealthMonitor")
+        self._thread.daemon = True
+        self._thread.start()
+        logger.info("Reporting health on: http://%s:%d/health",
+                    self._address, self._port)
+
+    def stop(self):
+        """
+        Stops listening for health requests
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+            self._thread = None
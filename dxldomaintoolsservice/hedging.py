@@ -0,0 +1,208 @@
+from __future__ import absolute_import
+import logging
+import sys
+import threading
+import time
+
+from dxldomaintoolsservice._compat import Queue, Empty
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+
+class _WorkerPool(object):
+    """
+    Bounded pool of threads which run calls. Threads are started on demand
+    and exit once they have been idle for :attr:`IDLE_TIMEOUT` seconds.
+    """
+
+    #: The time (in seconds) after which an idle thread exits
+    IDLE_TIMEOUT = 60
+
+    def __init__(self, max_threads):
+        """
+        Constructor parameters:
+
+        :param max_threads: The maximum number of threads
+        """
+        self._max_threads = max_threads
+        self._threads = 0
+        self._idle = 0
+        self._tasks = Queue()
+        self._lock = threading.Lock()
+
+    def try_submit(self, func):
+        """
+        Runs a function on a thread of the pool, unless every thread is busy
+
+        :param func: The function (takes no arguments)
+        :return: Whether the function was submitted
+        """
+        with self._lock:
+            if self._idle:
+                self._idle -= 1
+            elif self._threads < self._max_threads:
+                self._threads += 1
+                thread = threading.Thread(target=self._run)
+                thread.daemon = True
+                thread.start()
+            else:
+                return False
+        self._tasks.put(func)
+        return True
+
+    def _run(self):
+        while True:
+            try:
+                func = self._tasks.get(timeout=self.IDLE_TIMEOUT)
+            except Empty:
+                with self._lock:
+                    # Idle threads which were not claimed by a submitter exit
+                    if self._idle:
+                        self._idle -= 1
+                        self._threads -= 1
+                        return
+                continue
+            func()
+            with self._lock:
+                self._idle += 1
+
+
+class HedgingPolicy(object):
+    """
+    Issues a second ("hedged") call to the DomainTools API when the first call
+    has not completed within the recently observed upstream latency
+    percentile for the service. The result of whichever call completes first
+    is used.
+
+    Calls which can not be hedged (the service is not hedged, there are not
+    yet enough latency samples, or the hedge delay is longer than the time
+    remaining for the request) are made on the calling thread. Otherwise, the
+    calls are made on a bounded pool of threads, and are made on the calling
+    thread without hedging if every thread is busy.
+    """
+
+    #: The name of the latency window used to determine the hedge delay
+    UPSTREAM_LATENCY = "upstream"
+
+    def __init__(self, metrics, rate_limiter, budget, services=None,
+                 percentile=95, min_samples=20, max_threads=10):
+        """
+        Constructor parameters:
+
+        :param metrics: The :class:`dxldomaintoolsservice.metrics.Metrics`
+            used to read upstream latencies and report hedges
+        :param rate_limiter: The
+            :class:`dxldomaintoolsservice.ratelimiter.RateLimiter` hedged
+            calls are counted against
+        :param budget: The :class:`dxldomaintoolsservice.retry.RetryBudget`
+            which caps the ratio of hedged calls to requests
+        :param services: The names of the services to hedge
+        :param percentile: The latency percentile after which a hedged call
+            is issued
+        :param min_samples: The number of latency samples required before
+            hedging a service
+        :param max_threads: The maximum number of threads which make hedged
+            (and hedgeable) calls
+        """
+        self._metrics = metrics
+        self._rate_limiter = rate_limiter
+        self._budget = budget
+        self._services = frozenset(services or ())
+        self._percentile = percentile
+        self._min_samples = min_samples
+        self._pool = _WorkerPool(max_threads)
+
+    def is_enabled(self, service):
+        """
+        Returns whether hedging is enabled for the specified service
+
+        :param service: The name of the service
+        :return: Whether hedging is enabled for the service
+        """
+        return service in self._services
+
+    def call(self, service, func, deadline=None):
+        """
+        Invokes the specified function, hedging it if it is slow
+
+        :param service: The name of the service
+        :param func: The function to invoke (takes no arguments)
+        :param deadline: The time by which the request must complete. The
+            call is not hedged if the hedge delay would pass it. (optional)
+        :return: The result of the first call to complete successfully
+        """
+        if not self.is_enabled(service):
+            return func()
+
+        self._budget.deposit()
+        delay = self._metrics.percentile(
+            self.UPSTREAM_LATENCY, service, self._percentile,
+            self._min_samples)
+        if delay is None or \
+                (deadline is not None and deadline - time.time() <= delay):
+            return func()
+
+        results = Queue()
+        if not self._start(func, results):
+            return func()
+        try:
+            return self._result(results.get(timeout=delay))
+        except Empty:
+            pass
+
+        if not self._hedge(func, results):
+            self._metrics.increment("hedges_skipped", service)
+            return self._result(results.get())
+
+        logger.debug("Hedging '%s' call after %.3fs", service, delay)
+        self._metrics.increment("hedges", service)
+
+        hedge, result, exc_info = results.get()
+        if exc_info is not None:
+            # The first call to complete failed, use the other one instead
+            hedge, result, exc_info = results.get()
+        if hedge and exc_info is None:
+            self._metrics.increment("hedge_wins", service)
+        return self._result((hedge, result, exc_info))
+
+    def _hedge(self, func, results):
+        """
+        Issues a hedged call, if the budget, rate limiter and pool allow it
+
+        :return: Whether the hedged call was issued
+        """
+        if not self._budget.try_withdraw():
+            return False
+        if not self._rate_limiter.try_acquire() or \
+                not self._start(func, results, hedge=True):
+            # The hedge was not issued, so its token is not used
+            self._budget.refund()
+            return False
+        return True
+
+    def _start(self, func, results, hedge=False):
+        """
+        Invokes the function on a thread of the pool, placing a tuple of
+        ``(hedge, result, exc_info)`` in the results queue on completion
+
+        :return: Whether the function was started (``False`` if every thread
+            of the pool is busy)
+        """
+        def run():
+            try:
+                results.put((hedge, func(), None))
+            except Exception: # pylint: disable=broad-except
+                results.put((hedge, None, sys.exc_info()))
+        return self._pool.try_submit(run)
+
+    @staticmethod
+    def _result(outcome):
+        """
+        Returns the result of a completed call, re-raising its exception if
+        it failed
+        """
+        _, result, exc_info = outcome
+        if exc_info is not None:
+            raise exc_info[1]
+        return result
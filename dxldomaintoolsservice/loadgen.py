@@ -0,0 +1,420 @@
+"""
+Load generator which replays a trace of requests against the DomainTools DXL
+service over the DXL fabric.
+
+Usage: python -m dxldomaintoolsservice.loadgen <dxlclient.config> <trace>
+[options] (see ``--help``)
+
+Each line of the trace is a JSON object containing the request ``topic`` (or
+just the service name, for example ``whois``) and ``payload``, and optionally
+``other_fields``. Recordings written by the service in ``record`` mode (see
+:mod:`dxldomaintoolsservice.replay`) can also be used as traces.
+
+In closed-loop mode, a fixed number of concurrent callers each send a request
+and wait for its response before sending the next. In open-loop mode,
+requests are sent at a fixed rate regardless of how quickly responses are
+received, which shows how latency grows as the service's queues fill.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+import argparse
+from collections import Counter, OrderedDict
+import itertools
+import json
+import logging
+import threading
+import time
+
+from dxlclient.callbacks import ResponseCallback
+from dxlclient.client import DxlClient
+from dxlclient.client_config import DxlClientConfig
+from dxlclient.message import Message, Request
+
+from dxldomaintoolsservice.app import DomainToolsService
+from dxldomaintoolsservice.metrics import LatencyWindow
+
+#: Callers wait for each response before sending the next request
+MODE_CLOSED = "closed"
+#: Requests are sent at a fixed rate
+MODE_OPEN = "open"
+
+#: The maximum length of an error message in the error breakdown
+MAX_ERROR_LENGTH = 120
+
+
+def iter_trace(path):
+    """
+    Reads the entries of a trace (a request log, or a recording of
+    DomainTools API calls), skipping blank lines
+
+    :param path: The trace file
+    :return: A generator of the entries (``dict``) in the trace
+    """
+    with open(path) as trace_stream:
+        for line in trace_stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+def load_trace(path):
+    """
+    Reads a trace of requests
+
+    :param path: The trace file
+    :return: A list of tuples containing the topic, payload (``bytes``) and
+        other fields of each request
+    """
+    trace = []
+    for entry in iter_trace(path):
+        if "topic" in entry:
+            topic = entry["topic"]
+            payload = entry.get("payload", {})
+        else:
+            # A recording of DomainTools API calls
+            topic = entry["service"]
+            payload = entry.get("params", {})
+        if not topic.startswith("/"):
+            topic = "{}/{}".format(DomainToolsService.SERVICE_TYPE, topic)
+        if not isinstance(payload, bytes):
+            if not isinstance(payload, (str, type(u""))):
+                payload = json.dumps(payload)
+            payload = payload.encode("utf-8")
+        trace.append((topic, payload, entry.get("other_fields", {})))
+    if not trace:
+        raise Exception("Trace is empty: {}".format(path))
+    return trace
+
+
+class LoadResults(object):
+    """
+    The latencies and errors of the requests sent by the load generator
+    """
+
+    def __init__(self, size):
+        """
+        Constructor parameters:
+
+        :param size: The maximum number of latency samples retained
+        """
+        self._size = size
+        self._latencies = LatencyWindow(size)
+        self._topics = OrderedDict()
+        self._errors = Counter()
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.completed = 0
+        self.failed = 0
+        self.start = None
+        self.send_end = None
+        self.end = None
+
+    def add_sent(self):
+        with self._lock:
+            self.sent += 1
+
+    def add(self, topic, latency, error=None):
+        """
+        Records the outcome of a request
+
+        :param topic: The request topic
+        :param latency: The time (in seconds) until the response was received
+        :param error: The error message (``None`` if the request succeeded)
+        """
+        with self._lock:
+            self.completed += 1
+            stats = self._topics.get(topic)
+            if stats is None:
+                stats = self._topics[topic] = {
+                    "latencies": LatencyWindow(self._size),
+                    "errors": 0}
+            if error is None:
+                self._latencies.add(latency)
+                stats["latencies"].add(latency)
+            else:
+                self.failed += 1
+                stats["errors"] += 1
+                self._errors[error[:MAX_ERROR_LENGTH]] += 1
+
+    def summary(self):
+        """
+        Returns a summary of the results as a ``dict``
+        """
+        elapsed = (self.end or time.time()) - self.start
+        send_elapsed = (self.send_end or self.end or time.time()) - self.start
+
+        def latency_summary(latencies):
+            return dict(
+                ("p{}_ms".format(pct), round(latencies.percentile(pct) * 1000,
+                                             3)
+                 if latencies else None)
+                for pct in (50, 90, 99, 100))
+
+        summary = {
+            "sent": self.sent,
+            "completed": self.completed,
+            "errors": self.failed,
+            "elapsed": round(elapsed, 3),
+            "send_rate": round(self.sent / send_elapsed, 3),
+            "throughput": round((self.completed - self.failed) / elapsed, 3),
+            "latency": latency_summary(self._latencies),
+            "topics": OrderedDict(
+                (topic, dict(latency_summary(stats["latencies"]),
+                             requests=len(stats["latencies"]) +
+                             stats["errors"],
+                             errors=stats["errors"]))
+                for topic, stats in self._topics.items()),
+            "error_breakdown": OrderedDict(self._errors.most_common())
+        }
+        return summary
+
+
+def _error_message(response):
+    if response.message_type == Message.MESSAGE_TYPE_ERROR:
+        message = response.error_message
+        if isinstance(message, bytes):
+            message = message.decode("utf-8", "replace")
+        return message or "Error response (code {})".format(
+            response.error_code)
+    return None
+
+
+def _make_request(entry):
+    topic, payload, other_fields = entry
+    request = Request(topic)
+    request.payload = payload
+    if other_fields:
+        request.other_fields = other_fields
+    return request
+
+
+class LoadGenerator(object):
+    """
+    Replays a trace of requests against the service
+    """
+
+    def __init__(self, client, trace, requests=None, duration=None,
+                 timeout=30):
+        """
+        Constructor parameters:
+
+        :param client: The connected DXL client
+        :param trace: The trace (see :func:`load_trace`)
+        :param requests: The number of requests to send (the trace is
+            repeated as needed). Defaults to the length of the trace, unless
+            a duration is specified.
+        :param duration: The time (in seconds) to send requests for
+        :param timeout: The time (in seconds) to wait for each response
+        """
+        self._client = client
+        self._trace = trace
+        self._requests = requests if requests or duration else len(trace)
+        self._duration = duration
+        self._timeout = timeout
+        self._entries = itertools.cycle(trace)
+        self._remaining = self._requests
+        self._deadline = None
+        self._lock = threading.Lock()
+        self.results = LoadResults(max(self._requests or 0, 100000))
+
+    def _next_entry(self):
+        """
+        Returns the next request to send, or ``None`` when the run is over
+        """
+        with self._lock:
+            if self._deadline and time.time() >= self._deadline:
+                return None
+            if self._remaining is not None:
+                if self._remaining <= 0:
+                    return None
+                self._remaining -= 1
+            return next(self._entries)
+
+    def _begin(self):
+        self.results.start = time.time()
+        if self._duration:
+            self._deadline = self.results.start + self._duration
+
+    def run_closed_loop(self, concurrency):
+        """
+        Sends requests from a fixed number of concurrent callers, each
+        waiting for the response to its request before sending the next
+
+        :param concurrency: The number of concurrent callers
+        :return: The :class:`LoadResults`
+        """
+        def caller():
+            while True:
+                entry = self._next_entry()
+                if entry is None:
+                    return
+                start = time.time()
+                self.results.add_sent()
+                try:
+                    response = self._client.sync_request(
+                        _make_request(entry), timeout=self._timeout)
+                    error = _error_message(response)
+                except Exception as ex: # pylint: disable=broad-except
+                    error = "{}: {}".format(ex.__class__.__name__, ex)
+                self.results.add(entry[0], time.time() - start, error)
+
+        self._begin()
+        threads = [threading.Thread(target=caller)
+                   for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.results.end = time.time()
+        return self.results
+
+    def run_open_loop(self, rate):
+        """
+        Sends requests at a fixed rate, regardless of how quickly responses
+        are received
+
+        :param rate: The number of requests to send per second
+        :return: The :class:`LoadResults`
+        """
+        pending = {}
+        lock = threading.Condition()
+        results = self.results
+
+        class _Callback(ResponseCallback):
+            def on_response(self, response):
+                with lock:
+                    sent = pending.pop(response.request_message_id, None)
+                    if sent is not None:
+                        results.add(sent[0], time.time() - sent[1],
+                                    _error_message(response))
+                    if not pending:
+                        lock.notify_all()
+
+        callback = _Callback()
+        self._begin()
+        for index in itertools.count():
+            entry = self._next_entry()
+            if entry is None:
+                break
+            delay = results.start + index / float(rate) - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            request = _make_request(entry)
+            with lock:
+                pending[request.message_id] = (entry[0], time.time())
+            results.add_sent()
+            try:
+                self._client.async_request(request, callback)
+            except Exception as ex: # pylint: disable=broad-except
+                with lock:
+                    pending.pop(request.message_id, None)
+                results.add(entry[0], 0, "{}: {}".format(
+                    ex.__class__.__name__, ex))
+
+        results.send_end = time.time()
+        self._wait_pending(pending, lock)
+        results.end = time.time()
+        return results
+
+    def _wait_pending(self, pending, lock):
+        """
+        Waits for the responses to the outstanding requests, recording those
+        not received within the timeout as timed out
+
+        :param pending: The outstanding requests (``tuple`` of the topic and
+            send time, by message id)
+        :param lock: The condition notified when the last response arrives
+        """
+        deadline = time.time() + self._timeout
+        with lock:
+            while pending and time.time() < deadline:
+                lock.wait(deadline - time.time())
+            for topic, _ in pending.values():
+                self.results.add(topic, self._timeout, "Timed out")
+            pending.clear()
+
+
+def _print_summary(summary, mode, load):
+    print("Mode: {}-loop ({})".format(mode, load))
+    print("Requests: {sent} sent, {completed} completed, {errors} errors "
+          "in {elapsed:.1f}s".format(**summary))
+    print("Send rate: {send_rate:.1f} req/s, throughput: {throughput:.1f} "
+          "successful responses/s".format(**summary))
+    print()
+    row = "{:<60} {:>8} {:>7} {:>9} {:>9} {:>9} {:>9}"
+    print(row.format("topic", "requests", "errors", "p50 ms", "p90 ms",
+                     "p99 ms", "max ms"))
+    for topic, stats in list(summary["topics"].items()) + \
+            [("(all)", dict(summary["latency"],
+                            requests=summary["completed"],
+                            errors=summary["errors"]))]:
+        print(row.format(topic, stats["requests"], stats["errors"],
+                         *[("{:.2f}".format(stats[name])
+                            if stats[name] is not None else "-")
+                           for name in ("p50_ms", "p90_ms", "p99_ms",
+                                        "p100_ms")]))
+    if summary["error_breakdown"]:
+        print()
+        print("Errors:")
+        for message, count in summary["error_breakdown"].items():
+            print("{:>8}  {}".format(count, message))
+
+
+def main(argv=None):
+    """
+    Runs the load generator
+
+    :param argv: The command line arguments (defaults to ``sys.argv``)
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m dxldomaintoolsservice.loadgen",
+        description="Replays a trace of requests against the DomainTools DXL "
+                    "service")
+    parser.add_argument("config", help="the DXL client configuration file")
+    parser.add_argument("trace", help="the trace of requests (JSON lines)")
+    parser.add_argument("--mode", choices=(MODE_CLOSED, MODE_OPEN),
+                        default=MODE_CLOSED,
+                        help="closed-loop (fixed concurrency) or open-loop "
+                             "(fixed rate) (default: %(default)s)")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="concurrent callers in closed-loop mode "
+                             "(default: %(default)s)")
+    parser.add_argument("--rate", type=float, default=10.0,
+                        help="requests per second in open-loop mode "
+                             "(default: %(default)s)")
+    parser.add_argument("--requests", type=int,
+                        help="the number of requests to send (default: the "
+                             "length of the trace)")
+    parser.add_argument("--duration", type=float,
+                        help="the time (in seconds) to send requests for")
+    parser.add_argument("--timeout", type=float, default=30,
+                        help="the time (in seconds) to wait for each "
+                             "response (default: %(default)s)")
+    parser.add_argument("--json", action="store_true",
+                        help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    trace = load_trace(args.trace)
+    config = DxlClientConfig.create_dxl_config_from_file(args.config)
+    with DxlClient(config) as client:
+        client.connect()
+        generator = LoadGenerator(client, trace, requests=args.requests,
+                                  duration=args.duration,
+                                  timeout=args.timeout)
+        if args.mode == MODE_OPEN:
+            results = generator.run_open_loop(args.rate)
+            load = "{} req/s".format(args.rate)
+        else:
+            results = generator.run_closed_loop(args.concurrency)
+            load = "concurrency {}".format(args.concurrency)
+
+    summary = results.summary()
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        _print_summary(summary, args.mode, load)
+
+
+if __name__ == "__main__":
+    main()
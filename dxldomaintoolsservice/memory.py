@@ -0,0 +1,194 @@
+from __future__ import absolute_import
+import logging
+import threading
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+
+class MemoryTracker(object):
+    """
+    Tracks the memory allocated by the service using ``tracemalloc``.
+
+    The net memory retained by each request is attributed to its service.
+    As ``tracemalloc`` counts the allocations of all threads, allocations by
+    concurrent requests for other services (and by background threads) are
+    included, so per-service figures are approximate under concurrency, but
+    a service which retains memory stands out over many requests.
+
+    The top allocation sites (and the sites which grew the most since the
+    previous snapshot) are captured periodically in the background, along
+    with the size of the service's caches.
+    """
+
+    def __init__(self, enabled=False, frames=1, interval=60, top_sites=10,
+                 components=None):
+        """
+        Constructor parameters:
+
+        :param enabled: Whether allocations are tracked. Tracking slows down
+            the service, and is not available on Python 2.
+        :param frames: The number of stack frames recorded for each
+            allocation (more frames make snapshots slower, but allocation
+            sites are reported with their callers)
+        :param interval: The time (in seconds) between snapshots of the top
+            allocation sites
+        :param top_sites: The number of allocation sites reported
+        :param components: ``dict`` mapping names of components (for
+            example, caches) to functions returning their size in bytes
+        """
+        if enabled and tracemalloc is None:
+            raise Exception(
+                "Memory tracking requires Python 3.4 or later")
+        self._enabled = enabled
+        self._frames = frames
+        self._interval = interval
+        self._top_sites = top_sites
+        self._components = dict(components or {})
+        self._services = {}
+        self._snapshot = None
+        self._sites = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def enabled(self):
+        """
+        Whether allocations are tracked
+        """
+        return self._enabled
+
+    def start(self):
+        """
+        Starts tracking allocations and capturing snapshots in the background
+        """
+        if not self._enabled:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self._frames)
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name="MemoryTracker")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops tracking allocations
+        """
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+            tracemalloc.stop()
+
+    def call(self, service, func, *args):
+        """
+        Invokes a function, attributing the memory it retains to the
+        specified service
+
+        :param service: The name of the service
+        :param func: The function
+        :param args: The arguments to the function
+        :return: The result of the function
+        """
+        if self._thread is None:
+            return func(*args)
+        before = tracemalloc.get_traced_memory()[0]
+        try:
+            return func(*args)
+        finally:
+            retained = tracemalloc.get_traced_memory()[0] - before
+            with self._lock:
+                stats = self._services.get(service)
+                if stats is None:
+                    stats = self._services[service] = [0, 0]
+                stats[0] += 1
+                stats[1] += retained
+
+    def stats(self):
+        """
+        Returns the memory statistics
+
+        :return: ``dict`` containing the memory statistics (``None`` if
+            tracking is not enabled)
+        """
+        if not self._enabled:
+            return None
+        stats = {"threads": threading.active_count()}
+        if resource is not None:
+            # Kilobytes on Linux
+            stats["max_rss_bytes"] = \
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        stats["components"] = dict(
+            (name, func()) for name, func in self._components.items())
+        if self._thread is not None:
+            current, peak = tracemalloc.get_traced_memory()
+            stats["traced_bytes"] = current
+            stats["traced_peak_bytes"] = peak
+        with self._lock:
+            stats["services"] = dict(
+                (service, {"requests": requests,
+                           "retained_bytes": retained,
+                           "retained_bytes_per_request":
+                               retained // requests if requests else 0})
+                for service, (requests, retained)
+                in self._services.items())
+            stats.update(self._sites)
+        return stats
+
+    def take_snapshot(self):
+        """
+        Captures the top allocation sites, and the sites which grew the most
+        since the previous snapshot
+        """
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__)))
+        top = snapshot.statistics("traceback" if self._frames > 1
+                                  else "lineno")[:self._top_sites]
+        sites = {
+            "snapshot_time": time.time(),
+            "top_sites": [{
+                "site": self._format_traceback(stat.traceback),
+                "bytes": stat.size,
+                "count": stat.count
+            } for stat in top]
+        }
+        if self._snapshot is not None:
+            growth = snapshot.compare_to(self._snapshot, "lineno")
+            sites["growth_sites"] = [{
+                "site": self._format_traceback(stat.traceback),
+                "bytes": stat.size,
+                "bytes_diff": stat.size_diff,
+                "count_diff": stat.count_diff
+            } for stat in growth[:self._top_sites] if stat.size_diff > 0]
+        self._snapshot = snapshot
+        with self._lock:
+            self._sites = sites
+
+    @staticmethod
+    def _format_traceback(traceback):
+        return " <- ".join("{}:{}".format(frame.filename, frame.lineno)
+                           for frame in reversed(traceback))
+
+    def _run(self):
+        while not self._stop_event.wait(self._interval):
+            try:
+                self.take_snapshot()
+            except Exception: # pylint: disable=broad-except
+                logger.exception("Error capturing memory snapshot")
@@ -0,0 +1,218 @@
+from __future__ import absolute_import
+from bisect import bisect_left
+from collections import deque
+import threading
+
+#: The upper bounds (in seconds) of the latency histogram buckets
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                     10.0, 30.0)
+
+
+class LatencyWindow(object):
+    """
+    Sliding window of the most recent latency samples for a service, along
+    with a histogram of all samples
+    """
+
+    def __init__(self, size=1000):
+        """
+        Constructor parameters:
+
+        :param size: The maximum number of samples retained
+        """
+        self._samples = deque(maxlen=size)
+        self._sorted = []
+        self._unsorted_count = 0
+        self._resort_after = max(1, size // 10)
+        self._count = 0
+        self._total = 0.0
+        # The last bucket counts samples above the largest bound
+        self._bucket_counts = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        """
+        Adds a sample to the window
+
+        :param seconds: The latency (in seconds)
+        """
+        bucket = bisect_left(HISTOGRAM_BUCKETS, seconds)
+        with self._lock:
+            self._samples.append(seconds)
+            self._unsorted_count += 1
+            self._count += 1
+            self._total += seconds
+            self._bucket_counts[bucket] += 1
+
+    def histogram(self):
+        """
+        Returns the histogram of all samples added to the window
+
+        :return: ``tuple`` containing a list of the upper bound and cumulative
+            count of each bucket (the last bound being ``inf``), the number of
+            samples and their sum
+        """
+        with self._lock:
+            counts = list(self._bucket_counts)
+            count, total = self._count, self._total
+        buckets = []
+        cumulative = 0
+        for bound, bucket_count in zip(HISTOGRAM_BUCKETS + (float("inf"),),
+                                       counts):
+            cumulative += bucket_count
+            buckets.append((bound, cumulative))
+        return buckets, count, total
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, pct):
+        """
+        Returns the specified percentile of the samples in the window. The
+        sorted samples are cached and only refreshed once a tenth of the
+        window has changed, which keeps this cheap enough for the request
+        path.
+
+        :param pct: The percentile (0-100)
+        :return: The latency (in seconds) or ``None`` if there are no samples
+        """
+        with self._lock:
+            if self._unsorted_count and \
+                    (self._unsorted_count >= self._resort_after or
+                     len(self._sorted) < self._resort_after):
+                self._sorted = sorted(self._samples)
+                self._unsorted_count = 0
+            if not self._sorted:
+                return None
+            index = int(round(pct / 100.0 * (len(self._sorted) - 1)))
+            return self._sorted[index]
+
+    def summary(self):
+        """
+        Returns a summary of the window as a ``dict``
+
+        :return: A summary of the window
+        """
+        summary = {"count": self._count,
+                   "sum": self._total}
+        for pct in (50, 95, 99):
+            summary["p{}".format(pct)] = self.percentile(pct)
+        return summary
+
+
+class Metrics(object):
+    """
+    Thread-safe registry of counters, gauges and latency windows for the
+    service
+    """
+
+    def __init__(self, window_size=1000):
+        """
+        Constructor parameters:
+
+        :param window_size: The number of latency samples retained per service
+        """
+        self._window_size = window_size
+        self._counters = {}
+        self._gauges = {}
+        self._latencies = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, service=None, value=1):
+        """
+        Increments a counter
+
+        :param name: The name of the counter
+        :param service: The service the counter applies to (if any)
+        :param value: The amount to increment by
+        """
+        key = (name, service)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def counter(self, name, service=None):
+        """
+        Returns the current value of a counter
+
+        :param name: The name of the counter
+        :param service: The service the counter applies to (if any)
+        :return: The value of the counter
+        """
+        return self._counters.get((name, service), 0)
+
+    def set_gauge(self, name, func):
+        """
+        Registers a gauge whose value is read when metrics are collected
+
+        :param name: The name of the gauge
+        :param func: Function (taking no arguments) returning the value
+        """
+        with self._lock:
+            self._gauges[name] = func
+
+    def observe(self, name, service, seconds):
+        """
+        Records a latency sample
+
+        :param name: The name of the latency window
+        :param service: The service the sample applies to
+        :param seconds: The latency (in seconds)
+        """
+        key = (name, service)
+        window = self._latencies.get(key)
+        if window is None:
+            with self._lock:
+                window = self._latencies.setdefault(
+                    key, LatencyWindow(self._window_size))
+        window.add(seconds)
+
+    def percentile(self, name, service, pct, min_samples=1):
+        """
+        Returns the specified percentile of the recent latency samples
+
+        :param name: The name of the latency window
+        :param service: The service
+        :param pct: The percentile (0-100)
+        :param min_samples: The number of samples required
+        :return: The latency (in seconds) or ``None`` if there are not enough
+            samples
+        """
+        window = self._latencies.get((name, service))
+        if window is None or len(window) < min_samples:
+            return None
+        return window.percentile(pct)
+
+    def histograms(self):
+        """
+        Returns the latency histograms
+
+        :return: ``dict`` mapping tuples of the latency window name and
+            service to histograms (see :meth:`LatencyWindow.histogram`)
+        """
+        with self._lock:
+            latencies = list(self._latencies.items())
+        return dict((key, window.histogram()) for key, window in latencies)
+
+    def snapshot(self):
+        """
+        Returns the current metrics as a ``dict``
+
+        :return: The current metrics
+        """
+        with self._lock:
+            counters = list(self._counters.items())
+            gauges = list(self._gauges.items())
+            latencies = list(self._latencies.items())
+
+        snapshot = {"counters": {}, "gauges": {}, "latencies": {}}
+        for (name, service), value in counters:
+            if service is None:
+                snapshot["counters"][name] = value
+            else:
+                snapshot["counters"].setdefault(name, {})[service] = value
+        for name, func in gauges:
+            snapshot["gauges"][name] = func()
+        for (name, service), window in latencies:
+            snapshot["latencies"].setdefault(name, {})[service] = \
+                window.summary()
+        return snapshot
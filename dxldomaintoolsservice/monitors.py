@@ -0,0 +1,239 @@
+from __future__ import absolute_import
+from collections import OrderedDict
+import json
+import logging
+import threading
+import time
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+#: The prefix of the topics on which monitor change events are published. The
+#: event topic for each query is "<MONITOR_EVENT_TOPIC_PREFIX>/<query name>".
+MONITOR_EVENT_TOPIC_PREFIX = "/opendxl-domaintools/event/domaintools/monitor"
+
+#: The monitor services which can be polled, and the lists of entries in
+#: their responses which are compared between polls
+MONITOR_ENTRY_LISTS = {
+    "brand_monitor": ("alerts",),
+    "ip_monitor": ("alerts",),
+    "ip_registrant_monitor": ("added", "modified", "removed"),
+    "name_server_monitor": ("alerts",),
+    "phisheye": ("domains",),
+    "registrant_monitor": ("alerts",)
+}
+
+
+class MonitorQuery(object):
+    """
+    A monitor query which is polled by the :class:`MonitorScheduler`
+    """
+
+    def __init__(self, name, service, params):
+        """
+        Constructor parameters:
+
+        :param name: The name of the query (used in the event topic)
+        :param service: The name of the monitor service
+        :param params: The request parameters (``dict``)
+        """
+        if service not in MONITOR_ENTRY_LISTS:
+            raise Exception(
+                "Unsupported monitor service for query '{}': '{}'. Supported "
+                "services: {}".format(name, service,
+                                      ", ".join(sorted(MONITOR_ENTRY_LISTS))))
+        self.name = name
+        self.service = service
+        self.params = params
+        self.topic = "{}/{}".format(MONITOR_EVENT_TOPIC_PREFIX, name)
+
+    @classmethod
+    def parse(cls, name, value):
+        """
+        Parses a monitor query from its configuration value, a JSON object
+        containing the name of the monitor service (``service``) and the
+        request parameters. For example:
+        ``{"service": "brand_monitor", "query": "domaintools"}``
+
+        :param name: The name of the query
+        :param value: The configuration value
+        :return: The :class:`MonitorQuery`
+        """
+        try:
+            params = json.loads(value)
+        except ValueError:
+            params = None
+        if not isinstance(params, dict) or "service" not in params:
+            raise Exception(
+                "Invalid monitor query '{}': must be a JSON object containing "
+                "a 'service'".format(name))
+        service = params.pop("service")
+        return cls(name, service, params)
+
+
+def _diff_entries(previous, current):
+    """
+    Returns the entries which were added to and removed from a list of
+    entries. Entries are compared by their (canonical) JSON representation.
+    """
+    previous_keys = OrderedDict((json.dumps(entry, sort_keys=True), entry)
+                                for entry in previous)
+    current_keys = OrderedDict((json.dumps(entry, sort_keys=True), entry)
+                               for entry in current)
+    added = [entry for key, entry in current_keys.items()
+             if key not in previous_keys]
+    removed = [entry for key, entry in previous_keys.items()
+               if key not in current_keys]
+    return added, removed
+
+
+class MonitorScheduler(object):
+    """
+    Polls monitor queries on a background thread and publishes the entries
+    which were added or removed since the previous poll.
+
+    The last result set of each query is held in memory (and can be saved
+    across restarts, see :meth:`get_state`). The first poll of a query
+    establishes its result set and does not publish an event. When the date
+    of the results changes, the new results are compared with an empty result
+    set, so that every entry of the new day is published as added and the
+    entries of the previous day are not reported as removed.
+    """
+
+    def __init__(self, queries=None, interval=3600):
+        """
+        Constructor parameters:
+
+        :param queries: The :class:`MonitorQuery` instances to poll
+        :param interval: The time (in seconds) between polls of each query
+        """
+        self._queries = list(queries or ())
+        self._interval = interval
+        self._results = {}
+        self._fetch = None
+        self._publish = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def queries(self):
+        """
+        The monitor queries which are polled
+        """
+        return list(self._queries)
+
+    def start(self, fetch, publish):
+        """
+        Starts polling the monitor queries in the background
+
+        :param fetch: Function, taking a service name and the request
+            parameters, which returns the response of the monitor service
+            (as a Python object)
+        :param publish: Function, taking a :class:`MonitorQuery` and an event
+            payload (``dict``), which publishes a change event
+        """
+        if not self._queries or self._thread:
+            return
+        self._fetch = fetch
+        self._publish = publish
+        self._thread = threading.Thread(target=self._run,
+                                        name="MonitorScheduler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops polling the monitor queries
+        """
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def get_state(self):
+        """
+        Returns the last result set of each query, to be restored after a
+        restart (see :meth:`restore_state`)
+
+        :return: ``dict`` mapping query names to their last result set
+        """
+        return dict(self._results)
+
+    def restore_state(self, state):
+        """
+        Restores the last result sets of the queries, so that the changes
+        made while the service was stopped are published by the first polls.
+        The result sets of queries whose service or parameters changed are
+        ignored.
+
+        :param state: ``dict`` mapping query names to their last result set
+            (see :meth:`get_state`)
+        """
+        for query in self._queries:
+            results = state.get(query.name)
+            if isinstance(results, dict) and \
+                    results.get("service") == query.service and \
+                    results.get("params") == query.params:
+                self._results[query.name] = results
+
+    def poll(self, query):
+        """
+        Polls the specified query, publishing an event for each list of
+        entries which changed since the previous poll
+
+        :param query: The :class:`MonitorQuery`
+        :return: The number of events published
+        """
+        response = self._fetch(query.service, dict(query.params))
+        if isinstance(response, dict) and \
+                isinstance(response.get("response"), dict):
+            response = response["response"]
+        if not isinstance(response, dict):
+            raise Exception(
+                "Unexpected response for monitor query '{}'".format(
+                    query.name))
+
+        current = dict((name, response.get(name) or [])
+                       for name in MONITOR_ENTRY_LISTS[query.service])
+        date = response.get("date")
+        previous = self._results.get(query.name)
+        self._results[query.name] = {"service": query.service,
+                                     "params": query.params,
+                                     "date": date,
+                                     "lists": current}
+        if previous is None:
+            return 0
+        # Results of different days are not compared
+        previous_lists = previous["lists"] if previous["date"] == date \
+            else {}
+
+        published = 0
+        for name, entries in current.items():
+            added, removed = _diff_entries(previous_lists.get(name, []),
+                                           entries)
+            if added or removed:
+                self._publish(query, {
+                    "query": query.name,
+                    "service": query.service,
+                    "params": query.params,
+                    "list": name,
+                    "date": response.get("date"),
+                    "added": added,
+                    "removed": removed
+                })
+                published += 1
+        return published
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            start = time.time()
+            for query in self._queries:
+                if self._stop_event.is_set():
+                    return
+                try:
+                    self.poll(query)
+                except Exception: # pylint: disable=broad-except
+                    logger.exception("Error polling monitor query '%s'",
+                                     query.name)
+            self._stop_event.wait(
+                max(0, self._interval - (time.time() - start)))
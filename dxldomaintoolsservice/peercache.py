@@ -0,0 +1,405 @@
+from __future__ import absolute_import
+from bisect import bisect
+from collections import OrderedDict, deque
+import hashlib
+import logging
+import threading
+import time
+import uuid
+import zlib
+
+from dxlclient.message import Event, Message, Request
+from dxlbootstrap.util import MessageUtils
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+#: Event announcing that an instance of the service has started (peers
+#: answer with :data:`EVENT_HELLO`)
+EVENT_JOIN = "join"
+#: Event announcing that an instance of the service is running
+EVENT_HELLO = "hello"
+#: Event announcing the responses added to the cache of an instance
+EVENT_FILL = "fill"
+#: Event announcing that an instance of the service is stopping
+EVENT_BYE = "bye"
+
+#: The response "other field" containing the time a shared response expires
+EXPIRES_OTHER_FIELD = "expires"
+
+#: The number of heartbeat intervals after which a silent peer is forgotten
+PEER_EXPIRY_HEARTBEATS = 3
+
+#: The maximum number of cache fills waiting to be announced
+MAX_PENDING_FILLS = 10000
+
+#: The number of consecutive failed requests after which a peer is forgotten
+#: (until it next announces itself). A single failure does not change the
+#: owners of keys.
+MAX_PEER_FAILURES = 3
+
+
+def key_digest(key):
+    """
+    Returns the compact digest of a cache key, used to announce cache fills
+
+    :param key: The cache key
+    :return: The digest (``str``)
+    """
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+class HashRing(object):
+    """
+    Consistent hash ring mapping cache keys to the instance of the service
+    which owns them. When an instance joins or leaves, only the keys it owns
+    move to other instances.
+    """
+
+    def __init__(self, nodes=(), virtual_nodes=100):
+        """
+        Constructor parameters:
+
+        :param nodes: The identifiers of the instances
+        :param virtual_nodes: The number of points on the ring per instance
+            (more points spread keys more evenly)
+        """
+        self._virtual_nodes = virtual_nodes
+        self._ring = ([], [])
+        self.set_nodes(nodes)
+
+    @staticmethod
+    def _hash(value):
+        # Python's hash() is randomized per process, so a stable hash is used
+        # for all instances to agree on the owners of keys
+        return int(hashlib.md5(value.encode("utf-8")).hexdigest()[:8], 16)
+
+    def set_nodes(self, nodes):
+        """
+        Sets the instances on the ring
+
+        :param nodes: The identifiers of the instances
+        """
+        ring = sorted((self._hash("{}#{}".format(node, index)), node)
+                      for node in nodes
+                      for index in range(self._virtual_nodes))
+        self._ring = ([point for point, _ in ring],
+                      [node for _, node in ring])
+
+    def owner(self, key):
+        """
+        Returns the instance which owns a key
+
+        :param key: The key
+        :return: The identifier of the instance (``None`` if the ring is
+            empty)
+        """
+        points, nodes = self._ring
+        if not nodes:
+            return None
+        return nodes[bisect(points, self._hash(key)) % len(points)]
+
+
+class PeerCache(object):
+    """
+    Shares the response cache between the instances of the service, so that
+    adding instances increases the effective cache size rather than the
+    number of DomainTools API calls.
+
+    Instances announce themselves and the responses they add to their cache
+    (as compact key digests, batched) on a DXL event topic. On a cache miss,
+    the instance which announced the response (or, failing that, the owner
+    of the key on a consistent hash ring of the running instances) is asked
+    for it via a DXL request topic unique to that instance, before the
+    DomainTools API is invoked. Responses fetched from a peer are only kept
+    locally by the owner of their key, so that each response is cached once
+    across the instances. As the owner of a key has usually not cached its
+    response, the owner is only waited for briefly.
+    """
+
+    def __init__(self, cache, topic_prefix, enabled=False, timeout=0.5,
+                 heartbeat_interval=10, notify_interval=1,
+                 directory_size=100000, virtual_nodes=100,
+                 owner_timeout=0.1):
+        """
+        Constructor parameters:
+
+        :param cache: The :class:`dxldomaintoolsservice.cache.ResponseCache`
+        :param topic_prefix: The prefix of the DXL topics used to communicate
+            with peers
+        :param enabled: Whether the cache is shared
+        :param timeout: The maximum time (in seconds) to wait for a peer
+        :param heartbeat_interval: The time (in seconds) between announcements
+            that the instance is running
+        :param notify_interval: The time (in seconds) between announcements
+            of the responses added to the cache
+        :param directory_size: The maximum number of responses cached by
+            peers which are tracked
+        :param virtual_nodes: The number of points on the consistent hash
+            ring per instance
+        :param owner_timeout: The maximum time (in seconds) to wait for the
+            owner of a key which has not announced the response
+        """
+        self._cache = cache
+        self._topic_prefix = topic_prefix
+        self._enabled = enabled
+        self._timeout = timeout
+        self._owner_timeout = owner_timeout
+        self._heartbeat_interval = heartbeat_interval
+        self._notify_interval = notify_interval
+        self._directory_size = directory_size
+        self._instance_id = uuid.uuid4().hex
+        self._ring = HashRing([self._instance_id], virtual_nodes)
+        self._peers = {}
+        self._failures = {}
+        self._directory = OrderedDict()
+        self._pending_fills = deque(maxlen=MAX_PENDING_FILLS)
+        self._hits = 0
+        self._misses = 0
+        self._errors = 0
+        self._served = 0
+        self._fills_published = 0
+        self._client = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def enabled(self):
+        """
+        Whether the cache is shared
+        """
+        return self._enabled
+
+    @property
+    def instance_id(self):
+        """
+        The identifier of this instance of the service
+        """
+        return self._instance_id
+
+    @property
+    def event_topic(self):
+        """
+        The DXL topic instances announce themselves and cache fills on
+        """
+        return "{}/event".format(self._topic_prefix)
+
+    @property
+    def request_topic(self):
+        """
+        The DXL topic peers request cached responses from this instance on
+        """
+        return self._get_request_topic(self._instance_id)
+
+    def _get_request_topic(self, instance_id):
+        return "{}/{}".format(self._topic_prefix, instance_id)
+
+    def start(self, client):
+        """
+        Announces this instance to its peers, and starts announcing cache
+        fills in the background
+
+        :param client: The DXL client
+        """
+        if not self._enabled:
+            return
+        self._client = client
+        self._stop_event.clear()
+        self._publish({"type": EVENT_JOIN})
+        self._thread = threading.Thread(target=self._run, name="PeerCache")
+        self._thread.daemon = True
+        self._thread.start()
+        logger.info("Sharing cache with peers as instance: %s",
+                    self._instance_id)
+
+    def stop(self):
+        """
+        Announces that this instance is stopping, so that peers no longer
+        request cached responses from it
+        """
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        self._publish({"type": EVENT_BYE})
+
+    def fetch(self, key, timeout=None):
+        """
+        Requests a response from the peer which cached it (or owns its key)
+
+        :param key: The cache key
+        :param timeout: The time (in seconds) the caller is willing to wait
+        :return: The canonical payload (``bytes``) or ``None`` if no peer
+            has the response
+        """
+        if not self._enabled or self._client is None:
+            return None
+        peer, announced = self._find_peer(key)
+        if peer is None:
+            return None
+        peer_timeout = self._timeout if announced else self._owner_timeout
+        request = Request(self._get_request_topic(peer))
+        request.payload = key.encode("utf-8")
+        try:
+            response = self._client.sync_request(
+                request, min(peer_timeout, timeout)
+                if timeout else peer_timeout)
+        except Exception: # pylint: disable=broad-except
+            logger.debug("Error requesting cached response from peer: %s",
+                         peer, exc_info=True)
+            response = None
+        if response is None or \
+                response.message_type == Message.MESSAGE_TYPE_ERROR:
+            with self._lock:
+                self._errors += 1
+                self._failures[peer] = self._failures.get(peer, 0) + 1
+                # The peer is forgotten until it next announces itself
+                if self._failures[peer] >= MAX_PEER_FAILURES:
+                    self._remove_peer(peer)
+            return None
+        with self._lock:
+            self._failures.pop(peer, None)
+            if not response.payload:
+                self._misses += 1
+                return None
+            self._hits += 1
+        if self._ring.owner(key) == self._instance_id:
+            self._cache.put_entry(
+                key, float(response.other_fields.get(EXPIRES_OTHER_FIELD, 0)),
+                response.payload)
+        return zlib.decompress(response.payload)
+
+    def get_shared(self, key):
+        """
+        Returns a cached response requested by a peer
+
+        :param key: The cache key
+        :return: Tuple containing the time the response expires and the
+            compressed payload, or ``None`` if the response is not cached
+        """
+        entry = self._cache.get_entry(key)
+        if entry is not None:
+            with self._lock:
+                self._served += 1
+        return entry
+
+    def notify_fill(self, key, expires):
+        """
+        Queues the announcement of a response added to the cache
+
+        :param key: The cache key
+        :param expires: The time the response expires
+        """
+        if self._enabled:
+            self._pending_fills.append([key_digest(key), int(expires)])
+
+    def on_event(self, event):
+        """
+        Handles an announcement from a peer
+
+        :param event: The event payload (``dict``)
+        """
+        instance_id = event.get("instance")
+        if not instance_id or instance_id == self._instance_id:
+            return
+        event_type = event.get("type")
+        with self._lock:
+            if event_type == EVENT_BYE:
+                self._remove_peer(instance_id)
+                return
+            if instance_id not in self._peers:
+                logger.info("Peer joined: %s", instance_id)
+                self._peers[instance_id] = time.time()
+                self._update_ring()
+            else:
+                self._peers[instance_id] = time.time()
+            if event_type == EVENT_FILL:
+                for digest, expires in event.get("fills", []):
+                    self._directory.pop(digest, None)
+                    self._directory[digest] = (instance_id, expires)
+                while len(self._directory) > self._directory_size:
+                    self._directory.popitem(last=False)
+        # A new instance learns of its peers without waiting for their next
+        # heartbeat
+        if event_type == EVENT_JOIN and self._thread is not None:
+            self._publish({"type": EVENT_HELLO})
+
+    def stats(self):
+        """
+        Returns the statistics of the shared cache
+
+        :return: ``dict`` containing the statistics
+        """
+        with self._lock:
+            return {
+                "peers": len(self._peers),
+                "directory_entries": len(self._directory),
+                "hits": self._hits,
+                "misses": self._misses,
+                "errors": self._errors,
+                "served": self._served,
+                "fills_published": self._fills_published
+            }
+
+    def _find_peer(self, key):
+        """
+        Returns the peer to request a response from: the peer which announced
+        it, otherwise the owner of its key (unless this instance owns it)
+
+        :return: Tuple containing the peer (``None`` if there is none) and
+            whether it announced the response
+        """
+        digest = key_digest(key)
+        with self._lock:
+            entry = self._directory.get(digest)
+            if entry is not None:
+                peer, expires = entry
+                if expires > time.time() and peer in self._peers:
+                    return peer, True
+                del self._directory[digest]
+        owner = self._ring.owner(key)
+        return (owner if owner != self._instance_id else None), False
+
+    def _remove_peer(self, instance_id):
+        self._failures.pop(instance_id, None)
+        if self._peers.pop(instance_id, None) is not None:
+            logger.info("Peer left: %s", instance_id)
+            self._update_ring()
+
+    def _update_ring(self):
+        self._ring.set_nodes(list(self._peers) + [self._instance_id])
+
+    def _publish(self, payload):
+        payload["instance"] = self._instance_id
+        event = Event(self.event_topic)
+        MessageUtils.dict_to_json_payload(event, payload)
+        try:
+            self._client.send_event(event)
+        except Exception: # pylint: disable=broad-except
+            logger.exception("Error publishing peer cache event")
+
+    def _publish_fills(self):
+        fills = []
+        while self._pending_fills:
+            fills.append(self._pending_fills.popleft())
+        if fills:
+            self._publish({"type": EVENT_FILL, "fills": fills})
+            with self._lock:
+                self._fills_published += len(fills)
+
+    def _run(self):
+        last_heartbeat = time.time()
+        while not self._stop_event.wait(self._notify_interval):
+            self._publish_fills()
+            now = time.time()
+            if now - last_heartbeat >= self._heartbeat_interval:
+                self._publish({"type": EVENT_HELLO})
+                last_heartbeat = now
+            # Peers which stopped without announcing it are forgotten
+            with self._lock:
+                for instance_id, last_seen in list(self._peers.items()):
+                    if now - last_seen > \
+                            PEER_EXPIRY_HEARTBEATS * self._heartbeat_interval:
+                        self._remove_peer(instance_id)
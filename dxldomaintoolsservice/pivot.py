@@ -0,0 +1,381 @@
+from __future__ import absolute_import
+from collections import OrderedDict, deque
+import logging
+import threading
+import time
+
+from domaintools.exceptions import ServiceException
+from dxldomaintoolsservice._compat import string_types
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+#: A domain name
+ENTITY_DOMAIN = "domain"
+#: An IP address
+ENTITY_IP = "ip"
+#: A registrant (organization, name or email address in Whois records)
+ENTITY_REGISTRANT = "registrant"
+
+#: The types of entities which can be expanded
+ENTITY_TYPES = (ENTITY_DOMAIN, ENTITY_IP, ENTITY_REGISTRANT)
+
+#: The domain resolves to the IP address
+RELATION_RESOLVES_TO = "resolves_to"
+#: The domain is registered to the registrant
+RELATION_REGISTERED_TO = "registered_to"
+#: The IP address hosts the domain
+RELATION_HOSTS = "hosts"
+#: The registrant has registered the domain
+RELATION_REGISTRANT_OF = "registrant_of"
+
+#: The DomainTools API method used to expand each type of entity, and the
+#: parameter the entity is passed as
+PIVOTS = {
+    ENTITY_DOMAIN: ("iris", "domain"),
+    ENTITY_IP: ("host_domains", "ip"),
+    ENTITY_REGISTRANT: ("reverse_whois", "query")
+}
+
+#: Registrants containing these terms (in lower case) are privacy services,
+#: which are not expanded as they are shared by unrelated domains
+PRIVACY_REGISTRANT_TERMS = ("redacted", "privacy", "data protected",
+                            "not disclosed", "withheld")
+
+
+def _value(item):
+    # Iris fields are either plain values or objects with a "value"
+    if isinstance(item, dict):
+        return item.get("value")
+    return item
+
+
+def _as_list(item):
+    if item is None:
+        return []
+    return item if isinstance(item, list) else [item]
+
+
+def normalize_entity(entity_type, value):
+    """
+    Returns the normalized value of an entity, so that the same entity found
+    via different lookups is only expanded once
+
+    :param entity_type: The type of the entity
+    :param value: The value of the entity
+    :return: The normalized value (``None`` if empty)
+    """
+    if not value or not isinstance(value, string_types):
+        return None
+    value = value.strip()
+    if entity_type == ENTITY_DOMAIN:
+        value = value.lower().rstrip(".")
+    elif entity_type == ENTITY_REGISTRANT:
+        value = " ".join(value.split())
+    return value or None
+
+
+def _extract_iris(data):
+    """
+    Returns the IP addresses and registrant of a domain from an ``iris``
+    response
+    """
+    neighbours = []
+    for result in _as_list(data.get("results")):
+        if not isinstance(result, dict):
+            continue
+        for address in _as_list(result.get("ip")):
+            if isinstance(address, dict):
+                address = _value(address.get("address"))
+            neighbours.append((ENTITY_IP, address, RELATION_RESOLVES_TO))
+        admin_contact = result.get("admin_contact")
+        for registrant in (
+                _value(result.get("registrant_org")),
+                _value(result.get("registrant_name")),
+                _value(admin_contact.get("org"))
+                if isinstance(admin_contact, dict) else None):
+            if registrant:
+                neighbours.append((ENTITY_REGISTRANT, registrant,
+                                   RELATION_REGISTERED_TO))
+                break
+    return neighbours, {}
+
+
+def _extract_host_domains(data):
+    """
+    Returns the domains hosted on an IP address from a ``host_domains``
+    response
+    """
+    neighbours = []
+    domain_count = 0
+    for ip_addresses in _as_list(data.get("ip_addresses")):
+        if not isinstance(ip_addresses, dict):
+            continue
+        domain_count += ip_addresses.get("domain_count") or 0
+        for domain in _as_list(ip_addresses.get("domain_names")):
+            neighbours.append((ENTITY_DOMAIN, domain, RELATION_HOSTS))
+    return neighbours, {"domain_count": domain_count}
+
+
+def _extract_reverse_whois(data):
+    """
+    Returns the domains registered by a registrant from a ``reverse_whois``
+    response (only listed if the report was purchased)
+    """
+    neighbours = [(ENTITY_DOMAIN, domain, RELATION_REGISTRANT_OF)
+                  for domain in _as_list(data.get("domains"))]
+    domain_count = data.get("domain_count")
+    if isinstance(domain_count, dict):
+        domain_count = domain_count.get("current")
+    return neighbours, {"domain_count": domain_count} \
+        if domain_count is not None else {}
+
+
+_EXTRACTORS = {
+    ENTITY_DOMAIN: _extract_iris,
+    ENTITY_IP: _extract_host_domains,
+    ENTITY_REGISTRANT: _extract_reverse_whois
+}
+
+
+class PivotExpander(object):
+    """
+    Expands the graph of entities related to a seed entity on the service
+    side: a domain is expanded to its IP addresses and registrant (``iris``),
+    an IP address to the domains it hosts (``host_domains``), and a
+    registrant to the domains it registered (``reverse_whois``).
+
+    Each hop is expanded in parallel, and entities are deduplicated, so that
+    each is looked up once. Lookups are made through the response cache,
+    rate limiter and budget of the service, and are subject to the limits of
+    the client the graph is expanded for.
+    """
+
+    def __init__(self, lookup, max_nodes=500, max_parallel=4):
+        """
+        Constructor parameters:
+
+        :param lookup: Function invoking a DomainTools API method, which is
+            passed the name of the method, the request parameters, the
+            timeout, the priority and the client key, and returns the
+            response data
+        :param max_nodes: The maximum number of entities in a graph
+        :param max_parallel: The maximum number of lookups made in parallel
+            for a graph
+        """
+        self._lookup = lookup
+        self._max_nodes = max_nodes
+        self._max_parallel = max_parallel
+
+    def expand(self, entity_type, value, depth=1, max_fanout=10,
+               purchase=False, timeout=None, priority=None, client_key=None):
+        # The options of the pivot request are arguments of their own
+        # pylint: disable=too-many-locals
+        """
+        Expands the graph of entities related to a seed entity
+
+        :param entity_type: The type of the seed entity (``domain``, ``ip``
+            or ``registrant``)
+        :param value: The value of the seed entity
+        :param depth: The number of hops to expand
+        :param max_fanout: The maximum number of related entities followed
+            from each entity
+        :param purchase: Whether reverse Whois reports are purchased to
+            expand registrants (otherwise registrants are not expanded)
+        :param timeout: The time (in seconds) the caller is willing to wait.
+            Expansion stops (and the graph is reported as incomplete) when
+            it elapses.
+        :param priority: The priority of the lookups
+        :param client_key: The key of the client the graph is expanded for
+            (see :mod:`dxldomaintoolsservice.fairness`)
+        :return: ``dict`` containing the ``nodes`` and ``edges`` of the graph
+        """
+        if entity_type not in ENTITY_TYPES:
+            raise Exception("Invalid entity type: '{}'. {}".format(
+                entity_type, "Supported types are: {}.".format(
+                    ", ".join(ENTITY_TYPES))))
+        seed_value = normalize_entity(entity_type, value)
+        if seed_value is None:
+            raise Exception("Invalid entity value: '{}'".format(value))
+
+        start = time.time()
+        deadline = start + timeout if timeout else None
+        nodes = OrderedDict()
+        edges = OrderedDict()
+        seed = self._add_node(nodes, entity_type, seed_value, 0)
+        frontier = [seed]
+        lookups = 0
+        complete = True
+
+        for _ in range(depth):
+            frontier = [node for node in frontier if self._is_expandable(
+                node, purchase)]
+            if not frontier:
+                break
+            if deadline and time.time() >= deadline:
+                complete = False
+                break
+            lookups += len(frontier)
+            frontier, hop_complete = self._expand_frontier(
+                frontier, nodes, edges, max_fanout,
+                lambda node: self._expand_node(node, deadline, priority,
+                                               client_key))
+            complete = complete and hop_complete
+
+        return {
+            "seed": seed["id"],
+            "nodes": list(nodes.values()),
+            "edges": list(edges.values()),
+            "lookups": lookups,
+            "complete": complete,
+            "elapsed": round(time.time() - start, 6)
+        }
+
+    def _expand_frontier(self, frontier, nodes, edges, max_fanout,
+                         expand_node):
+        """
+        Expands the nodes found in the previous hop
+
+        :param frontier: The nodes to expand
+        :param nodes: The nodes of the graph (by id)
+        :param edges: The edges of the graph
+        :param max_fanout: The maximum number of related entities followed
+            from each node
+        :param expand_node: The function which looks up the entities related
+            to a node
+        :return: ``tuple`` of the new nodes, and whether every related entity
+            was found and followed
+        """
+        complete = True
+        next_frontier = []
+        results = self._map(expand_node, frontier)
+        for node, (neighbours, attributes, error) in zip(frontier, results):
+            node.update(attributes)
+            if error:
+                node["error"] = error
+                complete = False
+            truncated = self._follow(node, neighbours, nodes, edges,
+                                     max_fanout, next_frontier)
+            if truncated:
+                node["truncated"] = truncated
+                complete = False
+        return next_frontier, complete
+
+    def _follow(self, node, neighbours, nodes, edges, max_fanout,
+                next_frontier):
+        """
+        Adds the edges (and new nodes) for the entities related to a node
+
+        :param node: The node
+        :param neighbours: The related entities (``tuple`` of the entity
+            type, value and relation)
+        :param nodes: The nodes of the graph (by id)
+        :param edges: The edges of the graph
+        :param max_fanout: The maximum number of related entities followed
+        :param next_frontier: The list the new nodes are appended to
+        :return: The number of related entities not followed
+        """
+        followed = set()
+        truncated = 0
+        for neighbour_type, neighbour_value, relation in neighbours:
+            neighbour_value = normalize_entity(neighbour_type,
+                                               neighbour_value)
+            if neighbour_value is None:
+                continue
+            neighbour_id = self._node_id(neighbour_type, neighbour_value)
+            if neighbour_id == node["id"] or neighbour_id in followed:
+                continue
+            if len(followed) >= max_fanout or (
+                    neighbour_id not in nodes and
+                    len(nodes) >= self._max_nodes):
+                truncated += 1
+                continue
+            followed.add(neighbour_id)
+            if neighbour_id not in nodes:
+                next_frontier.append(self._add_node(
+                    nodes, neighbour_type, neighbour_value,
+                    node["depth"] + 1))
+            edges[(node["id"], neighbour_id, relation)] = {
+                "source": node["id"], "target": neighbour_id,
+                "relation": relation}
+        return truncated
+
+    @staticmethod
+    def _node_id(entity_type, value):
+        return "{}:{}".format(entity_type, value)
+
+    def _add_node(self, nodes, entity_type, value, depth):
+        node_id = self._node_id(entity_type, value)
+        node = nodes[node_id] = {"id": node_id, "type": entity_type,
+                                 "value": value, "depth": depth}
+        return node
+
+    @staticmethod
+    def _is_expandable(node, purchase):
+        if node["type"] != ENTITY_REGISTRANT:
+            return True
+        # Expanding a registrant returns the domains it registered only if
+        # the report is purchased, and privacy services are shared by
+        # unrelated domains
+        value = node["value"].lower()
+        return purchase and not any(term in value
+                                    for term in PRIVACY_REGISTRANT_TERMS)
+
+    def _expand_node(self, node, deadline, priority, client_key):
+        """
+        Looks up the entities related to an entity
+
+        :return: Tuple containing the related entities (tuples of type, value
+            and relation), the attributes of the entity, and the error
+            message (if the lookup failed)
+        """
+        service_name, param = PIVOTS[node["type"]]
+        params = {param: node["value"]}
+        if node["type"] == ENTITY_REGISTRANT:
+            params["mode"] = "purchase"
+        timeout = max(0.0, deadline - time.time()) if deadline else None
+        try:
+            data = self._lookup(service_name, params, timeout, priority,
+                                client_key)
+        except ServiceException as ex:
+            return [], {}, "{}: {}".format(ex.__class__.__name__, ex.reason)
+        except Exception as ex: # pylint: disable=broad-except
+            logger.debug("Error expanding entity: %s", node["id"],
+                         exc_info=True)
+            return [], {}, str(ex) or ex.__class__.__name__
+        if isinstance(data, dict) and isinstance(data.get("response"), dict):
+            data = data["response"]
+        if not isinstance(data, dict):
+            return [], {}, None
+        neighbours, attributes = _EXTRACTORS[node["type"]](data)
+        return neighbours, attributes, None
+
+    def _map(self, func, items):
+        """
+        Invokes a function for each item, using up to the maximum number of
+        parallel lookups
+
+        :return: The results, in the order of the items
+        """
+        if len(items) == 1 or self._max_parallel <= 1:
+            return [func(item) for item in items]
+        results = [None] * len(items)
+        pending = deque(enumerate(items))
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                with lock:
+                    if not pending:
+                        return
+                    index, item = pending.popleft()
+                results[index] = func(item)
+
+        threads = [threading.Thread(target=worker, name="PivotExpander")
+                   for _ in range(min(self._max_parallel, len(items)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
@@ -0,0 +1,271 @@
+from __future__ import absolute_import
+from collections import Counter
+import cProfile
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+#: Every function call made while handling requests is profiled
+MODE_DETERMINISTIC = "deterministic"
+#: The stacks of all threads are sampled at a fixed interval
+MODE_SAMPLING = "sampling"
+#: The supported profiling modes
+MODES = (MODE_DETERMINISTIC, MODE_SAMPLING)
+
+#: Functions are sorted by cumulative time (including the functions they call)
+SORT_CUMULATIVE = "cumulative"
+#: Functions are sorted by the time spent in the function itself
+SORT_SELF = "self"
+#: The supported sort orders
+SORT_ORDERS = (SORT_CUMULATIVE, SORT_SELF)
+
+#: Whether ``cProfile`` profiles every thread. From Python 3.12 it is built on
+#: ``sys.monitoring``, which permits only one profile to be enabled at a time
+#: (across all threads), so a single profile is shared by all requests.
+SHARED_PROFILE = sys.version_info >= (3, 12)
+
+
+def _format_function(filename, line, name):
+    return "{}:{}({})".format(filename, line, name)
+
+
+class Profiler(object):
+    """
+    Captures time-boxed profiles of the running service, to find hot paths
+    under real load.
+
+    In ``deterministic`` mode, each request handled while the profile is
+    running is profiled with ``cProfile`` and the results are aggregated
+    (from Python 3.12, a single ``cProfile`` profile of every thread is used
+    instead, see :data:`SHARED_PROFILE`; if another profiler is already
+    active, ``sampling`` mode is used). In ``sampling`` mode, the stacks of
+    all threads are sampled at a fixed interval, which has much lower
+    overhead but only approximates where time is spent. Only one profile can
+    run at a time.
+    """
+
+    def __init__(self, max_duration=60, sample_interval=0.005):
+        """
+        Constructor parameters:
+
+        :param max_duration: The maximum duration (in seconds) of a profile
+        :param sample_interval: The time (in seconds) between samples in
+            ``sampling`` mode
+        """
+        self._max_duration = max_duration
+        self._sample_interval = sample_interval
+        self._running = False
+        self._stats = None
+        self._counting = False
+        self._profiled_calls = 0
+        self._lock = threading.Lock()
+
+    @property
+    def is_running(self):
+        """
+        Whether a profile is running
+        """
+        return self._running
+
+    @property
+    def max_duration(self):
+        """
+        The maximum duration (in seconds) of a profile
+        """
+        return self._max_duration
+
+    def call(self, func, *args):
+        """
+        Invokes a function, profiling it if a ``deterministic`` profile is
+        running
+
+        :param func: The function
+        :param args: The arguments to the function
+        :return: The result of the function
+        """
+        if self._counting:
+            # The shared profile is already profiling this thread
+            with self._lock:
+                self._profiled_calls += 1
+            return func(*args)
+        if self._stats is None:
+            return func(*args)
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(func, *args)
+        finally:
+            with self._lock:
+                if self._stats is not None:
+                    self._stats.add(profile)
+                    self._profiled_calls += 1
+
+    def profile(self, mode, duration, limit=30, sort=SORT_CUMULATIVE):
+        """
+        Runs a profile, blocking until it completes
+
+        :param mode: ``deterministic`` or ``sampling``
+        :param duration: The duration (in seconds) of the profile (capped at
+            the maximum duration)
+        :param limit: The number of functions included in the results
+        :param sort: ``cumulative`` or ``self``
+        :return: ``dict`` containing the aggregated function statistics
+        """
+        if mode not in MODES:
+            raise Exception("Invalid profiling mode: '{}'".format(mode))
+        if sort not in SORT_ORDERS:
+            raise Exception("Invalid sort order: '{}'".format(sort))
+        duration = min(float(duration), self._max_duration)
+        with self._lock:
+            if self._running:
+                raise Exception("A profile is already running")
+            self._running = True
+        start = time.time()
+        try:
+            if mode == MODE_DETERMINISTIC:
+                try:
+                    functions, profiled = self._profile_calls(duration)
+                except ValueError:
+                    # Another profiler (or debugger) is active
+                    logger.warning("Unable to start a deterministic "
+                                   "profile, sampling instead",
+                                   exc_info=True)
+                    mode = MODE_SAMPLING
+                    functions, profiled = self._sample(duration)
+            else:
+                functions, profiled = self._sample(duration)
+        finally:
+            with self._lock:
+                self._running = False
+
+        if mode == MODE_DETERMINISTIC:
+            key = "cumulative_time" if sort == SORT_CUMULATIVE \
+                else "self_time"
+        else:
+            key = "total_samples" if sort == SORT_CUMULATIVE \
+                else "self_samples"
+        functions.sort(key=lambda function: function[key], reverse=True)
+        return {
+            "mode": mode,
+            "start": start,
+            "duration": round(time.time() - start, 3),
+            "sort": sort,
+            "requests" if mode == MODE_DETERMINISTIC else "samples": profiled,
+            "functions": functions[:limit]
+        }
+
+    def _profile_calls(self, duration):
+        """
+        Aggregates the profiles of the requests handled during the specified
+        time (see :meth:`call`)
+        """
+        if SHARED_PROFILE:
+            stats, profiled = self._profile_shared(duration)
+        else:
+            # An empty profile, to which the profiles of requests are added
+            profile = cProfile.Profile()
+            profile.enable()
+            profile.disable()
+            with self._lock:
+                self._stats = pstats.Stats(profile)
+                self._profiled_calls = 0
+            time.sleep(duration)
+            with self._lock:
+                stats, self._stats = self._stats, None
+                profiled = self._profiled_calls
+        functions = [{
+            "function": _format_function(*func),
+            "calls": calls,
+            "primitive_calls": primitive_calls,
+            "self_time": round(self_time, 6),
+            "cumulative_time": round(cumulative_time, 6)
+        } for func, (primitive_calls, calls, self_time, cumulative_time, _)
+                     in stats.stats.items()]
+        return functions, profiled
+
+    def _profile_shared(self, duration):
+        """
+        Profiles every thread for the specified time with a single profile,
+        counting the requests handled (see :meth:`call`)
+        """
+        profile = cProfile.Profile()
+        profile.enable()
+        with self._lock:
+            self._counting = True
+            self._profiled_calls = 0
+        try:
+            time.sleep(duration)
+        finally:
+            profile.disable()
+            with self._lock:
+                self._counting = False
+                profiled = self._profiled_calls
+        return pstats.Stats(profile), profiled
+
+    def _sample(self, duration):
+        """
+        Samples the stacks of all threads (other than the current one) for
+        the specified time
+        """
+        current_thread = threading.current_thread().ident
+        self_samples = Counter()
+        total_samples = Counter()
+        samples = 0
+        end = time.time() + duration
+        while time.time() < end:
+            # pylint: disable=protected-access
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == current_thread:
+                    continue
+                samples += 1
+                code = frame.f_code
+                self_samples[(code.co_filename, code.co_firstlineno,
+                              code.co_name)] += 1
+                # Functions which appear more than once in the stack (through
+                # recursion) are only counted once per sample
+                seen = set()
+                while frame is not None:
+                    code = frame.f_code
+                    func = (code.co_filename, code.co_firstlineno,
+                            code.co_name)
+                    if func not in seen:
+                        seen.add(func)
+                        total_samples[func] += 1
+                    frame = frame.f_back
+            time.sleep(self._sample_interval)
+        functions = [{
+            "function": _format_function(*func),
+            "self_samples": self_samples[func],
+            "total_samples": count
+        } for func, count in total_samples.items()]
+        return functions, samples
+
+    @staticmethod
+    def write(results, path):
+        """
+        Writes the results of a profile to a file (as JSON)
+
+        :param results: The results (see :meth:`profile`)
+        :param path: The file
+        """
+        with open(path, "w") as profile_stream:
+            json.dump(results, profile_stream, indent=2)
+
+
+def get_profile_path(output_dir, mode):
+    """
+    Returns the path of the file the results of a profile started now are
+    written to
+
+    :param output_dir: The directory profiles are written to
+    :param mode: The profiling mode
+    :return: The path of the file
+    """
+    return os.path.join(output_dir, "profile-{}-{}.json".format(
+        mode, time.strftime("%Y%m%dT%H%M%S", time.gmtime())))
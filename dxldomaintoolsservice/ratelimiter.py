@@ -0,0 +1,126 @@
+from __future__ import absolute_import
+import threading
+import time
+
+
+class RateLimiter(object):
+    """
+    Token bucket used to limit the rate of calls made to the DomainTools API
+    """
+
+    def __init__(self, per_minute=0, burst=1):
+        """
+        Constructor parameters:
+
+        :param per_minute: The number of calls permitted per minute (``0`` for
+            no limit)
+        :param burst: The number of calls which can be made back-to-back
+            after the limiter has been idle
+        """
+        self._rate = per_minute / 60.0
+        self._capacity = float(max(1, burst))
+        self._tokens = self._capacity
+        self._last_refill = time.time()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        """
+        Whether the limiter restricts the rate of calls
+        """
+        return self._rate > 0
+
+    @property
+    def tokens(self):
+        """
+        The number of tokens currently available
+        """
+        with self._lock:
+            self._refill(time.time())
+            return self._tokens
+
+    def reconfigure(self, per_minute=0, burst=1):
+        """
+        Changes the rate and burst of the limiter. The tokens currently
+        available are kept (up to the new burst).
+
+        :param per_minute: The number of calls permitted per minute (``0`` for
+            no limit)
+        :param burst: The number of calls which can be made back-to-back
+            after the limiter has been idle
+        """
+        with self._lock:
+            self._refill(time.time())
+            self._rate = per_minute / 60.0
+            self._capacity = float(max(1, burst))
+            self._tokens = min(self._capacity, self._tokens)
+
+    def get_state(self):
+        """
+        Returns the state of the limiter, to be restored after a restart (see
+        :meth:`restore_state`)
+
+        :return: ``dict`` containing the tokens available and the time they
+            were counted
+        """
+        with self._lock:
+            now = time.time()
+            self._refill(now)
+            return {"tokens": self._tokens, "time": now}
+
+    def restore_state(self, state):
+        """
+        Restores the state of the limiter, refilling the tokens for the time
+        since the state was captured
+
+        :param state: The state (see :meth:`get_state`)
+        """
+        with self._lock:
+            self._tokens = min(self._capacity, float(state["tokens"]))
+            self._last_refill = min(time.time(), float(state["time"]))
+            self._refill(time.time())
+
+    def _refill(self, now):
+        elapsed = max(0.0, now - self._last_refill)
+        self._last_refill = now
+        self._tokens = min(self._capacity, self._tokens + elapsed * self._rate)
+
+    def try_acquire(self):
+        """
+        Attempts to acquire a token without waiting
+
+        :return: ``True`` if a token was acquired, ``False`` otherwise
+        """
+        if not self.enabled:
+            return True
+        with self._lock:
+            self._refill(time.time())
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+    def acquire(self, timeout=None):
+        """
+        Acquires a token, waiting until one is available
+
+        :param timeout: The maximum time (in seconds) to wait (``None`` to
+            wait as long as necessary). If a token would not be available in
+            time, no token is acquired and an exception is raised without
+            waiting.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._refill(time.time())
+            wait = (1.0 - self._tokens) / self._rate \
+                if self._tokens < 1.0 else 0
+            if timeout is not None and wait > timeout:
+                raise Exception(
+                    "Rate limit wait ({:.3f}s) exceeds the time remaining for "
+                    "the request ({:.3f}s)".format(wait, max(0.0, timeout)))
+            # Tokens may go negative, which reserves a future slot for this
+            # caller and keeps waiting callers in arrival order
+            self._tokens -= 1.0
+        if wait > 0:
+            time.sleep(wait)
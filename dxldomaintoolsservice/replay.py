@@ -0,0 +1,212 @@
+from __future__ import absolute_import
+from collections import defaultdict
+import gzip
+import json
+import logging
+import threading
+import time
+import zlib
+
+from domaintools import exceptions as domaintools_exceptions
+from domaintools.exceptions import NotFoundException, ServiceException
+from requests import exceptions as requests_exceptions
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+#: Upstream responses are not recorded or replayed
+MODE_OFF = "off"
+#: Upstream requests and responses are recorded
+MODE_RECORD = "record"
+#: Responses are replayed from a recording instead of calling the DomainTools
+#: API
+MODE_REPLAY = "replay"
+#: The supported modes
+MODES = (MODE_OFF, MODE_RECORD, MODE_REPLAY)
+
+#: The exceptions raised by failed DomainTools API calls, which are counted
+#: as upstream errors and recorded
+UPSTREAM_EXCEPTIONS = (ServiceException, requests_exceptions.ConnectionError,
+                       requests_exceptions.Timeout)
+
+
+def _open_log(path, mode):
+    """
+    Opens a recording, which is compressed if its name ends in ``.gz``
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "b")
+    return open(path, mode + "b")
+
+
+def _make_key(service, params):
+    return json.dumps([service, params], sort_keys=True)
+
+
+class ResponseRecorder(object):
+    """
+    Appends each DomainTools API request and response to a recording. Each
+    line of the recording is a JSON object containing the time of the call
+    (seconds since the epoch), the service name, the request parameters, the
+    latency of the call (in seconds), and either the response data or the
+    error.
+    """
+
+    def __init__(self, path):
+        """
+        Constructor parameters:
+
+        :param path: The file the recording is appended to (compressed with
+            gzip if the name ends in ``.gz``)
+        """
+        self._log = _open_log(path, "a")
+        self._lock = threading.Lock()
+
+    def record(self, service, params, latency, data=None, error=None):
+        """
+        Appends a DomainTools API call to the recording
+
+        :param service: The name of the service
+        :param params: The request parameters
+        :param latency: The latency of the call (in seconds)
+        :param data: The response data
+        :param error: The exception raised by the call, if it failed (see
+            :data:`UPSTREAM_EXCEPTIONS`)
+        """
+        entry = {"time": round(time.time() - latency, 3),
+                 "service": service, "params": params,
+                 "latency": round(latency, 6)}
+        if error is None:
+            entry["data"] = data
+        else:
+            reason = error.reason if isinstance(error, ServiceException) \
+                else str(error)
+            entry["error"] = {"type": error.__class__.__name__,
+                              "code": getattr(error, "code", None),
+                              "reason": reason}
+        line = json.dumps(entry, separators=(",", ":")).encode("utf-8")
+        with self._lock:
+            self._log.write(line + b"\n")
+            self._log.flush()
+
+    def close(self):
+        """
+        Closes the recording
+        """
+        with self._lock:
+            self._log.close()
+
+
+class _ReplayResults(object):
+    """
+    Replayed results of a DomainTools API call, mirroring the lazy
+    ``domaintools`` results (the call is made when the data is read)
+    """
+
+    def __init__(self, api, service, params):
+        self._api = api
+        self._service = service
+        self._params = params
+
+    def data(self):
+        entry = self._api.next_entry(self._service, self._params)
+        if self._api.latency_scale:
+            time.sleep(entry["latency"] * self._api.latency_scale)
+        error = entry.get("error")
+        if error:
+            # Connection failures and timeouts are raised by requests
+            error_class = getattr(requests_exceptions, error["type"], None)
+            if error_class is not None and \
+                    issubclass(error_class, UPSTREAM_EXCEPTIONS):
+                raise error_class(error["reason"])
+            error_class = getattr(domaintools_exceptions, error["type"],
+                                  ServiceException)
+            raise error_class(error["code"], error["reason"])
+        return entry["data"]
+
+
+class ReplayAPI(object):
+    """
+    Stand-in for the ``domaintools.API`` client which serves responses from a
+    recording (see :class:`ResponseRecorder`) instead of calling the
+    DomainTools API.
+
+    Calls are matched on the service name and request parameters. When a call
+    was recorded more than once, the recorded responses are replayed in turn.
+    Calls which were not recorded fail with ``NotFoundException``.
+    """
+
+    def __init__(self, path, latency_scale=1.0):
+        """
+        Constructor parameters:
+
+        :param path: The recording
+        :param latency_scale: The factor applied to recorded latencies (``0``
+            replays responses without delay)
+        """
+        self.latency_scale = latency_scale
+        self._entries = defaultdict(list)
+        self._positions = defaultdict(int)
+        self._lock = threading.Lock()
+        for line in self._read_lines(path):
+            entry = json.loads(line.decode("utf-8"))
+            self._entries[_make_key(entry["service"],
+                                    entry["params"])].append(entry)
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._entries.values())
+
+    @staticmethod
+    def _read_lines(path):
+        """
+        Returns the complete lines of a recording. A recording which is
+        truncated (for example, because the service was killed while
+        recording) is read up to its last complete line.
+
+        :param path: The recording
+        :return: The non-empty lines (``bytes``)
+        """
+        lines = []
+        try:
+            with _open_log(path, "r") as log:
+                for line in log:
+                    if not line.endswith(b"\n"):
+                        logger.warning("Ignoring incomplete last line of "
+                                       "recording: %s", path)
+                    elif line.strip():
+                        lines.append(line)
+        except (EOFError, IOError, zlib.error) as ex:
+            if not lines:
+                raise
+            logger.warning("Recording is truncated, replaying the %d calls "
+                           "before the end of the file: %s (%s)",
+                           len(lines), path, ex)
+        return lines
+
+    def __getattr__(self, service):
+        if service.startswith("_"):
+            raise AttributeError(service)
+
+        def call(**params):
+            return _ReplayResults(self, service, params)
+        return call
+
+    def next_entry(self, service, params):
+        """
+        Returns the next recorded call for the service and parameters
+
+        :param service: The name of the service
+        :param params: The request parameters
+        :return: The recorded call (``dict``)
+        """
+        key = _make_key(service, params)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                raise NotFoundException(
+                    404, "No recorded response for '{}' with parameters: "
+                         "{}".format(service, json.dumps(params,
+                                                         sort_keys=True)))
+            position = self._positions[key]
+            self._positions[key] = (position + 1) % len(entries)
+            return entries[position]
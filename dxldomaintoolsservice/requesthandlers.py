@@ -1,30 +1,88 @@
 from __future__ import absolute_import
+import hmac
+import itertools
 import logging
+import threading
+import time
 
 from domaintools.exceptions import ServiceException
-from dxlclient.callbacks import RequestCallback
+from dxlclient.callbacks import EventCallback, RequestCallback
 from dxlclient.message import Response, ErrorResponse
 from dxlbootstrap.util import MessageUtils
+from dxldomaintoolsservice._compat import string_types
+from dxldomaintoolsservice.budget import PRIORITIES, PRIORITY_NORMAL, \
+    PRIORITY_OTHER_FIELD
+from dxldomaintoolsservice.cache import ResponseCache
+from dxldomaintoolsservice.chunking import CHUNKED_OTHER_FIELD, \
+    set_chunk_fields
+from dxldomaintoolsservice.codec import to_xml
+from dxldomaintoolsservice.fairness import get_client_key
+from dxldomaintoolsservice.hedging import HedgingPolicy
+from dxldomaintoolsservice.peercache import EXPIRES_OTHER_FIELD
+from dxldomaintoolsservice.profiling import MODE_SAMPLING, SORT_CUMULATIVE, \
+    get_profile_path
+from dxldomaintoolsservice.replay import MODE_REPLAY, UPSTREAM_EXCEPTIONS
+from dxldomaintoolsservice.slowlog import CACHE_STATUS_HIT, \
+    CACHE_STATUS_MISS, CACHE_STATUS_PEER, CACHE_STATUS_SNAPSHOT, RequestTrace
+from dxldomaintoolsservice.snapshots import REFRESH_OTHER_FIELD
 
 
 # Configure local logger
 logger = logging.getLogger(__name__)
 
 
+def _authorize(request, request_dict, token, allowed_clients, feature):
+    """
+    Raises an exception if the caller of a control topic did not provide the
+    configured token, or is not one of the allowed clients
+
+    :param request: The request message
+    :param request_dict: The request parameters
+    :param token: The token callers must provide (the feature is disabled if
+        not set)
+    :param allowed_clients: The DXL client identifiers allowed to use the
+        feature (any client with the token if not set)
+    :param feature: The name of the feature (for example, ``profiling``)
+    """
+    if not token:
+        raise Exception("{} is not enabled".format(feature.capitalize()))
+    request_token = request_dict.get("token")
+    if not isinstance(request_token, string_types) or \
+            not hmac.compare_digest(request_token.encode("utf-8"),
+                                    token.encode("utf-8")):
+        logger.warning("Invalid %s token from client: %s", feature,
+                       request.source_client_id)
+        raise Exception("Not authorized")
+    if allowed_clients and request.source_client_id not in allowed_clients:
+        logger.warning("%s request from client not allowed: %s",
+                       feature.capitalize(), request.source_client_id)
+        raise Exception("Not authorized")
+
+
 class DomainToolsRequestCallback(RequestCallback):
     """
     Request callback used to invoke the DomainTools REST API
     """
-    def __init__(self, app, func_name, required_params=None):
+
+    #: The request "other field" which can be used by callers to indicate how
+    #: long (in seconds) they are willing to wait for a response. This caps the
+    #: time spent retrying transient upstream failures.
+    TIMEOUT_OTHER_FIELD = "timeout"
+
+    def __init__(self, app, func_name, validator=None):
         """
         Constructor parameters:
 
         :param app: The application this handler is associated with
+        :param func_name: The name of the DomainTools API method to invoke
+        :param validator: The
+            :class:`dxldomaintoolsservice.validation.RequestValidator` used
+            to validate request parameters (optional)
         """
         super(DomainToolsRequestCallback, self).__init__()
         self._app = app
         self._func_name = func_name
-        self._required_params = required_params
+        self._validator = validator
 
     def on_request(self, request):
         """
@@ -32,23 +90,40 @@ class DomainToolsRequestCallback(RequestCallback):
 
         :param request: The request message
         """
+        # Requests are profiled while a deterministic profile is running, and
+        # the memory they retain is tracked if memory tracking is enabled
+        self._app.profiler.call(self._app.memory_tracker.call,
+                                self._func_name, self._handle_request,
+                                request)
+
+    def _handle_request(self, request):
+        """
+        Handles a request message
+
+        :param request: The request message
+        """
+        trace = RequestTrace()
+        self._app.metrics.increment("requests", self._func_name)
+
         # Handle request
-        logger.info("Request received on topic: '%s' with payload: '%s'",
-                    request.destination_topic,
-                    MessageUtils.decode_payload(request))
+        sampler = self._app.request_log_sampler
+        if logger.isEnabledFor(logging.INFO) and \
+                sampler.should_log(self._func_name):
+            logger.info("Request received on topic: '%s' with payload: '%s'",
+                        request.destination_topic,
+                        sampler.format_payload(request.payload))
 
+        request_dict = None
+        error = None
         try:
             res = Response(request)
 
-            request_dict = MessageUtils.json_payload_to_dict(request) \
+            request_dict = self._app.json_codec.loads(request.payload) \
                 if request.payload else {}
 
-            # Ensure required parameters are present
-            if self._required_params:
-                for name in self._required_params:
-                    if name not in request_dict:
-                        raise Exception("Required parameter not found: '{}'".
-                                        format(name))
+            # Validate parameters against the service schema
+            if self._validator:
+                self._validator.validate(request_dict)
 
             if "format" not in request_dict:
                 request_dict["format"] = "json"
@@ -57,29 +132,815 @@ class DomainToolsRequestCallback(RequestCallback):
                     request_dict["format"],
                     "Only 'json' and 'xml' are supported."))
 
-            # Invoke DomainTools API via client
-            dt_response = \
-                getattr(self._app.domaintools_api,
-                        self._func_name)(**request_dict)
+            timeout = self._get_timeout(request)
+            priority = self._get_priority(request)
+            trace.mark("decode")
+
+            # Share capacity fairly between clients
+            client_key = get_client_key(request, self._app.client_key)
+            # Only released if accounted for, as limits may be enabled or
+            # disabled by a configuration reload while the request is handled
+            acquired = self._app.fair_scheduler.acquire(client_key, timeout)
+            trace.mark("queue_wait")
+            try:
+                self._set_payload(res, request, request_dict, timeout,
+                                  priority, trace)
+            finally:
+                if acquired:
+                    self._app.fair_scheduler.release(client_key)
+
+            # Split oversized payloads if the caller can reassemble them
+            if request.other_fields.get(CHUNKED_OTHER_FIELD) == "true" and \
+                    self._app.chunk_store.chunk_response(res):
+                self._app.metrics.increment("chunked_responses",
+                                            self._func_name)
+
+        except Exception as ex:
+            logger.exception("Error handling request")
+            self._app.metrics.increment("errors", self._func_name)
+            msg = self._get_error_message(ex)
+            res = ErrorResponse(request, error_message=MessageUtils.encode(msg))
+            error = msg
+
+        # Send response
+        self._app.client.send_response(res)
+        self._app.metrics.observe("request", self._func_name,
+                                  time.time() - trace.start)
+        self._app.slow_request_log.add(
+            self._func_name, request.destination_topic, request_dict, trace,
+            len(request.payload or b""), len(res.payload or b""), error)
+
+    def _set_payload(self, res, request, request_dict, timeout, priority,
+                     trace):
+        """
+        Sets the payload of the response, from a snapshot, the response cache
+        or the DomainTools API
+
+        :param res: The response message
+        :param request: The request message
+        :param request_dict: The request parameters
+        :param timeout: The time (in seconds) the caller is willing to wait
+        :param priority: The priority of the request
+        :param trace: The :class:`RequestTrace` of the request
+        """
+        snapshot = self._get_snapshot(request, request_dict)
+        if snapshot is not None:
+            trace.cache_status = CACHE_STATUS_SNAPSHOT
+            self._app.metrics.increment("snapshot_hits", self._func_name)
+            self._set_canonical_payload(res, snapshot,
+                                        request_dict["format"], trace)
+        elif self._app.response_cache.is_cacheable(self._func_name):
+            # Both formats are rendered from the cached JSON payload
+            payload = self._get_canonical_payload(
+                request_dict, timeout, priority, trace)
+            self._set_canonical_payload(res, payload,
+                                        request_dict["format"], trace)
+        else:
+            response_data = self._call_with_retry(
+                request_dict, timeout, priority, trace)
 
             # Set response payload
-            response_data = dt_response.data()
+            encode_start = time.time()
             if isinstance(response_data, dict):
-                MessageUtils.dict_to_json_payload(res, response_data)
+                res.payload = self._app.json_codec.dumps(response_data)
             else:
                 MessageUtils.encode_payload(res, response_data)
+            trace.add("encode", time.time() - encode_start)
+
+    @staticmethod
+    def _get_error_message(ex):
+        """
+        Returns the error message sent to the caller for an exception
+
+        :param ex: The exception
+        :return: The error message
+        """
+        if isinstance(ex, ServiceException):
+            return "%s: %s" % (ex.__class__.__name__, ex.reason)
+        return str(ex) or ex.__class__.__name__
+
+    def fetch_payload(self, request_dict, timeout=None,
+                      priority=PRIORITY_NORMAL, trace=None):
+        """
+        Invokes the DomainTools API (bypassing the response cache) and returns
+        the JSON payload of the response
+
+        :param request_dict: The request parameters
+        :param timeout: The time (in seconds) the caller is willing to wait
+        :param priority: The priority of the request (see
+            :mod:`dxldomaintoolsservice.budget`)
+        :param trace: The :class:`dxldomaintoolsservice.slowlog.RequestTrace`
+            of the request (optional)
+        :return: The JSON payload (``bytes``)
+        """
+        params = dict(request_dict)
+        params["format"] = "json"
+        response_data = self._call_with_retry(params, timeout, priority,
+                                              trace)
+        encode_start = time.time()
+        payload = self._app.json_codec.dumps(response_data)
+        if trace:
+            trace.add("encode", time.time() - encode_start)
+        return payload
+
+    def lookup(self, request_dict, timeout=None, priority=PRIORITY_NORMAL,
+               client_key=None):
+        """
+        Invokes the DomainTools API on behalf of another request (for
+        example, a pivot), through the response cache if responses for the
+        service are cached
+
+        :param request_dict: The request parameters
+        :param timeout: The time (in seconds) the caller is willing to wait
+        :param priority: The priority of the request
+        :param client_key: The key of the client the lookup is made for. If
+            set, the lookup is subject to the client's limits (see
+            :class:`dxldomaintoolsservice.fairness.FairScheduler`) as a
+            request of its own.
+        :return: The DomainTools API response data
+        """
+        params = dict(request_dict)
+        params["format"] = "json"
+        trace = RequestTrace()
+        acquired = client_key is not None and \
+            self._app.fair_scheduler.acquire(client_key, timeout)
+        try:
+            if self._app.response_cache.is_cacheable(self._func_name):
+                payload = self._get_canonical_payload(params, timeout,
+                                                      priority, trace)
+            else:
+                payload = self.fetch_payload(params, timeout, priority,
+                                             trace)
+        finally:
+            if acquired:
+                self._app.fair_scheduler.release(client_key)
+        return self._app.json_codec.loads(payload)
+
+    def _get_snapshot(self, request, request_dict):
+        """
+        Returns the JSON payload from the in-memory snapshot of the service,
+        if snapshots are kept for the service and the request has no
+        parameters other than ``format``. The snapshot is refreshed first if
+        the caller set the "refresh" other field.
+
+        :param request: The request message
+        :param request_dict: The request parameters
+        :return: The JSON payload (``bytes``) or ``None`` if the request can
+            not be answered from a snapshot
+        """
+        snapshots = self._app.snapshots
+        if not snapshots.is_enabled(self._func_name) or \
+                any(name != "format" for name in request_dict):
+            return None
+        if request.other_fields.get(REFRESH_OTHER_FIELD) == "true":
+            snapshots.refresh(self._func_name)
+        snapshot = snapshots.get(self._func_name)
+        return snapshot[0] if snapshot else None
+
+    def _set_canonical_payload(self, res, payload, fmt, trace):
+        """
+        Sets the response payload from a JSON payload, rendering it as XML if
+        requested
+
+        :param res: The response message
+        :param payload: The JSON payload (``bytes``)
+        :param fmt: The requested format (``json`` or ``xml``)
+        :param trace: The :class:`dxldomaintoolsservice.slowlog.RequestTrace`
+            of the request
+        """
+        if fmt == "json":
+            res.payload = payload
+        else:
+            encode_start = time.time()
+            MessageUtils.encode_payload(
+                res, to_xml(self._app.json_codec.loads(payload)))
+            trace.add("encode", time.time() - encode_start)
+
+    def _get_canonical_payload(self, request_dict, timeout, priority,
+                               trace):
+        """
+        Returns the JSON payload for the lookup, from the response cache if
+        present (or from the response cache of a peer, if the cache is
+        shared), otherwise by invoking the DomainTools API
+
+        :param request_dict: The request parameters
+        :param timeout: The time (in seconds) the caller is willing to wait
+        :param priority: The priority of the request
+        :param trace: The :class:`dxldomaintoolsservice.slowlog.RequestTrace`
+            of the request
+        :return: The JSON payload (``bytes``)
+        """
+        cache = self._app.response_cache
+        key = ResponseCache.make_key(self._func_name, request_dict)
+        payload = cache.get(key)
+        if payload is not None:
+            trace.cache_status = CACHE_STATUS_HIT
+            self._app.metrics.increment("cache_hits", self._func_name)
+            return payload
+
+        trace.cache_status = CACHE_STATUS_MISS
+        self._app.metrics.increment("cache_misses", self._func_name)
+        peer_cache = self._app.peer_cache
+        if peer_cache.enabled:
+            peer_start = time.time()
+            payload = peer_cache.fetch(key, timeout)
+            trace.add("peer", time.time() - peer_start)
+            if payload is not None:
+                trace.cache_status = CACHE_STATUS_PEER
+                self._app.metrics.increment("peer_cache_hits",
+                                            self._func_name)
+                return payload
+
+        payload = self.fetch_payload(request_dict, timeout, priority, trace)
+        if cache.put(key, self._func_name, payload):
+            peer_cache.notify_fill(
+                key, time.time() + cache.ttl(self._func_name))
+        return payload
+
+    def _call_with_retry(self, request_dict, timeout,
+                         priority=PRIORITY_NORMAL, trace=None):
+        """
+        Invokes the DomainTools API, retrying transient failures. Every
+        DomainTools API method exposed by the service is a read-only lookup,
+        so transient failures are safe to retry.
+
+        :param request_dict: The request parameters
+        :param timeout: The time (in seconds) the caller is willing to wait
+        :param priority: The priority of the request, used to decide whether
+            it is admitted within the service's budget
+        :param trace: The :class:`dxldomaintoolsservice.slowlog.RequestTrace`
+            of the request (optional)
+        :return: The DomainTools API response data
+        """
+        # Replayed responses do not use the DomainTools API budget
+        charged = self._app.record_replay_mode != MODE_REPLAY
+        if charged:
+            self._app.budget_tracker.admit(self._func_name, priority)
+        # The first successful DomainTools API call uses the charge made on
+        # admission, and any further (hedged) call is charged on its own
+        successes = itertools.count()
+        # Time spent waiting for the rate limit counts towards the deadline
+        deadline = self._app.retry_policy.get_deadline(timeout)
+        start = time.time()
+        try:
+            return self._app.retry_policy.call(
+                lambda: self._invoke_api(request_dict, trace, successes,
+                                         deadline),
+                timeout)
+        except Exception:
+            if charged and next(successes) == 0:
+                self._app.budget_tracker.refund(self._func_name)
+            raise
+        finally:
+            if trace:
+                trace.add("upstream", time.time() - start)
+
+    def _invoke_api(self, request_dict, trace=None, successes=None,
+                    deadline=None):
+        """
+        Invokes the DomainTools API (subject to the rate limit), hedging the
+        call if it is slow
+
+        :param request_dict: The request parameters
+        :param trace: The :class:`dxldomaintoolsservice.slowlog.RequestTrace`
+            of the request (optional)
+        :param successes: Counter of the successful calls made for the
+            request (optional, see :meth:`_call_api`)
+        :param deadline: The time by which the request must complete. The
+            call fails without waiting if the rate limit would delay it
+            beyond the deadline. (optional)
+        :return: The DomainTools API response data
+        """
+        start = time.time()
+        self._app.rate_limiter.acquire(
+            deadline - start if deadline is not None else None)
+        if trace:
+            trace.attempts += 1
+            trace.add("rate_limit_wait", time.time() - start)
+        return self._app.hedging_policy.call(
+            self._func_name, lambda: self._call_api(request_dict, successes),
+            deadline)
+
+    def _call_api(self, request_dict, successes=None):
+        """
+        Makes a single call to the DomainTools API
+
+        :param request_dict: The request parameters
+        :param successes: Counter of the successful calls made for the
+            request. The first was charged against the budget when the
+            request was admitted; others are charged here. If not set, each
+            successful call is charged here.
+        :return: The DomainTools API response data
+        """
+        recorder = self._app.response_recorder
+        start = time.time()
+        try:
+            response_data = getattr(self._app.domaintools_api,
+                                    self._func_name)(**request_dict).data()
+        except UPSTREAM_EXCEPTIONS as ex:
+            self._app.metrics.increment("upstream_errors", self._func_name)
+            if recorder:
+                recorder.record(self._func_name, request_dict,
+                                time.time() - start, error=ex)
+            raise
+        finally:
+            self._app.metrics.observe(HedgingPolicy.UPSTREAM_LATENCY,
+                                      self._func_name, time.time() - start)
+
+        if recorder:
+            recorder.record(self._func_name, request_dict,
+                            time.time() - start, data=response_data)
+        if self._app.record_replay_mode != MODE_REPLAY:
+            budget_tracker = self._app.budget_tracker
+            if successes is None or next(successes) > 0:
+                budget_tracker.record(self._func_name)
+            if self._func_name == "account_information" and \
+                    isinstance(response_data, dict):
+                budget_tracker.update_from_account(response_data)
+        return response_data
+
+    def _get_priority(self, request):
+        """
+        Returns the priority of the request, as specified in the request's
+        "other fields"
+
+        :param request: The request message
+        :return: The priority (the default priority if not specified)
+        """
+        priority = request.other_fields.get(PRIORITY_OTHER_FIELD)
+        if priority is None:
+            return self._app.default_priority
+        if priority not in PRIORITIES:
+            raise Exception("Invalid priority specified: '{}'".format(
+                priority))
+        return priority
 
-        except ServiceException as ex:
+    def _get_timeout(self, request):
+        """
+        Returns the time (in seconds) the caller is willing to wait for a
+        response, as specified in the request's "other fields"
+
+        :param request: The request message
+        :return: The timeout (or ``None`` if not specified)
+        """
+        timeout = request.other_fields.get(self.TIMEOUT_OTHER_FIELD)
+        if timeout is None:
+            return None
+        try:
+            return float(timeout)
+        except ValueError:
+            raise Exception("Invalid timeout specified: '{}'".format(timeout))
+
+
+class PivotRequestCallback(DomainToolsRequestCallback):
+    """
+    Request callback used to expand the graph of entities related to a seed
+    entity in a single request (see
+    :class:`dxldomaintoolsservice.pivot.PivotExpander`).
+
+    The request payload must contain the ``type`` (``domain``, ``ip`` or
+    ``registrant``) and ``value`` of the seed entity, and can specify the
+    number of hops to expand (``depth``), the maximum number of related
+    entities followed from each entity (``fanout``), and whether reverse
+    Whois reports are purchased to expand registrants (``purchase``).
+    """
+    def __init__(self, app, expander, max_depth=3, max_fanout=25,
+                 allow_purchase=False):
+        """
+        Constructor parameters:
+
+        :param app: The application this handler is associated with
+        :param expander: The :class:`dxldomaintoolsservice.pivot.PivotExpander`
+        :param max_depth: The maximum number of hops callers can request
+        :param max_fanout: The maximum fan-out callers can request
+        :param allow_purchase: Whether callers can request that reverse Whois
+            reports are purchased
+        """
+        super(PivotRequestCallback, self).__init__(app, "pivot")
+        self._expander = expander
+        self._max_depth = max_depth
+        self._max_fanout = max_fanout
+        self._allow_purchase = allow_purchase
+
+    def _handle_request(self, request):
+        """
+        Handles a request message
+
+        :param request: The request message
+        """
+        trace = RequestTrace()
+        self._app.metrics.increment("requests", self._func_name)
+
+        request_dict = None
+        error = None
+        try:
+            res = Response(request)
+
+            request_dict = self._app.json_codec.loads(request.payload) \
+                if request.payload else {}
+            fmt = request_dict.get("format", "json")
+            if fmt not in ("json", "xml"):
+                raise Exception("Unsupported format requested: '{}'. {}".format(
+                    fmt, "Only 'json' and 'xml' are supported."))
+            depth, fanout, purchase = self._get_expand_params(request_dict)
+
+            timeout = self._get_timeout(request)
+            priority = self._get_priority(request)
+            trace.mark("decode")
+
+            # Each lookup is subject to the client's limits as a request of
+            # its own, rather than the pivot taking a single slot
+            graph = self._expander.expand(
+                request_dict["type"], request_dict["value"], depth, fanout,
+                purchase, timeout, priority,
+                get_client_key(request, self._app.client_key))
+            trace.mark("expand")
+            self._app.metrics.increment("pivot_lookups", self._func_name,
+                                        graph["lookups"])
+
+            self._set_canonical_payload(res, self._app.json_codec.dumps(graph),
+                                        fmt, trace)
+
+            if request.other_fields.get(CHUNKED_OTHER_FIELD) == "true" and \
+                    self._app.chunk_store.chunk_response(res):
+                self._app.metrics.increment("chunked_responses",
+                                            self._func_name)
+
+        except Exception as ex:
             logger.exception("Error handling request")
-            msg = "%s: %s" % (ex.__class__.__name__, ex.reason)
-            res = ErrorResponse(request, error_message=MessageUtils.encode(msg))
+            self._app.metrics.increment("errors", self._func_name)
+            error = self._get_error_message(ex)
+            res = ErrorResponse(request,
+                                error_message=MessageUtils.encode(error))
+
+        self._app.client.send_response(res)
+        self._app.metrics.observe("request", self._func_name,
+                                  time.time() - trace.start)
+        self._app.slow_request_log.add(
+            self._func_name, request.destination_topic, request_dict, trace,
+            len(request.payload or b""), len(res.payload or b""), error)
+
+    def _get_expand_params(self, request_dict):
+        """
+        Returns the expansion parameters of a pivot request
+
+        :param request_dict: The request parameters
+        :return: ``tuple`` of the depth, fan-out and whether reverse Whois
+            reports are purchased
+        """
+        for name in ("type", "value"):
+            if name not in request_dict:
+                raise Exception("Required parameter not found: '{}'".
+                                format(name))
+        depth = int(request_dict.get("depth", 1))
+        if depth < 0 or depth > self._max_depth:
+            raise Exception("Invalid depth: '{}'. The maximum depth is "
+                            "{}.".format(depth, self._max_depth))
+        fanout = min(int(request_dict.get("fanout", 10)), self._max_fanout)
+        purchase = request_dict.get("purchase") is True
+        if purchase and not self._allow_purchase:
+            raise Exception("Purchasing reverse Whois reports is not "
+                            "allowed")
+        return depth, fanout, purchase
+
+
+class MetricsRequestCallback(RequestCallback):
+    """
+    Request callback used to report the metrics collected by the service
+    """
+    def __init__(self, app):
+        """
+        Constructor parameters:
 
+        :param app: The application this handler is associated with
+        """
+        super(MetricsRequestCallback, self).__init__()
+        self._app = app
+
+    def on_request(self, request):
+        """
+        Invoked when a request message is received.
+
+        :param request: The request message
+        """
+        try:
+            res = Response(request)
+            MessageUtils.dict_to_json_payload(res,
+                                              self._app.metrics.snapshot())
         except Exception as ex:
             logger.exception("Error handling request")
-            msg = str(ex)
-            if not msg:
-                msg = ex.__class__.__name__
-            res = ErrorResponse(request, error_message=MessageUtils.encode(msg))
+            res = ErrorResponse(request,
+                                error_message=MessageUtils.encode(str(ex)))
+
+        self._app.client.send_response(res)
+
+
+class ProfileRequestCallback(RequestCallback):
+    """
+    Request callback used to capture a time-boxed profile of the service.
+
+    The request payload must contain the configured profiling ``token``, and
+    can specify the ``mode`` (``sampling`` or ``deterministic``), the
+    ``duration`` (in seconds), the number of functions reported (``limit``),
+    the ``sort`` order (``cumulative`` or ``self``) and the ``output``
+    (``response`` to wait for the profile and return its results, or ``file``
+    to return immediately and write the results to the output directory).
+    """
+    def __init__(self, app, token, allowed_clients=None, output_dir=None):
+        """
+        Constructor parameters:
+
+        :param app: The application this handler is associated with
+        :param token: The token callers must provide (profiling is disabled
+            if not set)
+        :param allowed_clients: The DXL client identifiers allowed to request
+            profiles (any client with the token if not set)
+        :param output_dir: The directory profiles are written to
+        """
+        super(ProfileRequestCallback, self).__init__()
+        self._app = app
+        self._token = token
+        self._allowed_clients = allowed_clients
+        self._output_dir = output_dir
+
+    def on_request(self, request):
+        """
+        Invoked when a request message is received.
+
+        :param request: The request message
+        """
+        try:
+            res = Response(request)
+            request_dict = MessageUtils.json_payload_to_dict(request) \
+                if request.payload else {}
+            _authorize(request, request_dict, self._token,
+                       self._allowed_clients, "profiling")
+
+            profiler = self._app.profiler
+            mode = request_dict.get("mode", MODE_SAMPLING)
+            duration = float(request_dict.get("duration", 10))
+            limit = int(request_dict.get("limit", 30))
+            sort = request_dict.get("sort", SORT_CUMULATIVE)
+            output = request_dict.get("output", "response")
+            logger.info("Starting %s profile for %.1fs, requested by client: "
+                        "%s", mode, min(duration, profiler.max_duration),
+                        request.source_client_id)
+
+            if output == "file":
+                if profiler.is_running:
+                    raise Exception("A profile is already running")
+                path = get_profile_path(self._output_dir, mode)
+                thread = threading.Thread(
+                    target=self._write_profile,
+                    args=(path, mode, duration, limit, sort),
+                    name="DomainToolsProfiler")
+                thread.daemon = True
+                thread.start()
+                MessageUtils.dict_to_json_payload(
+                    res, {"status": "started", "file": path})
+            elif output == "response":
+                MessageUtils.dict_to_json_payload(
+                    res, profiler.profile(mode, duration, limit, sort))
+            else:
+                raise Exception("Invalid output: '{}'".format(output))
+        except Exception as ex:
+            logger.exception("Error handling request")
+            res = ErrorResponse(request,
+                                error_message=MessageUtils.encode(str(ex)))
+
+        self._app.client.send_response(res)
+
+    def _write_profile(self, path, mode, duration, limit, sort):
+        try:
+            self._app.profiler.write(
+                self._app.profiler.profile(mode, duration, limit, sort), path)
+            logger.info("Profile written to: %s", path)
+        except Exception: # pylint: disable=broad-except
+            logger.exception("Error writing profile")
+
+
+class HealthRequestCallback(RequestCallback):
+    """
+    Request callback used to report whether the service is ready, and how
+    long it took to start (see
+    :class:`dxldomaintoolsservice.health.HealthMonitor`)
+    """
+    def __init__(self, app):
+        """
+        Constructor parameters:
+
+        :param app: The application this handler is associated with
+        """
+        super(HealthRequestCallback, self).__init__()
+        self._app = app
+
+    def on_request(self, request):
+        """
+        Invoked when a request message is received.
+
+        :param request: The request message
+        """
+        try:
+            res = Response(request)
+            MessageUtils.dict_to_json_payload(
+                res, self._app.health_monitor.report())
+        except Exception as ex:
+            logger.exception("Error handling request")
+            res = ErrorResponse(request,
+                                error_message=MessageUtils.encode(str(ex)))
+
+        self._app.client.send_response(res)
+
+
+class ReloadRequestCallback(RequestCallback):
+    """
+    Request callback used to reload the application configuration file while
+    the service is running (see
+    :meth:`dxldomaintoolsservice.app.DomainToolsService.reload_configuration`).
+
+    The request payload must contain the configured reload ``token``.
+    """
+    def __init__(self, app, token, allowed_clients=None):
+        """
+        Constructor parameters:
+
+        :param app: The application this handler is associated with
+        :param token: The token callers must provide (reloading via DXL is
+            disabled if not set)
+        :param allowed_clients: The DXL client identifiers allowed to reload
+            the configuration (any client with the token if not set)
+        """
+        super(ReloadRequestCallback, self).__init__()
+        self._app = app
+        self._token = token
+        self._allowed_clients = allowed_clients
+
+    def on_request(self, request):
+        """
+        Invoked when a request message is received.
+
+        :param request: The request message
+        """
+        try:
+            res = Response(request)
+            request_dict = MessageUtils.json_payload_to_dict(request) \
+                if request.payload else {}
+            _authorize(request, request_dict, self._token,
+                       self._allowed_clients, "reload")
+            logger.info("Configuration reload requested by client: %s",
+                        request.source_client_id)
+            MessageUtils.dict_to_json_payload(
+                res, self._app.reload_configuration())
+        except Exception as ex:
+            logger.exception("Error handling request")
+            res = ErrorResponse(request,
+                                error_message=MessageUtils.encode(str(ex)))
+
+        self._app.client.send_response(res)
+
+
+class SlowRequestsRequestCallback(RequestCallback):
+    """
+    Request callback used to report the requests in the slow request log.
+
+    The request payload can specify the ``service`` to report requests for,
+    and the maximum number of requests reported (``limit``).
+    """
+    def __init__(self, app):
+        """
+        Constructor parameters:
+
+        :param app: The application this handler is associated with
+        """
+        super(SlowRequestsRequestCallback, self).__init__()
+        self._app = app
+
+    def on_request(self, request):
+        """
+        Invoked when a request message is received.
+
+        :param request: The request message
+        """
+        try:
+            res = Response(request)
+            request_dict = MessageUtils.json_payload_to_dict(request) \
+                if request.payload else {}
+            slow_request_log = self._app.slow_request_log
+            service = request_dict.get("service")
+            limit = request_dict.get("limit")
+            MessageUtils.dict_to_json_payload(res, {
+                "logged": slow_request_log.logged,
+                "requests": slow_request_log.entries(
+                    service, int(limit) if limit else None)
+            })
+        except Exception as ex:
+            logger.exception("Error handling request")
+            res = ErrorResponse(request,
+                                error_message=MessageUtils.encode(str(ex)))
+
+        self._app.client.send_response(res)
+
+
+class PeerCacheRequestCallback(RequestCallback):
+    """
+    Request callback used by other instances of the service to fetch responses
+    from the response cache (see
+    :class:`dxldomaintoolsservice.peercache.PeerCache`). The request payload
+    is the cache key, and the response payload is the compressed response
+    (empty if the response is not cached).
+    """
+    def __init__(self, app):
+        """
+        Constructor parameters:
+
+        :param app: The application this handler is associated with
+        """
+        super(PeerCacheRequestCallback, self).__init__()
+        self._app = app
+
+    def on_request(self, request):
+        """
+        Invoked when a request message is received.
+
+        :param request: The request message
+        """
+        try:
+            res = Response(request)
+            entry = self._app.peer_cache.get_shared(
+                MessageUtils.decode_payload(request))
+            if entry is not None:
+                res.other_fields = {EXPIRES_OTHER_FIELD: str(entry[0])}
+                res.payload = entry[1]
+        except Exception as ex:
+            logger.exception("Error handling request")
+            res = ErrorResponse(request,
+                                error_message=MessageUtils.encode(str(ex)))
+
+        self._app.client.send_response(res)
+
+
+class PeerCacheEventCallback(EventCallback):
+    """
+    Event callback used to receive the announcements of other instances of
+    the service (see :class:`dxldomaintoolsservice.peercache.PeerCache`)
+    """
+    def __init__(self, app):
+        """
+        Constructor parameters:
+
+        :param app: The application this handler is associated with
+        """
+        super(PeerCacheEventCallback, self).__init__()
+        self._app = app
+
+    def on_event(self, event):
+        """
+        Invoked when an event message is received.
+
+        :param event: The event message
+        """
+        try:
+            self._app.peer_cache.on_event(
+                MessageUtils.json_payload_to_dict(event))
+        except Exception: # pylint: disable=broad-except
+            logger.exception("Error handling peer cache event")
+
+
+class ChunkRequestCallback(RequestCallback):
+    """
+    Request callback used to fetch the remaining chunks of a chunked response
+    """
+    def __init__(self, app):
+        """
+        Constructor parameters:
+
+        :param app: The application this handler is associated with
+        """
+        super(ChunkRequestCallback, self).__init__()
+        self._app = app
+
+    def on_request(self, request):
+        """
+        Invoked when a request message is received.
+
+        :param request: The request message
+        """
+        try:
+            res = Response(request)
+            request_dict = MessageUtils.json_payload_to_dict(request) \
+                if request.payload else {}
+            for name in ("id", "index"):
+                if name not in request_dict:
+                    raise Exception("Required parameter not found: '{}'".
+                                    format(name))
+            chunk, count = self._app.chunk_store.get_chunk(
+                request_dict["id"], int(request_dict["index"]))
+            res.payload = chunk
+            set_chunk_fields(res, request_dict["id"], request_dict["index"],
+                             count)
+        except Exception as ex:
+            logger.exception("Error handling request")
+            res = ErrorResponse(request,
+                                error_message=MessageUtils.encode(str(ex)))
 
-        # Send response
         self._app.client.send_response(res)
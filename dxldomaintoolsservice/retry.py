@@ -0,0 +1,177 @@
+from __future__ import absolute_import
+import logging
+import random
+import threading
+import time
+
+from domaintools.exceptions import InternalServerErrorException, \
+    ServiceUnavailableException
+from requests import exceptions as requests_exceptions
+
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+
+class RetryBudget(object):
+    """
+    Process-wide cap on the rate of upstream retries.
+
+    Each original request deposits ``ratio`` tokens into the budget and each
+    retry withdraws a full token. A small number of tokens is also refilled
+    every second so that retries remain possible at low request rates. When
+    the budget is exhausted, failures are returned to the caller instead of
+    being retried, which prevents retries from amplifying an upstream outage.
+    """
+
+    def __init__(self, ratio=0.1, min_per_second=1.0):
+        """
+        Constructor parameters:
+
+        :param ratio: The number of retries permitted per original request
+        :param min_per_second: The number of retries permitted per second
+            regardless of the request rate
+        """
+        self._ratio = ratio
+        self._min_per_second = min_per_second
+        self._max_balance = max(1.0, 10 * min_per_second)
+        self._balance = self._max_balance
+        self._last_refill = time.time()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = max(0.0, now - self._last_refill)
+        self._last_refill = now
+        self._balance = min(self._max_balance,
+                            self._balance + elapsed * self._min_per_second)
+
+    def deposit(self):
+        """
+        Records an original (non-retry) request
+        """
+        with self._lock:
+            self._refill(time.time())
+            self._balance = min(self._max_balance,
+                                self._balance + self._ratio)
+
+    def try_withdraw(self):
+        """
+        Attempts to withdraw a token for a single retry
+
+        :return: ``True`` if the retry is permitted, ``False`` otherwise
+        """
+        with self._lock:
+            self._refill(time.time())
+            if self._balance < 1.0:
+                return False
+            self._balance -= 1.0
+            return True
+
+    def refund(self):
+        """
+        Returns a token withdrawn by :meth:`try_withdraw` which was not used
+        """
+        with self._lock:
+            self._balance = min(self._max_balance, self._balance + 1.0)
+
+
+class RetryPolicy(object):
+    """
+    Retries transient DomainTools API failures using exponential backoff with
+    "full jitter" (each delay is chosen at random between zero and the
+    exponential bound).
+    """
+
+    #: Exceptions which indicate a transient upstream failure
+    TRANSIENT_EXCEPTIONS = (ServiceUnavailableException,
+                            InternalServerErrorException,
+                            requests_exceptions.ConnectionError,
+                            requests_exceptions.Timeout)
+
+    def __init__(self, max_attempts=3, base_delay=0.1, max_delay=2.0,
+                 max_time=10.0, budget=None):
+        """
+        Constructor parameters:
+
+        :param max_attempts: The maximum number of attempts per request
+            (including the original attempt)
+        :param base_delay: The bound (in seconds) of the first backoff delay
+        :param max_delay: The maximum bound (in seconds) of a backoff delay
+        :param max_time: The maximum time (in seconds) to spend on a request,
+            including retries
+        :param budget: The :class:`RetryBudget` shared by all requests (or
+            ``None`` to disable the global retry cap)
+        """
+        self._max_attempts = max(1, max_attempts)
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._max_time = max_time
+        self._budget = budget
+
+    def backoff(self, retry):
+        """
+        Returns the delay to wait before the specified retry
+
+        :param retry: The zero-based index of the retry
+        :return: The delay (in seconds)
+        """
+        bound = min(self._max_delay, self._base_delay * (2 ** retry))
+        return random.uniform(0, bound)
+
+    def is_transient(self, ex):
+        """
+        Returns whether the specified exception is worth retrying
+
+        :param ex: The exception
+        :return: Whether the exception is worth retrying
+        """
+        return isinstance(ex, self.TRANSIENT_EXCEPTIONS)
+
+    def get_deadline(self, timeout=None):
+        """
+        Returns the time by which a request must complete, including retries
+
+        :param timeout: The time (in seconds) the caller is willing to wait
+            for a response (or ``None`` if unknown)
+        :return: The deadline (seconds since the epoch)
+        """
+        max_time = self._max_time
+        if timeout is not None:
+            max_time = min(max_time, timeout)
+        return time.time() + max_time
+
+    def call(self, func, timeout=None):
+        """
+        Invokes the specified function, retrying transient failures
+
+        :param func: The function to invoke (takes no arguments)
+        :param timeout: The time (in seconds) the caller is willing to wait
+            for a response (or ``None`` if unknown)
+        :return: The result of the function
+        """
+        deadline = self.get_deadline(timeout)
+
+        if self._budget:
+            self._budget.deposit()
+
+        retry = 0
+        while True:
+            try:
+                return func()
+            except Exception as ex: # pylint: disable=broad-except
+                if not self.is_transient(ex) or \
+                        retry + 1 >= self._max_attempts:
+                    raise
+                delay = self.backoff(retry)
+                if time.time() + delay >= deadline:
+                    raise
+                if self._budget and not self._budget.try_withdraw():
+                    logger.warning("Retry budget exhausted, not retrying: %s",
+                                   ex.__class__.__name__)
+                    raise
+                retry += 1
+                logger.warning(
+                    "Transient error (%s), retry %d of %d in %.3fs",
+                    ex.__class__.__name__, retry, self._max_attempts - 1,
+                    delay)
+                time.sleep(delay)
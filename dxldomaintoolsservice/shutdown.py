@@ -0,0 +1,207 @@
+from __future__ import absolute_import
+import base64
+import json
+import logging
+import os
+import threading
+import time
+
+from dxlclient.callbacks import RequestCallback
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+#: The version of the warm state file format
+WARM_STATE_VERSION = 1
+
+
+class InFlightTracker(object):
+    """
+    Counts the requests which are queued or being handled, so that shutdown
+    can wait for them to complete
+    """
+
+    def __init__(self):
+        self._in_flight = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+    @property
+    def in_flight(self):
+        """
+        The number of requests which are queued or being handled
+        """
+        return self._in_flight
+
+    @property
+    def closed(self):
+        """
+        Whether queued requests are dropped rather than handled (see
+        :meth:`close`)
+        """
+        return self._closed
+
+    def begin(self):
+        """
+        Counts a request as in flight (until :meth:`end` is called)
+        """
+        with self._condition:
+            self._in_flight += 1
+
+    def end(self):
+        """
+        Indicates that a request counted by :meth:`begin` has completed
+        """
+        with self._condition:
+            self._in_flight -= 1
+            if not self._in_flight:
+                self._condition.notify_all()
+
+    def close(self):
+        """
+        Indicates that requests which are still queued should be dropped
+        rather than handled, so that shutdown does not wait for them
+        """
+        self._closed = True
+
+    def wait_idle(self, timeout):
+        """
+        Waits until no requests are in flight
+
+        :param timeout: The maximum time (in seconds) to wait
+        :return: Whether all requests completed within the timeout
+        """
+        deadline = time.time() + timeout
+        with self._condition:
+            while self._in_flight:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+
+class QueuedRequestCallback(RequestCallback):
+    """
+    Request callback which invokes another request callback on a thread pool.
+
+    Requests are counted as in flight from the time they are queued, so that
+    shutdown also waits for the requests which are waiting for a thread.
+    """
+
+    def __init__(self, in_flight, callbacks_pool, callback):
+        """
+        Constructor parameters:
+
+        :param in_flight: The :class:`InFlightTracker`
+        :param callbacks_pool: The thread pool used to invoke the callback
+        :param callback: The request callback
+        """
+        super(QueuedRequestCallback, self).__init__()
+        self._in_flight = in_flight
+        self._callbacks_pool = callbacks_pool
+        self._callback = callback
+
+    def on_request(self, request):
+        """
+        Invoked when a request message is received.
+
+        :param request: The request message
+        """
+        self._in_flight.begin()
+        try:
+            self._callbacks_pool.add_task(self._handle_request, request)
+        except Exception:
+            self._in_flight.end()
+            raise
+
+    def _handle_request(self, request):
+        try:
+            if self._in_flight.closed:
+                logger.warning("Dropping request queued during shutdown: %s",
+                               request.destination_topic)
+            else:
+                self._callback.on_request(request)
+        finally:
+            self._in_flight.end()
+
+
+def save_warm_state(path, cache_entries, rate_limiter, client_limiters,
+                    budget=None, monitors=None):
+    """
+    Writes the state of the service to a file, so that it can be restored
+    when the service is next started (see :func:`load_warm_state`). The
+    state is written to a temporary file which then replaces the file (see
+    :func:`replace_file`).
+
+    :param path: The file
+    :param cache_entries: The cached responses (see
+        :meth:`dxldomaintoolsservice.cache.ResponseCache.get_entries`)
+    :param rate_limiter: The state of the DomainTools API rate limiter
+    :param client_limiters: The state of the rate limiter of each client
+    :param budget: The DomainTools API usage (if not persisted elsewhere)
+    :param monitors: The last result set of each monitor query
+    """
+    state = {
+        "version": WARM_STATE_VERSION,
+        "time": time.time(),
+        "cache": [[key, expires,
+                   base64.b64encode(compressed).decode("ascii")]
+                  for key, expires, compressed in cache_entries],
+        "rate_limiter": rate_limiter,
+        "client_limiters": client_limiters
+    }
+    if budget is not None:
+        state["budget"] = budget
+    if monitors:
+        state["monitors"] = monitors
+    temp_file = path + ".tmp"
+    with open(temp_file, "w") as state_stream:
+        json.dump(state, state_stream)
+    replace_file(temp_file, path)
+
+
+def replace_file(source, destination):
+    """
+    Renames a file, replacing the destination file if it exists. The
+    destination is replaced atomically, except on Python 2 on Windows (where
+    ``os.replace`` is not available and ``os.rename`` does not replace an
+    existing file), where the destination is removed first.
+
+    :param source: The file to rename
+    :param destination: The file to replace
+    """
+    replace = getattr(os, "replace", None)
+    if replace is not None:
+        replace(source, destination)
+        return
+    if os.name == "nt" and os.path.exists(destination):
+        os.remove(destination)
+    os.rename(source, destination)
+
+
+def load_warm_state(path):
+    """
+    Reads the state of the service written by :func:`save_warm_state`
+
+    :param path: The file
+    :return: ``dict`` containing the state (with the compressed payloads of
+        cached responses decoded), or ``None`` if the file does not exist or
+        can not be read
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as state_stream:
+            state = json.load(state_stream)
+        if state.get("version") != WARM_STATE_VERSION:
+            logger.warning("Ignoring warm state file with unsupported "
+                           "version: %s", path)
+            return None
+        state["cache"] = [(key, expires, base64.b64decode(compressed))
+                          for key, expires, compressed
+                          in state.get("cache", [])]
+    except (IOError, OSError, ValueError, TypeError):
+        logger.exception("Error reading warm state file: %s", path)
+        return None
+    return state
@@ -0,0 +1,185 @@
+from __future__ import absolute_import
+from collections import deque
+import logging
+import threading
+import time
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+#: The maximum length of parameter values recorded in the slow request log
+MAX_PARAM_LENGTH = 256
+
+#: The response was served from an in-memory snapshot
+CACHE_STATUS_SNAPSHOT = "snapshot"
+#: The response was served from the response cache
+CACHE_STATUS_HIT = "hit"
+#: The response was fetched from the response cache of another instance
+CACHE_STATUS_PEER = "peer"
+#: The response was not in the response cache
+CACHE_STATUS_MISS = "miss"
+#: The response cache is not used for the service
+CACHE_STATUS_BYPASS = "bypass"
+
+
+def normalize_params(params):
+    """
+    Returns the request parameters as recorded in the slow request log (the
+    ``format`` parameter removed, and long values truncated)
+
+    :param params: The request parameters
+    :return: The normalized parameters
+    """
+    normalized = {}
+    for name, value in params.items():
+        if name == "format":
+            continue
+        if not isinstance(value, (int, float, bool)) and value is not None:
+            value = str(value)
+            if len(value) > MAX_PARAM_LENGTH:
+                value = value[:MAX_PARAM_LENGTH] + "..."
+        normalized[name] = value
+    return normalized
+
+
+class RequestTrace(object):
+    """
+    The time spent in each stage of handling a request
+    """
+
+    def __init__(self):
+        self.start = time.time()
+        self.stages = {}
+        self.cache_status = CACHE_STATUS_BYPASS
+        self.attempts = 0
+        self._last_mark = self.start
+
+    def add(self, stage, seconds):
+        """
+        Adds time to a stage
+
+        :param stage: The name of the stage
+        :param seconds: The time (in seconds)
+        """
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def mark(self, stage):
+        """
+        Adds the time since the previous mark (or the start of the request)
+        to a stage
+
+        :param stage: The name of the stage
+        """
+        now = time.time()
+        self.add(stage, now - self._last_mark)
+        self._last_mark = now
+
+
+class SlowRequestLog(object):
+    """
+    Ring buffer of the most recent requests which took longer than the slow
+    request threshold of their service, with the time spent in each stage of
+    handling them
+    """
+
+    def __init__(self, threshold=0, service_thresholds=None, size=100):
+        """
+        Constructor parameters:
+
+        :param threshold: The time (in seconds) after which requests are
+            logged (``0`` disables the log)
+        :param service_thresholds: ``dict`` mapping service names to their
+            threshold, overriding ``threshold``
+        :param size: The maximum number of requests kept
+        """
+        self._threshold = threshold
+        self._service_thresholds = dict(service_thresholds or {})
+        self._entries = deque(maxlen=size)
+        self._logged = 0
+        self._lock = threading.Lock()
+
+    @property
+    def logged(self):
+        """
+        The number of requests logged
+        """
+        return self._logged
+
+    def reconfigure(self, threshold=0, service_thresholds=None, size=100):
+        """
+        Changes the thresholds and size of the log, keeping the most recent
+        logged requests
+
+        :param threshold: The time (in seconds) after which requests are
+            logged (``0`` disables the log)
+        :param service_thresholds: ``dict`` mapping service names to their
+            threshold, overriding ``threshold``
+        :param size: The maximum number of requests kept
+        """
+        with self._lock:
+            self._threshold = threshold
+            self._service_thresholds = dict(service_thresholds or {})
+            self._entries = deque(self._entries, maxlen=size)
+
+    def threshold(self, service):
+        """
+        Returns the slow request threshold of the specified service
+
+        :param service: The name of the service
+        :return: The threshold (in seconds), ``0`` if not enabled
+        """
+        return self._service_thresholds.get(service, self._threshold)
+
+    def add(self, service, topic, params, trace, request_size, response_size,
+            error=None):
+        """
+        Logs a request if it exceeded the threshold of its service
+
+        :param service: The name of the service
+        :param topic: The request topic
+        :param params: The request parameters
+        :param trace: The :class:`RequestTrace` of the request
+        :param request_size: The size (in bytes) of the request payload
+        :param response_size: The size (in bytes) of the response payload
+        :param error: The error message (if the request failed)
+        """
+        elapsed = time.time() - trace.start
+        threshold = self.threshold(service)
+        if not threshold or elapsed < threshold:
+            return
+        entry = {
+            "time": trace.start,
+            "service": service,
+            "topic": topic,
+            "params": normalize_params(params or {}),
+            "elapsed": round(elapsed, 6),
+            "stages": dict((stage, round(seconds, 6))
+                           for stage, seconds in trace.stages.items()),
+            "cache_status": trace.cache_status,
+            "retries": max(0, trace.attempts - 1),
+            "request_size": request_size,
+            "response_size": response_size,
+            "error": error
+        }
+        with self._lock:
+            self._entries.append(entry)
+            self._logged += 1
+        logger.info("Slow request on topic: '%s' (%.3fs, stages: %s)",
+                    topic, elapsed, entry["stages"])
+
+    def entries(self, service=None, limit=None):
+        """
+        Returns the logged requests, most recent first
+
+        :param service: The service to return requests for (all services if
+            not specified)
+        :param limit: The maximum number of requests returned
+        :return: The list of logged requests
+        """
+        with self._lock:
+            entries = list(self._entries)
+        entries.reverse()
+        if service:
+            entries = [entry for entry in entries
+                       if entry["service"] == service]
+        return entries[:limit] if limit else entries
@@ -0,0 +1,116 @@
+from __future__ import absolute_import
+import logging
+import threading
+import time
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+#: The request "other field" used by callers to force the snapshot of a
+#: service to be refreshed before the response is sent
+REFRESH_OTHER_FIELD = "refresh"
+
+
+class SnapshotRefresher(object):
+    """
+    Keeps in-memory snapshots of the responses of parameterless services
+    (for example, ``account_information``), refreshing them on a background
+    thread so that requests are answered without calling the DomainTools API.
+    """
+
+    def __init__(self, services=None, interval=60):
+        """
+        Constructor parameters:
+
+        :param services: The names of the services to keep snapshots of
+        :param interval: The time (in seconds) between refreshes
+        """
+        self._services = frozenset(services or ())
+        self._interval = interval
+        self._fetchers = {}
+        self._snapshots = {}
+        self._refresh_locks = dict((service, threading.Lock())
+                                   for service in self._services)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def is_enabled(self, service):
+        """
+        Returns whether snapshots are kept for the specified service
+
+        :param service: The name of the service
+        :return: Whether snapshots are kept for the service
+        """
+        return service in self._services
+
+    def start(self, fetchers):
+        """
+        Starts refreshing the snapshots in the background
+
+        :param fetchers: ``dict`` mapping service names to a function (taking
+            no arguments) which returns the current JSON payload (``bytes``)
+            of the service
+        """
+        self._fetchers = dict((service, fetcher) for service, fetcher
+                              in fetchers.items() if service in self._services)
+        if not self._fetchers or self._thread:
+            return
+        self._thread = threading.Thread(target=self._run,
+                                        name="SnapshotRefresher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops refreshing the snapshots
+        """
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    @property
+    def max_age(self):
+        """
+        The age (in seconds) of the oldest snapshot
+        """
+        snapshots = list(self._snapshots.values())
+        if not snapshots:
+            return 0.0
+        return time.time() - min(refreshed for _, refreshed in snapshots)
+
+    def get(self, service):
+        """
+        Returns the current snapshot for the specified service
+
+        :param service: The name of the service
+        :return: A tuple containing the JSON payload (``bytes``) and the time
+            it was refreshed, or ``None`` if there is no snapshot
+        """
+        return self._snapshots.get(service)
+
+    def refresh(self, service):
+        """
+        Refreshes the snapshot for the specified service. Concurrent refreshes
+        of the same service are collapsed into one DomainTools API call.
+
+        :param service: The name of the service
+        """
+        started = time.time()
+        with self._refresh_locks[service]:
+            snapshot = self._snapshots.get(service)
+            if snapshot and snapshot[1] >= started:
+                # Refreshed by another caller while waiting
+                return
+            payload = self._fetchers[service]()
+            self._snapshots[service] = (payload, time.time())
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            for service in self._fetchers:
+                try:
+                    self.refresh(service)
+                except Exception: # pylint: disable=broad-except
+                    logger.exception("Error refreshing snapshot for '%s'",
+                                     service)
+            self._stop_event.wait(self._interval)
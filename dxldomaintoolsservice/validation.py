@@ -0,0 +1,174 @@
+from __future__ import absolute_import
+import os
+
+import yaml
+
+from dxldomaintoolsservice._compat import string_types
+
+#: The location of the service schema (in the Python library)
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           "_schema", "domaintools-service.yaml")
+
+#: The parameter specifying the output format. It is accepted by every service
+#: and is not counted towards the minimum number of parameters.
+FORMAT_PARAM = "format"
+
+#: Python types corresponding to the JSON schema types used in the schema
+_JSON_TYPES = {
+    "string": string_types,
+    "integer": (int,),
+    "number": (int, float),
+    "boolean": (bool,),
+    "array": (list,),
+    "object": (dict,)
+}
+
+
+class RequestValidator(object):
+    """
+    Validates the parameters of requests to a service before the DomainTools
+    API is invoked. Validators are compiled from the service schema (see
+    :func:`load_validators`) so that the checks performed for each request are
+    simple set and type lookups.
+    """
+
+    def __init__(self, service, required=(), types=None,
+                 additional_params=True, min_params=0, one_of=()):
+        """
+        Constructor parameters:
+
+        :param service: The name of the service
+        :param required: The names of the required parameters
+        :param types: ``dict`` mapping parameter names to the tuple of Python
+            types permitted for the parameter
+        :param additional_params: Whether parameters which are not listed in
+            ``types`` are permitted
+        :param min_params: The minimum number of parameters (excluding
+            ``format``) which must be specified
+        :param one_of: Alternative sets of required parameters, exactly one
+            of which must be specified (for example, ``(("query",),
+            ("ip",))`` for "query or ip, but not both")
+        """
+        self._service = service
+        self._required = tuple(required)
+        self._types = tuple((types or {}).items())
+        self._allowed = None if additional_params \
+            else frozenset(types or ()) | frozenset(required)
+        self._min_params = min_params
+        self._one_of = tuple(tuple(names) for names in one_of)
+
+    def validate(self, params):
+        """
+        Validates the specified request parameters, raising an exception if
+        they are invalid
+
+        :param params: The request parameters (``dict``)
+        """
+        if not isinstance(params, dict):
+            raise Exception("Request payload must be a JSON object")
+
+        for name in self._required:
+            if name not in params:
+                raise Exception("Required parameter not found: '{}'".format(
+                    name))
+
+        if self._allowed is not None:
+            unsupported = sorted(name for name in params
+                                 if name not in self._allowed)
+            if unsupported:
+                raise Exception(
+                    "Unsupported parameter(s) for '{}': {}".format(
+                        self._service,
+                        ", ".join("'{}'".format(name)
+                                  for name in unsupported)))
+
+        for name, types in self._types:
+            if name in params and (not isinstance(params[name], types) or
+                                   isinstance(params[name], bool) and
+                                   bool not in types):
+                raise Exception("Invalid type for parameter '{}'".format(
+                    name))
+
+        if self._one_of:
+            matched = [names for names in self._one_of
+                       if all(name in params for name in names)]
+            if len(matched) != 1:
+                raise Exception(
+                    "Exactly one of {} must be specified for '{}'".format(
+                        ", ".join("'{}'".format("', '".join(names))
+                                  for names in self._one_of),
+                        self._service))
+
+        if self._min_params:
+            count = len(params) - (1 if FORMAT_PARAM in params else 0)
+            if count < self._min_params:
+                raise Exception(
+                    "At least {} parameter(s) other than '{}' must be "
+                    "specified for '{}'".format(
+                        self._min_params, FORMAT_PARAM, self._service))
+
+
+def _resolve(schema, node):
+    """
+    Returns the schema node, following a ``$ref`` to a definition if present
+    """
+    ref = node.get("$ref")
+    if ref is None:
+        return node
+    node = schema
+    for step in ref.lstrip("#/").split("/"):
+        node = node[step.replace("~1", "/").replace("~0", "~")]
+    return node
+
+
+def _compile(schema, service, request):
+    """
+    Compiles the validator for a single request definition in the schema
+    """
+    payload = request.get("payload", {})
+    types = {}
+    for part in [payload] + payload.get("allOf", []):
+        properties = _resolve(schema, part).get("properties", {})
+        for name, prop in properties.items():
+            json_type = prop.get("type")
+            types[name] = _JSON_TYPES.get(json_type, (object,))
+    return RequestValidator(
+        service,
+        required=request.get("required") or (),
+        types=types,
+        additional_params=payload.get("additionalProperties", True),
+        min_params=payload.get("minProperties", 0),
+        one_of=[_resolve(schema, part).get("required", ())
+                for part in payload.get("oneOf", [])])
+
+
+def load_validators(topic_prefix, schema_file=SCHEMA_FILE):
+    """
+    Compiles a validator for each request defined in the service schema.
+
+    The ``payload`` of each request is interpreted as follows: ``properties``
+    (including those of any ``allOf`` entries and referenced definitions)
+    specify the type of each parameter, ``additionalProperties: false``
+    restricts the request to those parameters (otherwise, parameters which
+    are not listed are passed through to the DomainTools API),
+    ``minProperties`` is the minimum number of parameters (other than
+    ``format``) which must be specified, and the ``required`` parameters of
+    the ``oneOf`` entries are alternatives, exactly one of which must be
+    specified. The ``required`` list of the request specifies the required
+    parameters.
+
+    :param topic_prefix: The prefix of the request topics (the service type)
+    :param schema_file: The location of the service schema
+    :return: ``dict`` mapping service names to
+        :class:`RequestValidator` instances
+    """
+    with open(schema_file) as schema_stream:
+        schema = yaml.safe_load(schema_stream)
+
+    validators = {}
+    prefix = topic_prefix.rstrip("/") + "/"
+    for topic, request in schema.get("requests", {}).items():
+        if topic.startswith(prefix):
+            service = topic[len(prefix):]
+            validators[service] = _compile(schema, service, request)
+    return validators
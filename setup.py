@@ -1,11 +1,13 @@
 # pylint: disable=no-member, no-name-in-module, import-error
 
 from __future__ import absolute_import
+import filecmp
 import glob
 import os
 import distutils.command.sdist
 import distutils.log
 import subprocess
+import sys
 from setuptools import Command, setup
 import setuptools.command.sdist
 
@@ -39,6 +41,46 @@ class LintCommand(Command):
                               ["--rcfile", ".pylintrc.samples"])
 
 
+class CheckCopiesCommand(Command):
+    """
+    Custom setuptools command for checking that the files shipped in the
+    Python library match their copies in the repository (which clean.py
+    refreshes from the library)
+    """
+    description = 'check that copied configuration and schema files match'
+    user_options = []
+    COPIES = [
+        (os.path.join("dxldomaintoolsservice", "_config", "app"), "config"),
+        (os.path.join("dxldomaintoolsservice", "_config", "sample"),
+         "sample"),
+        (os.path.join("dxldomaintoolsservice", "_schema"),
+         os.path.join("schema", "v0.1"))
+    ]
+    def initialize_options(self):
+        pass
+    def finalize_options(self):
+        pass
+    def run(self):
+        self.announce("Checking copied configuration and schema files",
+                      level=distutils.log.INFO)
+        mismatched = []
+        for src_dir, copy_dir in self.COPIES:
+            for name in os.listdir(os.path.join(CWD, src_dir)):
+                src_file = os.path.join(CWD, src_dir, name)
+                if os.path.isdir(src_file) or \
+                        name.lower().endswith((".py", ".pyc")):
+                    continue
+                copy_file = os.path.join(CWD, copy_dir, name)
+                if not os.path.exists(copy_file) or \
+                        not filecmp.cmp(src_file, copy_file, shallow=False):
+                    mismatched.append(copy_file)
+        if mismatched:
+            raise Exception(
+                "Files differ from their source in dxldomaintoolsservice "
+                "(run clean.py to copy them): {}".format(
+                    ", ".join(mismatched)))
+
+
 class CiCommand(Command):
     """
     Custom setuptools command for running steps that are performed during
@@ -51,8 +93,30 @@ class CiCommand(Command):
     def finalize_options(self):
         pass
     def run(self):
+        self.run_command("check_copies")
         self.run_command("lint")
 
+class BenchmarkCommand(Command):
+    """
+    Custom setuptools command for running the service benchmark against a
+    local stand-in for the DomainTools API
+    """
+    description = 'run the service benchmark (no network access required)'
+    user_options = [
+        ("benchmark-args=", None, "arguments for the benchmark script")
+    ]
+    benchmark_args = ""
+    def initialize_options(self):
+        self.benchmark_args = ""
+    def finalize_options(self):
+        pass
+    def run(self):
+        self.announce("Running service benchmark", level=distutils.log.INFO)
+        subprocess.check_call(
+            [sys.executable, os.path.join("benchmark",
+                                          "service_benchmark.py")] +
+            self.benchmark_args.split())
+
 TEST_REQUIREMENTS = ["astroid<2.3.0", "pylint<=2.3.1"]
 
 DEV_REQUIREMENTS = TEST_REQUIREMENTS + ["sphinx"]
@@ -68,13 +132,16 @@ setup(
     install_requires=[
         "domaintools_api==0.3.3",
         "dxlbootstrap>=0.2.0",
-        "dxlclient>=4.1.0.184"
+        "dxlclient>=4.1.0.184",
+        "PyYAML"
     ],
 
     tests_require=TEST_REQUIREMENTS,
 
     extras_require={
         "dev": DEV_REQUIREMENTS,
+        "fastjson": ["orjson; python_version >= '3.6'",
+                     "ujson; python_version < '3.6'"],
         "test": TEST_REQUIREMENTS
     },
 
@@ -92,11 +159,13 @@ setup(
         "dxldomaintoolsservice",
         "dxldomaintoolsservice._config",
         "dxldomaintoolsservice._config.sample",
-        "dxldomaintoolsservice._config.app"],
+        "dxldomaintoolsservice._config.app",
+        "dxldomaintoolsservice._schema"],
 
     package_data={
         "dxldomaintoolsservice._config.sample" : ['*'],
-        "dxldomaintoolsservice._config.app" : ['*']},
+        "dxldomaintoolsservice._config.app" : ['*'],
+        "dxldomaintoolsservice._schema" : ['*']},
 
     # Details
     url="http://www.mcafee.com",
@@ -122,6 +191,8 @@ setup(
     ],
 
     cmdclass={
+        "benchmark": BenchmarkCommand,
+        "check_copies": CheckCopiesCommand,
         "ci": CiCommand,
         "lint": LintCommand
     }